@@ -2,8 +2,10 @@
 Admin settings for carts app
 """
 from django.contrib import admin
+from django.utils import timezone
 
-from .models import Cart, CartItem
+from .constants import DELIVERED, FAILED, PROCESSING, QUEUED, SHIPPED
+from .models import Cart, CartItem, CartStatusChange, CheckoutJob
 
 
 class CartAdmin(admin.ModelAdmin):
@@ -17,9 +19,10 @@ class CartAdmin(admin.ModelAdmin):
         "created_on",
         "updated_on",
         "created_by",
+        "status",
         "total_bill",
     ]
-    list_filter = ["id", "user"]
+    list_filter = ["status", "user"]
     search_fields = ["id", "user"]
     ordering = ["id"]
     readonly_fields = [
@@ -27,10 +30,62 @@ class CartAdmin(admin.ModelAdmin):
         "updated_on",
         "created_by",
         "all_cart_items",
+        "status",
         "total_bill",
     ]
+    actions = ["empty_carts", "mark_shipped", "mark_delivered"]
     # pylint: disable=no-self-use
 
+    def move_orders(self, request, queryset, status):
+        """
+        Moves the selected orders that are allowed to go to status
+        Args:
+            request(HttpRequest): Value containing request data
+            queryset(QuerySet): Value containing selected carts
+            status(str): Value containing status to move the orders to
+        Returns:
+            None
+        """
+        moved = queryset.transition(status, request.user)
+        self.message_user(request, f"{moved} order(s) moved to {status}.")
+
+    @admin.action(description="Mark selected orders as shipped")
+    def mark_shipped(self, request, queryset):
+        """
+        Moves the selected submitted orders to shipped
+        Args:
+            request(HttpRequest): Value containing request data
+            queryset(QuerySet): Value containing selected carts
+        Returns:
+            None
+        """
+        self.move_orders(request, queryset, SHIPPED)
+
+    @admin.action(description="Mark selected orders as delivered")
+    def mark_delivered(self, request, queryset):
+        """
+        Moves the selected submitted or shipped orders to delivered
+        Args:
+            request(HttpRequest): Value containing request data
+            queryset(QuerySet): Value containing selected carts
+        Returns:
+            None
+        """
+        self.move_orders(request, queryset, DELIVERED)
+
+    @admin.action(description="Empty selected open carts")
+    def empty_carts(self, request, queryset):
+        """
+        Removes all items of the selected open carts and restores their stock
+        Args:
+            request(HttpRequest): Value containing request data
+            queryset(QuerySet): Value containing selected carts
+        Returns:
+            None
+        """
+        emptied = queryset.empty()
+        self.message_user(request, f"{emptied} open cart(s) emptied.")
+
     def all_cart_items(self, obj):
         """
         Returns all cart_items associated with cart obj
@@ -39,7 +94,7 @@ class CartAdmin(admin.ModelAdmin):
         Returns:
             (list): List containing product names of cart_items
         """
-        return [item.product.name for item in obj.cart_items.all()]
+        return [item.get_name() for item in obj.cart_items.select_related("product")]
 
     def save_model(self, request, obj, form, change):
         obj.save(created_by=request.user)
@@ -54,8 +109,76 @@ class CartItemAdmin(admin.ModelAdmin):
     list_filter = ["id", "product", "cart"]
     search_fields = ["id", "product", "cart"]
     ordering = ["id"]
-    readonly_fields = ["created_on", "updated_on", "created_by"]
+    readonly_fields = [
+        "created_on",
+        "updated_on",
+        "created_by",
+        "product_name",
+        "unit_price",
+        "product_image",
+    ]
+
+
+class CheckoutJobAdmin(admin.ModelAdmin):
+    """
+    Admin representation of CheckoutJob model
+    """
+
+    list_display = ["id", "cart", "status", "attempts", "run_after", "finished_on"]
+    list_filter = ["status"]
+    ordering = ["-id"]
+    readonly_fields = ["created_on", "finished_on", "locked_until", "last_error"]
+    actions = ["retry_jobs"]
+    # pylint: disable=no-self-use
+
+    @admin.action(description="Retry selected failed jobs")
+    def retry_jobs(self, request, queryset):
+        """
+        Puts failed jobs back in the queue with a fresh set of attempts. Jobs
+        whose cart was reopened when they failed are left alone.
+        Args:
+            request(HttpRequest): Value containing request data
+            queryset(QuerySet): Value containing selected jobs
+        Returns:
+            None
+        """
+        retried = queryset.filter(status=FAILED, cart__status=PROCESSING).update(
+            status=QUEUED,
+            attempts=0,
+            run_after=timezone.now(),
+            finished_on=None,
+        )
+        self.message_user(request, f"{retried} job(s) queued again.")
+
+
+class CartStatusChangeAdmin(admin.ModelAdmin):
+    """
+    Read only admin representation of CartStatusChange model
+    """
+
+    list_display = [
+        "id",
+        "cart",
+        "from_status",
+        "to_status",
+        "changed_by",
+        "changed_on",
+    ]
+    list_filter = ["to_status"]
+    ordering = ["-id"]
+    # pylint: disable=no-self-use, unused-argument
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(Cart, CartAdmin)
 admin.site.register(CartItem, CartItemAdmin)
+admin.site.register(CheckoutJob, CheckoutJobAdmin)
+admin.site.register(CartStatusChange, CartStatusChangeAdmin)
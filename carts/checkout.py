@@ -0,0 +1,295 @@
+"""
+Asynchronous checkout
+
+Submitting a cart only moves it to Processing, snapshots its lines and queues
+a CheckoutJob, a fixed number of statements whatever the size of the cart.
+The process_checkouts worker then claims due jobs, revalidates the lines of
+each cart against the catalog, reprices them, finalizes the bill and submits
+the cart. A job that fails is retried with an exponential delay until it runs
+out of attempts. Claims are leases, so a job whose worker died is taken over
+once its lease expires, and finishing a job only touches a cart that is still
+Processing, so running a job twice has no further effect. A job that fails
+for good reopens its cart, so the reserved units go back to the buyer's open
+cart instead of staying locked in a cart nobody will check out.
+"""
+from datetime import timedelta
+from uuid import uuid4
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from products.stock import release_items
+
+from .constants import (
+    CHECKOUT_BATCH_SIZE,
+    CHECKOUT_LEASE_SECONDS,
+    CHECKOUT_MAX_ATTEMPTS,
+    CHECKOUT_RETRY_DELAY,
+    DONE,
+    FAILED,
+    OPEN,
+    PROCESSING,
+    QUEUED,
+    RUNNING,
+)
+from .models import Cart, CartItem, CartStatusChange, CheckoutJob, line_snapshot
+from .utils import item_totals
+
+
+class CheckoutError(Exception):
+    """
+    Raised when a cart cannot be checked out and retrying will not help
+    """
+
+
+def enqueue_checkout(cart):
+    """
+    Moves an open cart to Processing and queues its checkout
+    Args:
+        cart(Cart): Value containing cart to check out
+    Returns:
+        (CheckoutJob): Value containing queued job, None if the cart was not open
+    """
+    # pylint: disable=no-member
+    with transaction.atomic():
+        now = timezone.now()
+        if not Cart.objects.filter(pk=cart.pk, status=OPEN).update(
+            status=PROCESSING, updated_on=now
+        ):
+            return None
+        CartStatusChange.objects.create(
+            cart=cart, from_status=OPEN, to_status=PROCESSING, changed_on=now
+        )
+        cart.cart_items.update(updated_on=now, **line_snapshot())
+        job = CheckoutJob.objects.create(cart=cart)
+    cart.set_saved_values(status=PROCESSING, updated_on=now)
+    return job
+
+
+def due_jobs(now):
+    """
+    Returns a filter matching queued jobs that are due and running jobs
+    whose lease expired with attempts left
+    Args:
+        now(datetime): Value containing current time
+    Returns:
+        (Q): Value containing filter of claimable jobs
+    """
+    return Q(status=QUEUED, run_after__lte=now) | Q(
+        status=RUNNING, locked_until__lt=now, attempts__lt=CHECKOUT_MAX_ATTEMPTS
+    )
+
+
+def claim_jobs(limit=CHECKOUT_BATCH_SIZE):
+    """
+    Leases up to limit due jobs to the calling worker. Jobs are claimed with
+    a conditional UPDATE, so two workers never get the same job. Jobs whose
+    lease expired on their last attempt, because their worker kept dying,
+    are marked as failed instead of being claimed again.
+    Args:
+        limit(int): Value containing maximum number of jobs to claim
+    Returns:
+        (tuple): Value containing claim token and list of job ids
+    """
+    now = timezone.now()
+    token = uuid4().hex
+    fail_jobs(
+        CheckoutJob.objects.filter(
+            status=RUNNING, locked_until__lt=now, attempts__gte=CHECKOUT_MAX_ATTEMPTS
+        ),
+        _("The worker stopped during the last attempt"),
+    )
+    ids = list(
+        CheckoutJob.objects.filter(due_jobs(now))
+        .order_by("run_after", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+    if not ids:
+        return token, []
+    CheckoutJob.objects.filter(due_jobs(now), id__in=ids).update(
+        status=RUNNING,
+        locked_by=token,
+        locked_until=now + timedelta(seconds=CHECKOUT_LEASE_SECONDS),
+        attempts=F("attempts") + 1,
+    )
+    return token, list(
+        CheckoutJob.objects.filter(locked_by=token, status=RUNNING)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def finalize_cart(cart):
+    """
+    Revalidates and reprices the lines of a Processing cart, recomputes its
+    bill and submits it. Stock was reserved when the lines were added, so a
+    line is only invalid when its product was deleted since.
+    Args:
+        cart(Cart): Value containing cart to finalize
+    Returns:
+        (bool): True if the cart was submitted, False if it is not Processing
+            anymore
+    Raises:
+        CheckoutError: if none of the products of the cart exist anymore
+    """
+    # pylint: disable=no-member
+    # a job run again after its lease expired must not reprice a placed order
+    if not (
+        Cart.objects.select_for_update().filter(pk=cart.pk, status=PROCESSING).exists()
+    ):
+        return False
+    cart.cart_items.filter(product__isnull=True).delete()
+    items = list(cart.cart_items.select_related("product"))
+    if not items:
+        raise CheckoutError(_("None of the products of the cart exist anymore"))
+    now = timezone.now()
+    changed = []
+    for item in items:
+        old_total = item.item_total
+        item.update_total()
+        if item.item_total != old_total:
+            item.updated_on = now
+            changed.append(item)
+    CartItem.objects.bulk_update(changed, ["item_total", "updated_on"])
+    Cart.objects.filter(pk=cart.pk).update(total_bill=item_totals(), updated_on=now)
+    return cart.submit(from_status=PROCESSING)
+
+
+def reopen_cart(cart):
+    """
+    Moves a Processing cart whose checkout failed for good back to Open, so
+    its lines keep their reserved units until the buyer checks out again or
+    the cart is swept as abandoned. If the buyer opened another cart
+    meanwhile, the lines are moved into it instead, and lines of products it
+    already holds put their units back in stock.
+    Args:
+        cart(Cart): Value containing cart whose checkout failed
+    Returns:
+        (bool): True if the lines are back in an open cart, False if the
+            cart was not Processing
+    """
+    # pylint: disable=no-member
+    with transaction.atomic():
+        if not (
+            Cart.objects.select_for_update()
+            .filter(pk=cart.pk, status=PROCESSING)
+            .exists()
+        ):
+            return False
+        now = timezone.now()
+        items = cart.cart_items.all()
+        items.filter(product__isnull=True).delete()
+        open_cart = (
+            Cart.objects.select_for_update()
+            .filter(user_id=cart.user_id, status=OPEN)
+            .first()
+        )
+        if open_cart is None:
+            Cart.objects.filter(pk=cart.pk).update(
+                status=OPEN, total_bill=item_totals(), updated_on=now
+            )
+            CartStatusChange.objects.create(
+                cart=cart, from_status=PROCESSING, to_status=OPEN, changed_on=now
+            )
+            return True
+        held = items.filter(product__in=open_cart.cart_items.values("product"))
+        release_items(held)
+        held.delete()
+        items.update(cart=open_cart, updated_on=now)
+        Cart.objects.filter(pk__in=[cart.pk, open_cart.pk]).update(
+            total_bill=item_totals(), updated_on=now
+        )
+    return True
+
+
+def fail_jobs(jobs, error):
+    """
+    Marks jobs as failed and reopens their carts
+    Args:
+        jobs(QuerySet): Value containing jobs that ran out of attempts
+        error(str): Value containing reason of the failure
+    Returns:
+        (int): Value containing number of jobs failed
+    """
+    with transaction.atomic():
+        failed = list(jobs.select_for_update().values_list("id", "cart"))
+        if not failed:
+            return 0
+        CheckoutJob.objects.filter(id__in=[job[0] for job in failed]).update(
+            status=FAILED,
+            finished_on=timezone.now(),
+            locked_by="",
+            locked_until=None,
+            last_error=error,
+        )
+        for cart in Cart.objects.filter(pk__in=[job[1] for job in failed]):
+            reopen_cart(cart)
+    return len(failed)
+
+
+def process_job(job_id, token):
+    """
+    Runs a claimed job. A failure puts the job back in the queue with an
+    exponential delay, or marks it as failed and reopens its cart after the
+    last attempt.
+    Args:
+        job_id(int): Value containing primary key of the job
+        token(str): Value containing claim token of the worker
+    Returns:
+        (str): Value containing new status of the job, None if it was not ours
+    """
+    # pylint: disable=broad-except
+    job = (
+        CheckoutJob.objects.select_related("cart")
+        .filter(pk=job_id, locked_by=token, status=RUNNING)
+        .first()
+    )
+    if job is None:
+        return None
+    mine = CheckoutJob.objects.filter(pk=job_id, locked_by=token)
+    try:
+        with transaction.atomic():
+            finalize_cart(job.cart)
+            mine.update(status=DONE, finished_on=timezone.now(), last_error="")
+        return DONE
+    except Exception as error:
+        now = timezone.now()
+        if isinstance(error, CheckoutError) or job.attempts >= CHECKOUT_MAX_ATTEMPTS:
+            fail_jobs(mine, str(error))
+            return FAILED
+        delay = CHECKOUT_RETRY_DELAY * 2 ** (job.attempts - 1)
+        mine.update(
+            status=QUEUED,
+            run_after=now + timedelta(seconds=delay),
+            locked_by="",
+            locked_until=None,
+            last_error=str(error),
+        )
+        return QUEUED
+
+
+def queue_metrics():
+    """
+    Returns back-pressure figures of the checkout queue with one query
+    Returns:
+        (dict): Value containing jobs per status, due jobs and the age in
+            seconds of the oldest unfinished job
+    """
+    now = timezone.now()
+    unfinished = Q(status__in=[QUEUED, RUNNING])
+    # finished jobs are left out so the query reads only the open part of
+    # checkoutjob_due_idx however long the history grows
+    metrics = CheckoutJob.objects.filter(
+        status__in=[QUEUED, RUNNING, FAILED]
+    ).aggregate(
+        queued=Count("id", filter=Q(status=QUEUED)),
+        running=Count("id", filter=Q(status=RUNNING)),
+        failed=Count("id", filter=Q(status=FAILED)),
+        due=Count("id", filter=due_jobs(now)),
+        oldest=Min("created_on", filter=unfinished),
+    )
+    oldest = metrics.pop("oldest")
+    metrics["oldest_age"] = (now - oldest).total_seconds() if oldest else 0
+    return metrics
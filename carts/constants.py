@@ -2,6 +2,76 @@
 Contains values that dont change during runtime
 """
 OPEN = "Open"
+PROCESSING = "Processing"
 SUBMITTED = "Submitted"
+SHIPPED = "Shipped"
 DELIVERED = "Delivered"
-CART_STATUS = (("Open", OPEN), ("Submitted", SUBMITTED), ("Delivered", DELIVERED))
+CART_STATUS = (
+    ("Open", OPEN),
+    ("Processing", PROCESSING),
+    ("Submitted", SUBMITTED),
+    ("Shipped", SHIPPED),
+    ("Delivered", DELIVERED),
+)
+# status -> statuses a sales manager can move an order to from it
+ORDER_TRANSITIONS = {SUBMITTED: (SHIPPED, DELIVERED), SHIPPED: (DELIVERED,)}
+# Number of orders moved per transaction by a bulk transition
+STATUS_CHUNK_SIZE = 1000
+# Number of orders a single transition request can name
+STATUS_MAX_CARTS = 10000
+# Statuses of carts whose items are not counted as sales yet
+UNFINISHED_STATUSES = (OPEN, PROCESSING)
+
+# Hours an open cart may stay untouched before its stock is released
+ABANDONED_CART_HOURS = 72
+# Number of abandoned carts emptied per transaction by the sweeper
+SWEEP_BATCH_SIZE = 500
+
+# Number of carts checked per query when reconciling bills
+RECONCILE_CHUNK_SIZE = 2000
+
+# Number of orders shown per page of the order history
+ORDERS_PAGE_SIZE = 10
+
+# Session key of the cart of a visitor who is not logged in
+SESSION_CART_KEY = "cart"
+# Number of different products a session cart can hold
+SESSION_CART_MAX_PRODUCTS = 50
+
+QUEUED = "Queued"
+RUNNING = "Running"
+DONE = "Done"
+FAILED = "Failed"
+JOB_STATUS = (
+    ("Queued", QUEUED),
+    ("Running", RUNNING),
+    ("Done", DONE),
+    ("Failed", FAILED),
+)
+# Attempts made at a checkout job before it is marked as failed
+CHECKOUT_MAX_ATTEMPTS = 5
+# Seconds before the first retry of a job, doubled after every attempt
+CHECKOUT_RETRY_DELAY = 30
+# Seconds a worker owns a claimed job before another worker may take it over
+CHECKOUT_LEASE_SECONDS = 300
+# Number of jobs claimed by a worker at once
+CHECKOUT_BATCH_SIZE = 50
+# Seconds a worker waits before polling an empty queue again
+CHECKOUT_POLL_INTERVAL = 2
+# Number of carts aggregated at once when rebuilding the sales rollups
+ROLLUP_CHUNK_SIZE = 2000
+# Number of days a sales report can cover
+REPORT_MAX_DAYS = 366
+# Number of best selling products listed in a sales report
+REPORT_TOP_PRODUCTS = 20
+
+# Request header carrying the idempotency key of a cart change
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Longest idempotency key accepted
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Seconds a stored response is replayed for the same key
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Number of expired keys deleted per statement when purging
+IDEMPOTENCY_PURGE_BATCH_SIZE = 1000
+# Every this many stored keys, one batch of expired keys is purged
+IDEMPOTENCY_PURGE_EVERY = 100
@@ -0,0 +1,176 @@
+"""
+Idempotent cart changes
+
+A client that sends an Idempotency-Key header with a cart change can retry
+it safely: the key is stored with the response in the same transaction as
+the change, so a retry with the same key replays the stored response instead
+of running the change again. A concurrent retry waits on the unique
+constraint of the key until the first request commits. Keys expire after
+IDEMPOTENCY_KEY_TTL seconds and are deleted in batches, by the
+purge_idempotency_keys command and after every IDEMPOTENCY_PURGE_EVERY stored
+keys, so the table only ever holds about a day of keys.
+"""
+import json
+from datetime import timedelta
+from functools import wraps
+from hashlib import sha256
+
+from django.db import IntegrityError, transaction
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.response import Response
+
+from .constants import (
+    IDEMPOTENCY_HEADER,
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    IDEMPOTENCY_KEY_TTL,
+    IDEMPOTENCY_PURGE_BATCH_SIZE,
+    IDEMPOTENCY_PURGE_EVERY,
+)
+from .models import IdempotencyKey
+
+
+def request_fingerprint(request):
+    """
+    Returns a digest of what a request asks for, so a key sent again with a
+    different request is told apart from a retry. The parsed data is hashed
+    rather than the body, so a form retried with a new multipart boundary
+    has the same fingerprint.
+    Args:
+        request(Request): Value containing request data
+    Returns:
+        (str): Value containing hex digest of method, path and data
+    """
+    data = request.data
+    if isinstance(data, QueryDict):
+        data = dict(data.lists())
+    digest = sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(json.dumps(data, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def claim_key(user, key, fingerprint):
+    """
+    Stores a new key, or takes over an expired one, for the calling request
+    Args:
+        user(User): Value containing user sending the key
+        key(str): Value containing idempotency key
+        fingerprint(str): Value containing fingerprint of the request
+    Returns:
+        (tuple): Value containing the claimed key and the unexpired key
+            already stored under it, exactly one of them being None
+    """
+    now = timezone.now()
+    expires_on = now + timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+    try:
+        with transaction.atomic():
+            return (
+                IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, expires_on=expires_on
+                ),
+                None,
+            )
+    except IntegrityError:
+        pass
+    stored = IdempotencyKey.objects.select_for_update().get(user=user, key=key)
+    if stored.expires_on > now:
+        return None, stored
+    stored.fingerprint = fingerprint
+    stored.response = None
+    stored.created_on = now
+    stored.expires_on = expires_on
+    stored.save()
+    return stored, None
+
+
+def replay(stored, fingerprint):
+    """
+    Returns the stored response of a key
+    Args:
+        stored(IdempotencyKey): Value containing key sent again
+        fingerprint(str): Value containing fingerprint of the new request
+    Returns:
+        (Response): Value containing stored response or the reason it
+            cannot be replayed
+    """
+    if stored.fingerprint != fingerprint:
+        return Response(
+            {
+                "message": _("This idempotency key was used for another request"),
+                "status_code": status.HTTP_422_UNPROCESSABLE_ENTITY,
+            }
+        )
+    if stored.response is None:
+        return Response(
+            {
+                "message": _("A request with this idempotency key is in progress"),
+                "status_code": status.HTTP_409_CONFLICT,
+            }
+        )
+    return Response(stored.response, headers={"Idempotent-Replayed": "true"})
+
+
+def idempotent(view_func):
+    """
+    Makes a view replay its stored response when a request is sent again with
+    the same Idempotency-Key header. Requests without the header run as usual.
+    Args:
+        view_func(callable): Value containing view changing the cart
+    Returns:
+        (callable): Value containing wrapped view
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view_func(request, *args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {
+                    "message": _("Idempotency key must have 1 to %d characters")
+                    % IDEMPOTENCY_KEY_MAX_LENGTH,
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        fingerprint = request_fingerprint(request)
+        with transaction.atomic():
+            claimed, stored = claim_key(request.user, key, fingerprint)
+            if claimed is None:
+                return replay(stored, fingerprint)
+            response = view_func(request, *args, **kwargs)
+            IdempotencyKey.objects.filter(pk=claimed.pk).update(response=response.data)
+            if claimed.pk % IDEMPOTENCY_PURGE_EVERY == 0:
+                transaction.on_commit(lambda: purge_expired_keys(max_batches=1))
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys(batch_size=IDEMPOTENCY_PURGE_BATCH_SIZE, max_batches=None):
+    """
+    Deletes expired keys in batches, oldest first, so no statement holds
+    locks on more than batch_size rows
+    Args:
+        batch_size(int): Value containing number of keys deleted at once
+        max_batches(int): Value containing number of batches to delete at
+            most, all expired keys if not given
+    Returns:
+        (int): Value containing number of keys deleted
+    """
+    expired = (
+        IdempotencyKey.objects.filter(expires_on__lte=timezone.now())
+        .order_by("expires_on")
+        .values_list("id", flat=True)
+    )
+    purged = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(expired[:batch_size])
+        if ids:
+            purged += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+        batches += 1
+        if len(ids) < batch_size:
+            break
+    return purged
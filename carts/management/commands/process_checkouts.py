@@ -0,0 +1,78 @@
+"""
+Management command running the checkout worker
+"""
+import json
+import time
+from multiprocessing import Pool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from carts.checkout import claim_jobs, process_job, queue_metrics
+from carts.constants import CHECKOUT_BATCH_SIZE, CHECKOUT_POLL_INTERVAL
+
+
+class Command(BaseCommand):
+    """
+    Claims due checkout jobs in batches and finalizes their carts, in this
+    process or in a pool of worker processes
+    """
+
+    help = "Processes queued checkouts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=1, help="Number of worker processes"
+        )
+        parser.add_argument("--batch-size", type=int, default=CHECKOUT_BATCH_SIZE)
+        parser.add_argument(
+            "--poll-interval", type=float, default=CHECKOUT_POLL_INTERVAL
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Stop when no job is due"
+        )
+        parser.add_argument(
+            "--metrics", action="store_true", help="Print queue metrics and exit"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Processes batches of jobs until stopped, or until the queue is drained
+        with --once, printing the queue metrics after every batch
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        if options["metrics"]:
+            self.stdout.write(json.dumps(queue_metrics()))
+            return
+        pool = None
+        if options["processes"] > 1:
+            # children must open their own connections
+            connections.close_all()
+            pool = Pool(options["processes"], initializer=django.setup)
+        try:
+            while True:
+                token, job_ids = claim_jobs(options["batch_size"])
+                if not job_ids:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+                jobs = [(job_id, token) for job_id in job_ids]
+                if pool:
+                    results = pool.starmap(process_job, jobs)
+                else:
+                    results = [process_job(*job) for job in jobs]
+                counts = {status: results.count(status) for status in set(results)}
+                self.stdout.write(
+                    f"Processed {len(jobs)} jobs {counts} {json.dumps(queue_metrics())}"
+                )
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        self.stdout.write(self.style.SUCCESS("No checkout is due"))
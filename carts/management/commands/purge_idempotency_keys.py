@@ -0,0 +1,32 @@
+"""
+Management command to purge expired idempotency keys
+"""
+from django.core.management.base import BaseCommand
+
+from carts.constants import IDEMPOTENCY_PURGE_BATCH_SIZE
+from carts.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    """
+    Deletes the idempotency keys whose stored responses expired
+    """
+
+    help = "Deletes expired idempotency keys in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=IDEMPOTENCY_PURGE_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        """
+        Purges expired keys and prints the number deleted
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        purged = purge_expired_keys(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired keys"))
@@ -0,0 +1,31 @@
+"""
+Management command to rebuild the daily sales rollups
+"""
+from django.core.management.base import BaseCommand
+
+from carts.constants import ROLLUP_CHUNK_SIZE
+from carts.reports import rebuild_rollups
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the sales of every day and of every product per day from the
+    items of submitted carts
+    """
+
+    help = "Rebuilds the daily rollups behind the sales reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=ROLLUP_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the rollups and prints the number of carts counted
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        counted = rebuild_rollups(options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Counted {counted} carts"))
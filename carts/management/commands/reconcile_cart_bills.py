@@ -0,0 +1,38 @@
+"""
+Management command to reconcile stored cart bills with their items
+"""
+from django.core.management.base import BaseCommand
+
+from carts.constants import RECONCILE_CHUNK_SIZE
+from carts.utils import reconcile_bills
+
+
+class Command(BaseCommand):
+    """
+    Reports carts whose stored bill differs from the sum of their item totals
+    """
+
+    help = "Checks cart bills against their items and optionally fixes them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix", action="store_true", help="Overwrite mismatched bills"
+        )
+        parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        """
+        Prints every mismatched cart and the number of mismatches
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        mismatched = reconcile_bills(options["fix"], options["chunk_size"])
+        for cart_id, stored, actual in mismatched:
+            self.stdout.write(f"Cart {cart_id}: stored {stored}, items {actual}")
+        action = "Fixed" if options["fix"] else "Found"
+        self.stdout.write(
+            self.style.SUCCESS(f"{action} {len(mismatched)} mismatched bills")
+        )
@@ -0,0 +1,61 @@
+"""
+Management command to release the stock held by abandoned carts
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from carts.constants import ABANDONED_CART_HOURS, SWEEP_BATCH_SIZE
+from carts.utils import sweep_abandoned_carts
+
+
+class Command(BaseCommand):
+    """
+    Empties open carts that were not changed for a number of hours, putting
+    their units back in stock. Meant to be run periodically, for example from
+    cron.
+    """
+
+    help = "Empties abandoned carts and puts their units back in stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=float,
+            default=ABANDONED_CART_HOURS,
+            help="Hours since the last change after which a cart is abandoned",
+        )
+        parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+        parser.add_argument(
+            "--max-batches", type=int, help="Stop after this many batches"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Sweeps abandoned carts, printing the figures of every batch and the
+        totals of the run
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        totals = {"carts": 0, "items": 0, "units": 0}
+        for batch in sweep_abandoned_carts(
+            timedelta(hours=options["hours"]),
+            options["batch_size"],
+            options["max_batches"],
+        ):
+            for name in totals:
+                totals[name] += batch[name]
+            self.stdout.write(
+                f"Batch {batch['batch']}: {batch['carts']} carts, "
+                f"{batch['items']} items, {batch['units']} units released "
+                f"in {batch['seconds']}s"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Emptied {totals['carts']} carts, released {totals['units']} "
+                f"units of {totals['items']} items"
+            )
+        )
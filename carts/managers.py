@@ -0,0 +1,144 @@
+"""
+Contains Managers for models
+"""
+# pylint: disable= no-member, cyclic-import
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+import carts.models
+from carts.constants import DELIVERED, OPEN, ORDER_TRANSITIONS, STATUS_CHUNK_SIZE
+from carts.reports import add_deliveries
+from products.stock import release_items
+
+
+def items_prefetch():
+    """
+    Returns the prefetch loading the items of carts with their products
+    Returns:
+        (Prefetch): Value containing prefetch of cart_items
+    """
+    return Prefetch(
+        "cart_items",
+        queryset=carts.models.CartItem.objects.select_related("product").order_by("id"),
+    )
+
+
+class CartQuerySet(models.QuerySet):
+    """
+    QuerySet of carts with set based operations
+    """
+
+    def with_items(self):
+        """
+        Loads the items and their products of all carts with one more query
+        Returns:
+            (QuerySet): Value containing carts with prefetched items
+        """
+        return self.prefetch_related(items_prefetch())
+
+    def abandoned(self, idle_for):
+        """
+        Returns the open carts holding items that were not changed for a
+        while, least recently changed first, read from cart_open_updated_idx
+        Args:
+            idle_for(timedelta): Value containing time since the last change
+        Returns:
+            (QuerySet): Value containing abandoned carts
+        """
+        return (
+            self.filter(status=OPEN, updated_on__lt=timezone.now() - idle_for)
+            .filter(Exists(carts.models.CartItem.objects.filter(cart=OuterRef("pk"))))
+            .order_by("updated_on")
+        )
+
+    def empty(self):
+        """
+        Removes all items from the open carts of the queryset. Stock of every
+        affected product is restored with one grouped UPDATE, the items are
+        deleted with one DELETE and the bills are zeroed with one UPDATE.
+        Returns:
+            (int): Value containing number of carts emptied
+        """
+        with transaction.atomic():
+            cart_ids = list(
+                self.filter(status=OPEN)
+                .select_for_update()
+                .values_list("id", flat=True)
+            )
+            if not cart_ids:
+                return 0
+            items = carts.models.CartItem.objects.filter(cart__in=cart_ids)
+            release_items(items)
+            items.delete()
+            return carts.models.Cart.objects.filter(pk__in=cart_ids).update(
+                total_bill=Decimal(0), updated_on=timezone.now()
+            )
+
+    def transition(self, status, user=None, chunk_size=STATUS_CHUNK_SIZE):
+        """
+        Moves the orders of the queryset that are allowed to go to status.
+        Every chunk of orders is moved with one UPDATE per current status,
+        recorded with one INSERT and counted in the daily rollups in a
+        transaction of its own, so locks are held briefly however many orders
+        are moved. Orders moved by someone else since the chunk was read are
+        left alone.
+        Args:
+            status(str): Value containing status to move the orders to
+            user(User): Value containing user moving the orders
+            chunk_size(int): Value containing number of orders moved at once
+        Returns:
+            (int): Value containing number of orders moved
+        Raises:
+            ValueError: if no status can move to the given status
+        """
+        sources = [
+            source for source, targets in ORDER_TRANSITIONS.items() if status in targets
+        ]
+        if not sources:
+            raise ValueError(_("Orders cannot be moved to %s") % status)
+        orders = self.filter(status__in=sources).order_by("id")
+        moved, last_id = 0, 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    orders.filter(id__gt=last_id)
+                    .select_for_update()
+                    .values_list("id", "status")[:chunk_size]
+                )
+                if not rows:
+                    return moved
+                now = timezone.now()
+                changed = []
+                for from_status in sorted({row[1] for row in rows}):
+                    cart_ids = [row[0] for row in rows if row[1] == from_status]
+                    # the status is checked again by the UPDATE itself, as the
+                    # rows are not locked on every database
+                    group = carts.models.Cart.objects.filter(
+                        id__in=cart_ids, status=from_status
+                    )
+                    count = group.update(status=status, updated_on=now)
+                    if count < len(cart_ids):
+                        cart_ids = carts.models.Cart.objects.filter(
+                            id__in=cart_ids, status=status, updated_on=now
+                        ).values_list("id", flat=True)
+                    changed.extend((cart_id, from_status) for cart_id in cart_ids)
+                carts.models.CartStatusChange.objects.bulk_create(
+                    carts.models.CartStatusChange(
+                        cart_id=cart_id,
+                        from_status=from_status,
+                        to_status=status,
+                        changed_by=user,
+                        changed_on=now,
+                    )
+                    for cart_id, from_status in changed
+                )
+                if status == DELIVERED:
+                    add_deliveries(len(changed), timezone.localdate(now))
+            moved += len(changed)
+            if len(rows) < chunk_size:
+                return moved
+            last_id = rows[-1][0]
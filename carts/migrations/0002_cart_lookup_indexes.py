@@ -0,0 +1,94 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:03
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Merges rows that the new constraints would reject: extra open carts of a
+    user are folded into the newest one and repeated products of a cart are
+    folded into a single cart item
+    Args:
+        apps(StateApps): Value containing historical models
+        schema_editor(BaseDatabaseSchemaEditor): Value containing db connection
+    Returns:
+        None
+    """
+    cart_model = apps.get_model("carts", "Cart")
+    cart_item_model = apps.get_model("carts", "CartItem")
+    touched_carts = set()
+
+    duplicated_users = (
+        cart_model.objects.filter(status="Open")
+        .values("user")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("user", flat=True)
+    )
+    for user in duplicated_users:
+        cart_ids = list(
+            cart_model.objects.filter(user=user, status="Open")
+            .order_by("-id")
+            .values_list("id", flat=True)
+        )
+        cart_item_model.objects.filter(cart_id__in=cart_ids[1:]).update(
+            cart_id=cart_ids[0]
+        )
+        cart_model.objects.filter(id__in=cart_ids[1:]).delete()
+        touched_carts.add(cart_ids[0])
+
+    duplicated_items = (
+        cart_item_model.objects.values("cart", "product")
+        .annotate(count=Count("id"), keep=Min("id"), quantity=Sum("quantity"))
+        .filter(count__gt=1)
+    )
+    for item in duplicated_items:
+        lines = cart_item_model.objects.filter(
+            cart=item["cart"], product=item["product"]
+        )
+        product = apps.get_model("products", "Product").objects.get(id=item["product"])
+        lines.filter(id=item["keep"]).update(
+            quantity=item["quantity"], item_total=item["quantity"] * product.price
+        )
+        lines.exclude(id=item["keep"]).delete()
+        touched_carts.add(item["cart"])
+
+    for cart in cart_model.objects.filter(id__in=touched_carts):
+        cart.total_bill = (
+            cart_item_model.objects.filter(cart=cart).aggregate(
+                total=Sum("item_total")
+            )["total"]
+            or 0
+        )
+        cart.save(update_fields=["total_bill"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carts", "0001_initial"),
+        ("products", "0008_product_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="cart",
+            index=models.Index(fields=["user", "status"], name="cart_user_status_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="cart",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "Open")),
+                fields=("user",),
+                name="cart_one_open_cart_per_user",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                fields=("cart", "product"), name="cartitem_unique_cart_product"
+            ),
+        ),
+    ]
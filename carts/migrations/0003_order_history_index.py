@@ -0,0 +1,19 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carts", "0002_cart_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cart",
+            index=models.Index(
+                fields=["user", "-created_on", "-id"], name="cart_user_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:24
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+import carts.models
+
+
+def snapshot_submitted_lines(apps, schema_editor):
+    """
+    Copies the name, price and image of the products to the items of carts
+    that were already submitted, with one UPDATE
+    Args:
+        apps(StateApps): Value containing historical models
+        schema_editor(BaseDatabaseSchemaEditor): Value containing db connection
+    Returns:
+        None
+    """
+    cart_item_model = apps.get_model("carts", "CartItem")
+    product_model = apps.get_model("products", "Product")
+    product = product_model.objects.filter(pk=OuterRef("product"))
+    cart_item_model.objects.exclude(cart__status="Open").filter(
+        product__isnull=False
+    ).update(
+        product_name=Subquery(product.values("name")[:1]),
+        unit_price=Subquery(product.values("price")[:1]),
+        product_image=Coalesce(Subquery(product.values("image")[:1]), Value("")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_recommendations"),
+        ("carts", "0003_order_history_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartitem",
+            name="product_image",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=100,
+                verbose_name="Product image when ordered",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cartitem",
+            name="product_name",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=100,
+                verbose_name="Product name when ordered",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cartitem",
+            name="unit_price",
+            field=models.DecimalField(
+                decimal_places=2,
+                editable=False,
+                max_digits=10,
+                null=True,
+                verbose_name="Product price when ordered",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="cartitem",
+            name="product",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=carts.models.keep_order_lines,
+                related_name="+",
+                to="products.product",
+            ),
+        ),
+        migrations.RunPython(snapshot_submitted_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carts", "0004_order_line_snapshots"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="cart",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("Open", "Open"),
+                    ("Processing", "Processing"),
+                    ("Submitted", "Submitted"),
+                    ("Delivered", "Delivered"),
+                ],
+                default="Open",
+                max_length=40,
+            ),
+        ),
+        migrations.CreateModel(
+            name="CheckoutJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Queued", "Queued"),
+                            ("Running", "Running"),
+                            ("Done", "Done"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Queued",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("run_after", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "locked_by",
+                    models.CharField(blank=True, editable=False, max_length=32),
+                ),
+                ("locked_until", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_on", models.DateTimeField(auto_now_add=True)),
+                ("finished_on", models.DateTimeField(blank=True, null=True)),
+                (
+                    "cart",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="checkout_job",
+                        to="carts.cart",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="checkoutjob",
+            index=models.Index(
+                fields=["status", "run_after"], name="checkoutjob_due_idx"
+            ),
+        ),
+    ]
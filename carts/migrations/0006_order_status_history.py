@@ -0,0 +1,91 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("carts", "0005_checkout_jobs"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="cart",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("Open", "Open"),
+                    ("Processing", "Processing"),
+                    ("Submitted", "Submitted"),
+                    ("Shipped", "Shipped"),
+                    ("Delivered", "Delivered"),
+                ],
+                default="Open",
+                max_length=40,
+            ),
+        ),
+        migrations.CreateModel(
+            name="CartStatusChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "from_status",
+                    models.CharField(
+                        choices=[
+                            ("Open", "Open"),
+                            ("Processing", "Processing"),
+                            ("Submitted", "Submitted"),
+                            ("Shipped", "Shipped"),
+                            ("Delivered", "Delivered"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "to_status",
+                    models.CharField(
+                        choices=[
+                            ("Open", "Open"),
+                            ("Processing", "Processing"),
+                            ("Submitted", "Submitted"),
+                            ("Shipped", "Shipped"),
+                            ("Delivered", "Delivered"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("changed_on", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "cart",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="status_changes",
+                        to="carts.cart",
+                    ),
+                ),
+                (
+                    "changed_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
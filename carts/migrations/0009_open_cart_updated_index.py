@@ -0,0 +1,21 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carts", "0008_idempotency_keys"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cart",
+            index=models.Index(
+                condition=models.Q(("status", "Open")),
+                fields=["updated_on"],
+                name="cart_open_updated_idx",
+            ),
+        ),
+    ]
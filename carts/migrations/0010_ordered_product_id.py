@@ -0,0 +1,38 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:44
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def snapshot_product_ids(apps, schema_editor):
+    """
+    Copies the product id to the items of carts that were already submitted,
+    with one UPDATE
+    Args:
+        apps(StateApps): Value containing historical models
+        schema_editor(BaseDatabaseSchemaEditor): Value containing db connection
+    Returns:
+        None
+    """
+    cart_item_model = apps.get_model("carts", "CartItem")
+    cart_item_model.objects.exclude(cart__status="Open").filter(
+        product__isnull=False
+    ).update(ordered_product_id=F("product"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carts", "0009_open_cart_updated_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartitem",
+            name="ordered_product_id",
+            field=models.PositiveIntegerField(
+                editable=False, null=True, verbose_name="Product id when ordered"
+            ),
+        ),
+        migrations.RunPython(snapshot_product_ids, migrations.RunPython.noop),
+    ]
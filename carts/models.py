@@ -3,13 +3,22 @@ Models for cart app
 """
 from decimal import Decimal
 
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from carts.constants import CART_STATUS, OPEN
+from carts.constants import CART_STATUS, JOB_STATUS, OPEN, QUEUED, SUBMITTED
+from carts.managers import CartQuerySet
+from carts.reports import add_to_rollups
+from products.cache import bump_sales_version
 from products.models import AuditTimeStamp, Product
+from products.stats import record_sales
+from products.stock import move_stock, release_stock
 from users.models import User
 
 
@@ -28,28 +37,272 @@ class Cart(AuditTimeStamp):
         default=Decimal(0),
     )
 
-    def update_bill(self):
+    objects = CartQuerySet.as_manager()
+
+    def add_to_bill(self, amount, touch=False):
         """
-        Updates the bill by traversing all the cart items
+        Adds the change of an item total to the bill with a single UPDATE.
+        The bill is never read back, so concurrent changes to the same cart
+        all land.
+        Args:
+            amount(Decimal): Value containing amount to add, negative to subtract
+            touch(bool): Value telling to bump updated_on even if the bill
+                does not move, because items changed
         Returns:
             None
         """
+        if not amount and not touch:
+            return
+        now = timezone.now()
+        Cart.objects.filter(pk=self.pk).update(
+            total_bill=F("total_bill") + amount, updated_on=now
+        )
+        self.set_saved_values(
+            total_bill=Decimal(self.total_bill) + Decimal(amount), updated_on=now
+        )
+
+    def apply_diff(self, quantities, user=None, replace=False):
+        """
+        Sets the quantities of many products in one transaction. Stock moves
+        with one conditional UPDATE per changed product, items are written
+        with one bulk_create, one bulk_update and one DELETE, and the bill
+        moves once by the total difference.
+        Args:
+            quantities(dict): Value containing product id -> new quantity,
+                0 removes the product from the cart
+            user(User): Value containing user creating the new items
+            replace(bool): Value telling to remove products not in quantities
+        Returns:
+            None
+        Raises:
+            Product.DoesNotExist: if a product id is unknown
+            OutOfStock: if a product does not have enough units left
+            ValueError: if a quantity is negative
+        """
+        # pylint: disable=no-member, protected-access
+        with transaction.atomic():
+            items = {item.product_id: item for item in self.cart_items.all()}
+            if replace:
+                quantities = {**dict.fromkeys(items, 0), **quantities}
+            products = Product.objects.in_bulk(quantities)
+            missing = quantities.keys() - products.keys()
+            if missing:
+                raise Product.DoesNotExist(f"Products {sorted(missing)} do not exist")
+
+            to_create, to_update, to_delete = [], [], []
+            to_total = CartItem._meta.get_field("item_total").to_python
+            bill_change = 0
+            now = timezone.now()
+            # a fixed order keeps concurrent diffs from locking rows crosswise
+            for product_id in sorted(quantities):
+                quantity = quantities[product_id]
+                if quantity < 0:
+                    raise ValueError("Quantity cannot be negative")
+                item = items.get(product_id)
+                old_quantity, old_total = 0, 0
+                if item is not None:
+                    old_quantity, old_total = item.quantity, item.item_total or 0
+                if quantity == old_quantity:
+                    continue
+                move_stock(product_id, quantity - old_quantity)
+                total = to_total(Decimal(quantity) * products[product_id].price)
+                bill_change += (total if quantity else 0) - old_total
+                if item is None:
+                    to_create.append(
+                        CartItem(
+                            cart=self,
+                            product=products[product_id],
+                            quantity=quantity,
+                            item_total=total,
+                            created_by=user,
+                        )
+                    )
+                elif quantity == 0:
+                    to_delete.append(item.id)
+                else:
+                    item.set_saved_values(quantity=quantity, item_total=total)
+                    item.updated_on = now
+                    to_update.append(item)
+
+            CartItem.objects.bulk_create(to_create)
+            CartItem.objects.bulk_update(
+                to_update, ["quantity", "item_total", "updated_on"]
+            )
+            if to_delete:
+                CartItem.objects.filter(id__in=to_delete).delete()
+            # swapped quantities can leave the bill as it was, but the cart
+            # still changed for its validators and the abandoned cart sweeper
+            self.add_to_bill(
+                bill_change, touch=bool(to_create or to_update or to_delete)
+            )
+
+    def empty(self):
+        """
+        Removes all the items of an open cart with set based queries
+        Returns:
+            (bool): True if the cart was emptied otherwise False
+        """
+        emptied = Cart.objects.filter(pk=self.pk).empty()
+        if emptied:
+            self.set_saved_values(total_bill=Decimal(0))
+        return bool(emptied)
+
+    def submit(self, from_status=OPEN):
+        """
+        Moves a cart to submitted, freezes the id, name, price and image of
+        its products on the items and adds them to the sales stats and
+        rollups. The status only changes if the cart is still in from_status,
+        so a cart submitted twice is counted once.
+        Args:
+            from_status(str): Value containing status the cart must be in
+        Returns:
+            (bool): True if the cart was submitted otherwise False
+        """
         # pylint: disable=no-member
-        self.total_bill = self.cart_items.aggregate(total=Sum("item_total"))["total"]
-        if self.total_bill is None:
-            self.total_bill = 0
-        self.save()
+        with transaction.atomic():
+            now = timezone.now()
+            submitted = Cart.objects.filter(pk=self.pk, status=from_status).update(
+                status=SUBMITTED, updated_on=now
+            )
+            if submitted:
+                CartStatusChange.objects.create(
+                    cart=self,
+                    from_status=from_status,
+                    to_status=SUBMITTED,
+                    changed_on=now,
+                )
+                self.cart_items.update(updated_on=now, **line_snapshot())
+                record_sales(
+                    self.cart_items.values_list("product", "quantity", "item_total")
+                )
+                add_to_rollups([self.pk])
+                transaction.on_commit(bump_sales_version)
+        if submitted:
+            self.set_saved_values(status=SUBMITTED, updated_on=now)
+        return bool(submitted)
 
     def __str__(self):
         return f"{self.user.name}'s Cart"
 
+    class Meta:
+        """
+        Defines the metadata of the class
+        """
+
+        indexes = [
+            models.Index(fields=["user", "status"], name="cart_user_status_idx"),
+            models.Index(
+                fields=["user", "-created_on", "-id"], name="cart_user_created_idx"
+            ),
+            models.Index(
+                fields=["updated_on"],
+                condition=models.Q(status=OPEN),
+                name="cart_open_updated_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(status=OPEN),
+                name="cart_one_open_cart_per_user",
+            ),
+        ]
+
+
+class CartStatusChange(models.Model):
+    """
+    Append only history of the status of carts. Rows are written with the
+    status change itself and never updated or deleted.
+    """
+
+    cart = models.ForeignKey(
+        Cart, on_delete=models.CASCADE, related_name="status_changes"
+    )
+    from_status = models.CharField(max_length=20, choices=CART_STATUS)
+    to_status = models.CharField(max_length=20, choices=CART_STATUS)
+    changed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    changed_on = models.DateTimeField(default=timezone.now)
+
+    def save(self, *args, **kwargs):
+        """
+        Writes a new history row
+        Args:
+            args(list): list containing different arguments
+            kwargs(dict): dictionary containing different key value arguments
+        Returns:
+            None
+        Raises:
+            ValueError: if the row was already written
+        """
+        if not self._state.adding:
+            raise ValueError(_("Status history cannot be changed"))
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """
+        Refuses to delete history
+        Args:
+            args(list): List containing arguments
+            kwargs(dict): Dictionary containing key value arguments
+        Raises:
+            ValueError: always
+        """
+        raise ValueError(_("Status history cannot be deleted"))
+
+    def __str__(self):
+        """
+        String representation of CartStatusChange
+        Returns:
+            (str): Value containing cart and both statuses
+        """
+        return f"Cart {self.cart_id}: {self.from_status} -> {self.to_status}"
+
+
+def line_snapshot():
+    """
+    Returns update expressions copying the id, name, price and image of the
+    product of each item, so a cart is snapshotted with one UPDATE
+    Returns:
+        (dict): Value containing field name -> expression
+    """
+    product = Product.objects.filter(pk=OuterRef("product"))
+    return {
+        "ordered_product_id": F("product"),
+        "product_name": Subquery(product.values("name")[:1]),
+        "unit_price": Subquery(product.values("price")[:1]),
+        "product_image": Coalesce(Subquery(product.values("image")[:1]), Value("")),
+    }
+
+
+def keep_order_lines(collector, field, sub_objs, using):
+    """
+    on_delete handler of CartItem.product. Items of open carts are deleted
+    with the product while items of submitted carts keep their snapshot and
+    lose the link to the product.
+    Args:
+        collector(Collector): Value containing deletion collector
+        field(ForeignKey): Value containing CartItem.product
+        sub_objs(QuerySet): Value containing items of the deleted products
+        using(str): Value containing database alias
+    Returns:
+        None
+    """
+    models.CASCADE(collector, field, sub_objs.filter(cart__status=OPEN), using)
+    models.SET_NULL(collector, field, sub_objs.exclude(cart__status=OPEN), using)
+
 
 class CartItem(AuditTimeStamp):
     """
-    Model class that represents a CartItem
+    Model class that represents a CartItem. When the cart is submitted the
+    id, name, price and image of the product are copied to the item, so
+    orders read without joining the catalog and survive changes to it.
     """
 
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    product = models.ForeignKey(
+        Product, on_delete=keep_order_lines, null=True, related_name="+"
+    )
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="cart_items")
     quantity = models.PositiveIntegerField(
         _("Product quantity to buy"), default=1, validators=(MinValueValidator(1),)
@@ -57,10 +310,46 @@ class CartItem(AuditTimeStamp):
     item_total = models.PositiveIntegerField(
         _("Total price of Cart Item"), validators=(MinValueValidator(1),), null=True
     )
+    ordered_product_id = models.PositiveIntegerField(
+        _("Product id when ordered"), null=True, editable=False
+    )
+    product_name = models.CharField(
+        _("Product name when ordered"), max_length=100, blank=True, editable=False
+    )
+    unit_price = models.DecimalField(
+        _("Product price when ordered"),
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        editable=False,
+    )
+    product_image = models.CharField(
+        _("Product image when ordered"), max_length=100, blank=True, editable=False
+    )
+
+    def get_name(self):
+        """
+        Returns the name of the product when ordered, or its current name
+        Returns:
+            (str): Value containing product name
+        """
+        # pylint: disable=no-member
+        if self.product_name or self.product_id is None:
+            return self.product_name
+        return self.product.name
+
+    @property
+    def image_url(self):
+        """
+        Returns the url of the product image when ordered
+        Returns:
+            (str): Value containing image url, empty if there was no image
+        """
+        return default_storage.url(self.product_image) if self.product_image else ""
 
     def delete(self, *args, **kwargs):
         """
-        Updates bill whenever an item is deleted
+        Puts the units back in stock and takes the item off the bill
         Args:
             args(list): List containing arguments
             kwargs(dict): Dictionary containing key value arguments
@@ -68,26 +357,34 @@ class CartItem(AuditTimeStamp):
             None
         """
         # pylint: disable=no-member
-        self.product.stock_quantity += self.quantity
-        self.product.save()
         cart = self.cart
-        super().delete(*args, **kwargs)
-        cart.update_bill()
+        with transaction.atomic():
+            release_stock(
+                self.product_id, self.get_old_value("quantity") or self.quantity
+            )
+            super().delete(*args, **kwargs)
+            cart.add_to_bill(-(self.get_old_value("item_total") or 0))
 
     def update_product_quantity(self, new_quantity):
         """
-        Updates the stock quantity of the product
+        Reserves or releases the stock of the product for a new quantity with
+        a conditional UPDATE, so concurrent carts cannot oversell it
         Args:
             new_quantity(int): Value containing new quantity
         Returns:
             None
+        Raises:
+            OutOfStock: if the product does not have enough units left
         """
         # pylint: disable=no-member
         old_quantity = 0
-        if self.id is not None:
-            old_quantity = CartItem.objects.get(id=self.id).quantity
-        self.product.stock_quantity += old_quantity - new_quantity
-        self.product.save()
+        if not self._state.adding:
+            old_quantity = self.get_old_value("quantity") or 0
+            old_product = self.get_old_value("product_id")
+            if old_product is not None and old_product != self.product_id:
+                release_stock(old_product, old_quantity)
+                old_quantity = 0
+        move_stock(self.product_id, new_quantity - old_quantity)
 
     def update_total(self):
         """
@@ -95,12 +392,15 @@ class CartItem(AuditTimeStamp):
         Returns:
             None
         """
-        # pylint: disable=no-member
-        self.item_total = Decimal(self.quantity) * self.product.price
+        # pylint: disable=no-member, protected-access
+        # converted like the database column so the bill delta matches it
+        self.item_total = self._meta.get_field("item_total").to_python(
+            Decimal(self.quantity) * self.product.price
+        )
 
     def save(self, *args, **kwargs):
         """
-        Updates bill whenever an item is updated
+        Reserves stock and adds the change of the item total to the bill
         Args:
             args(list): list containing different arguments
             kwargs(dict): dictionary containing different key value arguments
@@ -108,10 +408,19 @@ class CartItem(AuditTimeStamp):
             None
         """
         # pylint: disable=no-member
-        self.update_product_quantity(self.quantity)
-        self.update_total()
-        super().save(*args, **kwargs)
-        self.cart.update_bill()
+        old_total, old_cart = 0, None
+        if not self._state.adding:
+            old_total = self.get_old_value("item_total") or 0
+            old_cart = self.get_old_value("cart_id")
+        with transaction.atomic():
+            if old_cart not in (None, self.cart_id):
+                # the item moved, take it off the bill of its previous cart
+                Cart(pk=old_cart).add_to_bill(-old_total)
+                old_total = 0
+            self.update_product_quantity(self.quantity)
+            self.update_total()
+            super().save(*args, **kwargs)
+            self.cart.add_to_bill(self.item_total - old_total)
 
     def __str__(self):
         """
@@ -120,4 +429,143 @@ class CartItem(AuditTimeStamp):
              (str): Value containing Product name and quantity
         """
         # pylint: disable=no-member
-        return f"{self.product.name}, {self.quantity} of {self.cart.user.name}'s cart"
+        return f"{self.get_name()}, {self.quantity} of {self.cart.user.name}'s cart"
+
+    class Meta:
+        """
+        Defines the metadata of the class
+        """
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["cart", "product"], name="cartitem_unique_cart_product"
+            ),
+        ]
+
+
+class CheckoutJob(models.Model):
+    """
+    Queued checkout of a cart, finalized by the process_checkouts worker.
+    Every cart has at most one job, so submitting a cart twice queues it once.
+    """
+
+    cart = models.OneToOneField(
+        Cart, on_delete=models.CASCADE, related_name="checkout_job"
+    )
+    status = models.CharField(max_length=20, choices=JOB_STATUS, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=32, blank=True, editable=False)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    finished_on = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        """
+        String representation of CheckoutJob
+        Returns:
+            (str): Value containing cart and status of the job
+        """
+        return f"Checkout of cart {self.cart_id}: {self.status}"
+
+    class Meta:
+        """
+        Defines the metadata of the class
+        """
+
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="checkoutjob_due_idx"),
+        ]
+
+
+class DailySales(models.Model):
+    """
+    Sales of one day, added to as carts are submitted and delivered
+    """
+
+    day = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal(0))
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    delivered = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """
+        String representation of DailySales
+        Returns:
+            (str): Value containing day and revenue
+        """
+        return f"{self.day}: {self.revenue}"
+
+
+class DailyProductSales(models.Model):
+    """
+    Sales of one product on one day. The product is kept as a plain id with
+    the name it was sold under, so the rows outlive the product.
+    """
+
+    day = models.DateField()
+    product_id = models.PositiveIntegerField()
+    product_name = models.CharField(max_length=100, blank=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal(0))
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """
+        String representation of DailyProductSales
+        Returns:
+            (str): Value containing day, product and revenue
+        """
+        return f"{self.day} {self.product_name}: {self.revenue}"
+
+    class Meta:
+        """
+        Defines the metadata of the class
+        """
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "product_id"], name="dailyproductsales_unique_day"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["product_id", "day"], name="dailyproductsales_idx"),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a cart change made with an Idempotency-Key header, replayed
+    when the same user sends the same key again until it expires
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_on = models.DateTimeField(auto_now_add=True)
+    expires_on = models.DateTimeField()
+
+    def __str__(self):
+        """
+        String representation of IdempotencyKey
+        Returns:
+            (str): Value containing user and key
+        """
+        return f"{self.user_id}: {self.key}"
+
+    class Meta:
+        """
+        Defines the metadata of the class
+        """
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="idempotencykey_unique_user_key"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["expires_on"], name="idempotencykey_expires_idx"),
+        ]
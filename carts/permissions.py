@@ -0,0 +1,28 @@
+"""
+Contains custom permissions for carts app
+"""
+from rest_framework.permissions import BasePermission
+
+from users.contants import SALES_MANAGER
+
+
+class IsSalesManager(BasePermission):
+    """
+    Tells if user can manage the orders of all customers
+    """
+
+    def has_permission(self, request, view):
+        """
+        Checks if the user has a specific permission or not
+        Args:
+            request(HttpRequest): Value containing request data
+            view(HttpView): Value containing view data
+        Returns:
+            (bool): True is a user has permission otherwise False.
+        """
+
+        return request.user.is_authenticated and (
+            request.user.is_superuser
+            or request.user.is_staff
+            or request.user.role.code == SALES_MANAGER
+        )
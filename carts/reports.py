@@ -0,0 +1,223 @@
+"""
+Daily sales rollups behind the sales reports
+
+Every submitted cart is added to two small tables when it is submitted: one
+row per day and one row per day and product, holding revenue, units and
+orders. Rows are added to with upserts, so concurrent checkouts never lose
+each other's figures, and reports over a date range read at most one row per
+day and product instead of every line item. Orders are counted on the day
+they were submitted and deliveries on the day they were delivered.
+"""
+from django.db import connection, transaction
+from django.db.models import (
+    Count,
+    DateTimeField,
+    F,
+    Max,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .constants import DELIVERED, ROLLUP_CHUNK_SIZE, SUBMITTED, UNFINISHED_STATUSES
+
+
+def _table(model):
+    """
+    Returns the quoted table name of a model
+    Args:
+        model(Model): Value containing model class
+    Returns:
+        (str): Value containing quoted table name
+    """
+    # pylint: disable=protected-access
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _upsert(model, rows, keys, added, replaced=()):
+    """
+    Inserts rows, adding the added columns to the existing row on conflict
+    Args:
+        model(Model): Value containing rollup model
+        rows(list): Value containing dictionaries of column -> value
+        keys(tuple): Value containing columns of the unique constraint
+        added(tuple): Value containing columns summed with the existing row
+        replaced(tuple): Value containing columns overwritten on conflict
+    Returns:
+        None
+    """
+    # pylint: disable=protected-access
+    if not rows:
+        return
+    table, quote = _table(model), connection.ops.quote_name
+    columns = keys + replaced + added
+    fields = {name: model._meta.get_field(name) for name in columns}
+    updates = [f"{quote(name)} = excluded.{quote(name)}" for name in replaced] + [
+        f"{quote(name)} = {table}.{quote(name)} + excluded.{quote(name)}"
+        for name in added
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(map(quote, columns))}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON CONFLICT ({', '.join(map(quote, keys))}) "
+            f"DO UPDATE SET {', '.join(updates)}",
+            [
+                [
+                    fields[name].get_db_prep_save(row[name], connection)
+                    for name in columns
+                ]
+                for row in rows
+            ],
+        )
+
+
+def submitted_day():
+    """
+    Returns an expression of the day the cart of an item was submitted, read
+    from the status history and falling back to the last change of the cart
+    for carts submitted before the history was kept
+    Returns:
+        (TruncDate): Value containing submission day
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from .models import CartStatusChange
+
+    submitted_on = (
+        CartStatusChange.objects.filter(cart=OuterRef("cart"), to_status=SUBMITTED)
+        .order_by("changed_on")
+        .values("changed_on")[:1]
+    )
+    return TruncDate(
+        Coalesce(
+            Subquery(submitted_on),
+            F("cart__updated_on"),
+            output_field=DateTimeField(),
+        )
+    )
+
+
+def add_to_rollups(cart_ids):
+    """
+    Adds the items of submitted carts to the daily rollups
+    Args:
+        cart_ids(list): Value containing primary keys of submitted carts
+    Returns:
+        None
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from .models import CartItem, DailyProductSales, DailySales
+
+    # lines keep the id of their product when it is deleted, so the rollups
+    # rebuilt after a deletion still count them
+    items = (
+        CartItem.objects.filter(cart__in=cart_ids)
+        .annotate(day=submitted_day())
+        .order_by()
+    )
+    totals = {
+        "units": Sum("quantity"),
+        "revenue": Coalesce(Sum("item_total"), Value(0)),
+    }
+    product_rows = list(
+        items.filter(ordered_product_id__isnull=False)
+        .values("day", "ordered_product_id")
+        .annotate(
+            product_name=Max("product_name"),
+            orders=Count("cart", distinct=True),
+            **totals,
+        )
+    )
+    for row in product_rows:
+        row["product_id"] = row.pop("ordered_product_id")
+    with transaction.atomic():
+        _upsert(
+            DailyProductSales,
+            product_rows,
+            keys=("day", "product_id"),
+            added=("units", "revenue", "orders"),
+            replaced=("product_name",),
+        )
+        _upsert(
+            DailySales,
+            [
+                {**row, "delivered": 0}
+                for row in items.values("day").annotate(
+                    orders=Count("cart", distinct=True), **totals
+                )
+            ],
+            keys=("day",),
+            added=("units", "revenue", "orders", "delivered"),
+        )
+
+
+def add_deliveries(count, day=None):
+    """
+    Adds delivered orders to the rollup of a day
+    Args:
+        count(int): Value containing number of orders delivered
+        day(date): Value containing day of delivery, today if not given
+    Returns:
+        None
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from .models import DailySales
+
+    if not count:
+        return
+    _upsert(
+        DailySales,
+        [
+            {
+                "day": day or timezone.localdate(),
+                "delivered": count,
+                "units": 0,
+                "revenue": 0,
+                "orders": 0,
+            }
+        ],
+        keys=("day",),
+        added=("delivered", "units", "revenue", "orders"),
+    )
+
+
+def rebuild_rollups(chunk_size=ROLLUP_CHUNK_SIZE):
+    """
+    Recomputes the daily rollups from the items of every submitted cart,
+    aggregating one chunk of carts at a time
+    Args:
+        chunk_size(int): Value containing number of carts aggregated at once
+    Returns:
+        (int): Value containing number of carts counted
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from .models import Cart, CartStatusChange, DailyProductSales, DailySales
+
+    counted = 0
+    with transaction.atomic():
+        DailyProductSales.objects.all().delete()
+        DailySales.objects.all().delete()
+        cart_ids = (
+            Cart.objects.exclude(status__in=UNFINISHED_STATUSES)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        chunk = list(cart_ids[:chunk_size])
+        while chunk:
+            add_to_rollups(chunk)
+            counted += len(chunk)
+            chunk = list(cart_ids.filter(id__gt=chunk[-1])[:chunk_size])
+        deliveries = (
+            CartStatusChange.objects.filter(to_status=DELIVERED)
+            .annotate(day=TruncDate("changed_on"))
+            .order_by()
+            .values("day")
+            .annotate(count=Count("id"))
+            .values_list("day", "count")
+        )
+        for day, count in deliveries:
+            add_deliveries(count, day)
+    return counted
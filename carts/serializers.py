@@ -4,7 +4,9 @@ Serializers for carts models
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
-from carts.models import Cart, CartItem
+from carts.constants import ORDER_TRANSITIONS, REPORT_MAX_DAYS, STATUS_MAX_CARTS
+from carts.models import Cart, CartItem, DailyProductSales, DailySales
+from products.serializers import ProductCardSerializer
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -29,7 +31,9 @@ class CartItemSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """
-        Creates a CartItem
+        Creates a CartItem or adds the quantity to the item of the same
+        product. Stock is reserved by CartItem.save, which raises OutOfStock
+        when the product does not have enough units left.
         Args:
             validated_data(dict): Value containing verified data
         Returns:
@@ -37,31 +41,226 @@ class CartItemSerializer(serializers.ModelSerializer):
         """
         # pylint: disable=no-member
         cart = validated_data["cart"]
-        filter_item = cart.cart_items.filter(product=validated_data["product"])
-        if filter_item.exists():
-            cart_item = filter_item.get()
-            cart_item.quantity += validated_data["quantity"]
-            if cart_item.quantity > cart_item.product.stock_quantity:
-                raise serializers.ValidationError(
-                    _("Product cannot be added because it's out of stock")
-                )
-        else:
-            cart_item = CartItem.objects.create(**validated_data)
+        cart_item = cart.cart_items.filter(product=validated_data["product"]).first()
+        if cart_item is None:
+            return CartItem.objects.create(**validated_data)
+        # reuse the validated product instead of loading it again
+        cart_item.product = validated_data["product"]
+        cart_item.quantity += validated_data["quantity"]
         cart_item.save()
-        validated_data["cart"].update_bill()
         return cart_item
 
+    class Meta:
+        """
+        Tells model and fields to include in parsed/json object
+        """
+
+        model = CartItem
+        fields = "__all__"
+        extra_kwargs = {"product": {"required": True, "allow_null": False}}
+
+
+class CartItemDetailSerializer(serializers.ModelSerializer):
+    """
+    Read only CartItem serializer with a summary of the product
+    """
+
+    product = ProductCardSerializer(read_only=True)
+
+    class Meta:
+        """
+        Tells model and fields to include in parsed/json object
+        """
+
+        model = CartItem
+        fields = [
+            "id",
+            "product",
+            "quantity",
+            "item_total",
+            "product_name",
+            "unit_price",
+            "updated_on",
+        ]
+        read_only_fields = fields
+
+
+class CartDetailSerializer(serializers.ModelSerializer):
+    """
+    Read only Cart serializer with its items nested. Carts should be loaded
+    with Cart.objects.with_items() so the items cost no extra queries.
+    """
+
+    items = CartItemDetailSerializer(source="cart_items", many=True, read_only=True)
+
+    class Meta:
+        """
+        Tells model and fields to include in parsed/json object
+        """
+
+        model = Cart
+        fields = [
+            "id",
+            "status",
+            "user",
+            "total_bill",
+            "created_on",
+            "updated_on",
+            "items",
+        ]
+        read_only_fields = fields
+
+
+class OrderLineSerializer(serializers.ModelSerializer):
+    """
+    Read only CartItem serializer of a submitted cart, built from the
+    snapshot of the product taken when the cart was submitted
+    """
+
+    name = serializers.CharField(source="product_name")
+    image = serializers.CharField(source="image_url")
+
+    class Meta:
+        """
+        Tells model and fields to include in parsed/json object
+        """
+
+        model = CartItem
+        fields = [
+            "id",
+            "product",
+            "name",
+            "unit_price",
+            "image",
+            "quantity",
+            "item_total",
+        ]
+        read_only_fields = fields
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    """
+    Read only Cart serializer of a submitted cart and its lines
+    """
+
+    items = OrderLineSerializer(source="cart_items", many=True, read_only=True)
+
+    class Meta:
+        """
+        Tells model and fields to include in parsed/json object
+        """
+
+        model = Cart
+        fields = ["id", "status", "total_bill", "created_on", "updated_on", "items"]
+        read_only_fields = fields
+
+
+class CartDiffItemSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    """
+    New quantity of one product in a cart diff
+    """
+
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class CartDiffSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    """
+    Quantities to set on many products of a cart at once
+    """
+
+    items = CartDiffItemSerializer(many=True)
+    replace = serializers.BooleanField(default=False)
+
+    def validate_items(self, value):
+        """
+        Makes sure every product appears once
+        Args:
+            value(list): Value containing validated items
+        Returns:
+            (list): Value containing validated items
+        """
+        # pylint: disable=no-self-use
+        products = [item["product"] for item in value]
+        if len(products) != len(set(products)):
+            raise serializers.ValidationError(_("Each product can appear only once"))
+        return value
+
+
+class CartTransitionSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    """
+    Orders to move and the status to move them to
+    """
+
+    cart_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=STATUS_MAX_CARTS,
+    )
+    status = serializers.ChoiceField(
+        choices=sorted(
+            {status for targets in ORDER_TRANSITIONS.values() for status in targets}
+        )
+    )
+
+
+class SalesReportSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    """
+    Date range and optional product of a sales report
+    """
+
+    start = serializers.DateField()
+    end = serializers.DateField()
+    product = serializers.IntegerField(min_value=1, required=False)
+
     def validate(self, attrs):
-        if attrs["product"].stock_quantity < attrs["quantity"]:
+        """
+        Makes sure the range is ordered and not longer than REPORT_MAX_DAYS
+        Args:
+            attrs(dict): Value containing validated fields
+        Returns:
+            (dict): Value containing validated fields
+        """
+        # pylint: disable=no-self-use
+        days = (attrs["end"] - attrs["start"]).days + 1
+        if days < 1:
+            raise serializers.ValidationError(_("Start must not be after end"))
+        if days > REPORT_MAX_DAYS:
             raise serializers.ValidationError(
-                _("Product cannot be added because it's out of stock")
+                _("A report can cover at most %s days") % REPORT_MAX_DAYS
             )
         return attrs
 
+
+class DailySalesSerializer(serializers.ModelSerializer):
+    """
+    DailySales model serializer
+    """
+
     class Meta:
         """
         Tells model and fields to include in parsed/json object
         """
 
-        model = CartItem
-        fields = "__all__"
+        model = DailySales
+        fields = ["day", "revenue", "units", "orders", "delivered"]
+
+
+class DailyProductSalesSerializer(serializers.ModelSerializer):
+    """
+    DailyProductSales model serializer, also used for totals per product
+    """
+
+    day = serializers.DateField(required=False)
+
+    class Meta:
+        """
+        Tells model and fields to include in parsed/json object
+        """
+
+        model = DailyProductSales
+        fields = ["day", "product_id", "product_name", "revenue", "units", "orders"]
@@ -0,0 +1,108 @@
+"""
+Carts of visitors who are not logged in, kept in their session
+
+A session cart is a dict of product id -> quantity. Nothing is reserved and no
+cart rows are written while the visitor browses. When the visitor logs in the
+whole dict is merged into the open cart of the user with a single
+Cart.apply_diff, which reserves the stock of every product at once. The
+products that could not be merged are returned so the login can tell the user.
+"""
+from django.utils.translation import gettext_lazy as _
+
+from products.models import Product
+from products.stock import OutOfStock
+
+from .constants import OPEN, SESSION_CART_KEY, SESSION_CART_MAX_PRODUCTS
+from .models import Cart
+
+
+def add_to_session_cart(session, product_id, quantity):
+    """
+    Adds units of a product to the session cart if it has enough stock left
+    Args:
+        session(SessionBase): Value containing session of the visitor
+        product_id(int): Value containing primary key of the product
+        quantity(int): Value containing units to add
+    Returns:
+        (dict): Value containing product id -> quantity of the session cart
+    Raises:
+        ValueError: if the quantity is not positive or the cart is full
+        OutOfStock: if the product does not have enough units left
+    """
+    if quantity < 1:
+        raise ValueError(_("Quantity must be at least 1"))
+    quantities = session.get(SESSION_CART_KEY, {})
+    key = str(product_id)
+    if key not in quantities and len(quantities) >= SESSION_CART_MAX_PRODUCTS:
+        raise ValueError(_("Your cart cannot hold more products"))
+    new_quantity = quantities.get(key, 0) + quantity
+    if not Product.objects.filter(
+        pk=product_id, stock_quantity__gte=new_quantity
+    ).exists():
+        raise OutOfStock(product_id, new_quantity)
+    quantities[key] = new_quantity
+    session[SESSION_CART_KEY] = quantities
+    return quantities
+
+
+def merge_session_cart(request, user):
+    """
+    Moves the session cart into the open cart of a user who just logged in.
+    Quantities are added to the items already in the cart and capped to the
+    stock left, products that were removed or sold out are dropped. If another
+    buyer takes the last units of a product during the merge, that product is
+    dropped and the rest merged again. The session cart is only removed once
+    the merge succeeded.
+    Args:
+        request(HttpRequest): Value containing session of the visitor
+        user(User): Value containing user who logged in
+    Returns:
+        (dict): Value containing product id -> units that could not be merged
+    """
+    quantities = {
+        int(product_id): quantity
+        for product_id, quantity in request.session.get(SESSION_CART_KEY, {}).items()
+    }
+    if not quantities:
+        return {}
+    merged, sold_out = {}, set()
+    # one attempt per product that can sell out, and one finding none left
+    for _attempt in range(len(quantities) + 1):
+        products = (
+            Product.objects.filter(stock_quantity__gt=0)
+            .exclude(pk__in=sold_out)
+            .in_bulk(list(quantities))
+        )
+        if not products:
+            break
+        cart = Cart.objects.get_or_create(
+            user=user, status=OPEN, defaults={"created_by": user}
+        )[0]
+        in_cart = dict(cart.cart_items.values_list("product", "quantity"))
+        merged = {
+            product_id: min(quantities[product_id], product.stock_quantity)
+            for product_id, product in products.items()
+        }
+        try:
+            cart.apply_diff(
+                {
+                    product_id: in_cart.get(product_id, 0) + units
+                    for product_id, units in merged.items()
+                },
+                user,
+            )
+            break
+        except OutOfStock as error:
+            sold_out.add(error.product_id)
+            merged = {}
+        except Product.DoesNotExist:
+            merged = {}
+    else:
+        # products kept disappearing, the session cart is kept for the next login
+        return {}
+    request.session.pop(SESSION_CART_KEY, None)
+    return {
+        product_id: quantity - merged.get(product_id, 0)
+        for product_id, quantity in quantities.items()
+        if quantity > merged.get(product_id, 0)
+    }
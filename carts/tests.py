@@ -1,4 +1,949 @@
 """
 Contains test cases for models of carts app
 """
-# from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, models, transaction
+from django.db.models import Q, Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.client import encode_multipart
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from carts.checkout import (
+    CheckoutError,
+    claim_jobs,
+    enqueue_checkout,
+    process_job,
+    queue_metrics,
+)
+from carts.constants import (
+    CHECKOUT_MAX_ATTEMPTS,
+    DELIVERED,
+    DONE,
+    FAILED,
+    OPEN,
+    ORDERS_PAGE_SIZE,
+    PROCESSING,
+    QUEUED,
+    RUNNING,
+    SHIPPED,
+    SUBMITTED,
+)
+from carts.idempotency import purge_expired_keys
+from carts.managers import CartQuerySet
+from carts.models import (
+    Cart,
+    CartItem,
+    CartStatusChange,
+    CheckoutJob,
+    DailyProductSales,
+    DailySales,
+    IdempotencyKey,
+)
+from carts.reports import rebuild_rollups
+from carts.session import merge_session_cart
+from carts.utils import reconcile_bills, sweep_abandoned_carts
+from products.models import Product
+from products.stock import OutOfStock, reserve_stock
+from products.testing import query_plan
+from users.contants import SALES_MANAGER
+from users.models import Role, User
+
+
+class CartTestCase(TestCase):
+    """
+    Creates a user and a product shared by the cart test cases
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "customer@example.com", "Str0ngPassw0rd!", name="Customer"
+        )
+        self.product = Product.objects.create(
+            name="Keyboard", price=100, stock_quantity=10
+        )
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked on SQLite")
+class HotQueryPlanTests(CartTestCase):
+    """
+    Makes sure the hot cart lookups are answered from an index
+    """
+
+    def assertSearchesIndex(self, queryset, index):
+        # pylint: disable=invalid-name
+        plan = query_plan(queryset)
+        self.assertTrue(
+            any(step.startswith("SEARCH") and index in step for step in plan), plan
+        )
+
+    def test_open_cart_lookup(self):
+        self.assertSearchesIndex(
+            Cart.objects.filter(user=self.user, status=OPEN), "cart_user_status_idx"
+        )
+
+    def test_order_history_lookup(self):
+        plan = query_plan(Cart.objects.filter(~Q(status=OPEN), user=self.user))
+        self.assertTrue(all(step.startswith("SEARCH") for step in plan), plan)
+
+    def test_order_history_page(self):
+        plan = query_plan(
+            Cart.objects.filter(~Q(status=OPEN), user=self.user).order_by(
+                "-created_on", "-id"
+            )[:ORDERS_PAGE_SIZE]
+        )
+        self.assertFalse(any("TEMP B-TREE" in step for step in plan), plan)
+
+    def test_abandoned_cart_lookup(self):
+        self.assertSearchesIndex(
+            Cart.objects.abandoned(timedelta(hours=1)), "cart_open_updated_idx"
+        )
+
+    def test_cart_item_lookup(self):
+        cart = Cart.objects.create(user=self.user)
+        plan = query_plan(cart.cart_items.filter(product=self.product))
+        self.assertTrue(
+            any(step.startswith("SEARCH") and "product_id=?" in step for step in plan),
+            plan,
+        )
+
+
+class CartConstraintTests(CartTestCase):
+    """
+    Checks the constraints protecting carts from concurrent duplicates
+    """
+
+    def test_one_open_cart_per_user(self):
+        Cart.objects.create(user=self.user)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=self.user)
+
+    def test_many_submitted_carts_per_user(self):
+        Cart.objects.create(user=self.user, status=SUBMITTED)
+        Cart.objects.create(user=self.user, status=SUBMITTED)
+        Cart.objects.create(user=self.user)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 3)
+
+    def test_product_once_per_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+
+
+class CartBillTests(CartTestCase):
+    """
+    Checks the bill is kept as a running total of its items
+    """
+
+    def setUp(self):
+        super().setUp()
+        token = Token.objects.create(user=self.user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+
+    def test_add_to_cart_updates_bill_in_place(self):
+        self.client.post("/carts/", {"product": self.product.id, "quantity": 1})
+        # token, open cart, product, cart, item, then stock, item and bill
+        # inside a savepoint and the items of the response. The bill is
+        # moved by the item total difference and never re-aggregated.
+        with self.assertNumQueries(11):
+            response = self.client.post(
+                "/carts/", {"product": self.product.id, "quantity": 2}
+            )
+        self.assertEqual(response.json()["Cart details"]["total_bill"], "300.00")
+        cart = Cart.objects.get(user=self.user, status=OPEN)
+        self.assertEqual(cart.total_bill, 300)
+        cart.cart_items.get().delete()
+        self.assertEqual(Cart.objects.get(pk=cart.pk).total_bill, 0)
+        self.assertEqual(reconcile_bills(), [])
+
+    def test_reconcile_fixes_drifted_bills(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        Cart.objects.filter(pk=cart.pk).update(total_bill=5)
+        self.assertEqual(reconcile_bills(fix=True), [(cart.id, 5, 200)])
+        self.assertEqual(Cart.objects.get(pk=cart.pk).total_bill, 200)
+
+
+class CartDiffTests(CartTestCase):
+    """
+    Checks many quantities are applied to a cart in one transaction
+    """
+
+    def test_apply_diff(self):
+        other = Product.objects.create(name="Mouse", price=50, stock_quantity=3)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        cart.apply_diff({self.product.id: 4, other.id: 3})
+        cart.apply_diff({self.product.id: 0})
+        self.assertEqual(
+            list(cart.cart_items.values_list("product", "quantity")), [(other.id, 3)]
+        )
+        self.assertEqual(Cart.objects.get(pk=cart.pk).total_bill, 150)
+        self.assertEqual(reconcile_bills(), [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10)
+
+    def test_apply_diff_is_all_or_nothing(self):
+        other = Product.objects.create(name="Mouse", price=50, stock_quantity=3)
+        cart = Cart.objects.create(user=self.user)
+        with self.assertRaises(OutOfStock):
+            cart.apply_diff({self.product.id: 2, other.id: 4})
+        self.assertFalse(cart.cart_items.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10)
+
+    def test_diff_that_keeps_the_bill_still_changes_the_cart(self):
+        other = Product.objects.create(name="Mouse", price=100, stock_quantity=3)
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 2, other.id: 1})
+        token = Token.objects.create(user=self.user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+        etag = self.client.get("/carts/")["ETag"]
+        updated_on = Cart.objects.get(pk=cart.pk).updated_on
+        cart.apply_diff({self.product.id: 1, other.id: 2})
+        cart = Cart.objects.get(pk=cart.pk)
+        self.assertEqual(cart.total_bill, 300)
+        self.assertGreater(cart.updated_on, updated_on)
+        response = self.client.get("/carts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cart_form_only_changes_products_in_the_cart(self):
+        other = Product.objects.create(name="Mouse", price=50, stock_quantity=3)
+        cable = Product.objects.create(name="Cable", price=10, stock_quantity=3)
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 1, cable.id: 1})
+        self.client.force_login(self.user)
+        self.client.post(
+            "/carts/detail/",
+            {
+                "product": [self.product.id, other.id],
+                "quantity": [2, 1],
+                "is_checkout": "False",
+            },
+        )
+        self.assertEqual(
+            list(cart.cart_items.values_list("product", "quantity")),
+            [(self.product.id, 2)],
+        )
+        self.assertEqual(Product.objects.get(pk=other.pk).stock_quantity, 3)
+
+
+class CartResponseTests(CartTestCase):
+    """
+    Checks cart responses cost a fixed number of queries for any number of items
+    """
+
+    def setUp(self):
+        super().setUp()
+        token = Token.objects.create(user=self.user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+
+    def fill_carts(self, count):
+        """
+        Adds count products to an open and a submitted cart of the user
+        Args:
+            count(int): Value containing number of products per cart
+        Returns:
+            None
+        """
+        products = [
+            Product.objects.create(name=f"Cable {index}", price=10, stock_quantity=5)
+            for index in range(count)
+        ]
+        submitted = Cart.objects.create(user=self.user)
+        submitted.apply_diff({product.id: 1 for product in products})
+        submitted.submit()
+        Cart.objects.create(user=self.user).apply_diff(
+            {product.id: 2 for product in products}
+        )
+
+    def test_cart_list_queries_do_not_grow_with_items(self):
+        self.fill_carts(20)
+        # token, validators, carts and their items joined with the products
+        with self.assertNumQueries(4):
+            response = self.client.get("/carts/")
+        carts = response.json()["cart_details"]
+        self.assertEqual([len(cart["items"]) for cart in carts], [20, 20])
+        self.assertEqual(carts[0]["items"][0]["product"]["name"], "Cable 0")
+
+    def test_add_to_cart_queries_do_not_grow_with_items(self):
+        self.fill_carts(20)
+        self.client.post("/carts/", {"product": self.product.id, "quantity": 1})
+        with self.assertNumQueries(11):
+            response = self.client.post(
+                "/carts/", {"product": self.product.id, "quantity": 1}
+            )
+        self.assertEqual(len(response.json()["Cart details"]["items"]), 21)
+
+    def test_order_history_pages_cost_the_same(self):
+        products = [
+            Product.objects.create(name=f"Cable {index}", price=10, stock_quantity=50)
+            for index in range(3)
+        ]
+        for _ in range(ORDERS_PAGE_SIZE + 5):
+            cart = Cart.objects.create(user=self.user)
+            cart.apply_diff({product.id: 1 for product in products})
+            cart.submit()
+        # token, orders of the page, their items joined with the products
+        with self.assertNumQueries(3):
+            first = self.client.get("/carts/orders/api/").json()
+        with self.assertNumQueries(3):
+            second = self.client.get(
+                "/carts/orders/api/", {"cursor": first["next_cursor"]}
+            ).json()
+        ids = [order["id"] for order in first["orders"] + second["orders"]]
+        self.assertEqual(
+            ids, list(Cart.objects.order_by("-id").values_list("id", flat=True))
+        )
+        self.assertIsNone(second["next_cursor"])
+        self.assertEqual(len(second["orders"][0]["items"]), 3)
+        self.client.force_login(self.user)
+        with self.assertNumQueries(4):
+            response = self.client.get("/carts/orders/")
+        self.assertContains(response, "Older orders")
+
+
+class OrderLineSnapshotTests(CartTestCase):
+    """
+    Checks submitted items keep the product as it was when ordered
+    """
+
+    def test_submitted_lines_survive_catalog_changes(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 2})
+        cart.submit()
+        open_cart = Cart.objects.create(user=self.user)
+        open_cart.apply_diff({self.product.id: 1})
+        self.product.name, self.product.price = "Old keyboard", 80
+        self.product.save()
+        self.product.delete()
+        self.assertFalse(open_cart.cart_items.exists())
+        line = cart.cart_items.get()
+        self.assertIsNone(line.product_id)
+        self.assertEqual((line.get_name(), line.unit_price), ("Keyboard", 100))
+        self.assertEqual(line.item_total, 200)
+
+
+class SessionCartTests(CartTestCase):
+    """
+    Checks visitors fill a session cart that is merged when they log in
+    """
+
+    def test_session_cart_is_merged_on_login(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 1})
+        url = f"/products/{self.product.id}/"
+        self.client.post(url, {"product": self.product.id, "quantity": 3})
+        self.client.post(url, {"product": self.product.id, "quantity": 2})
+        self.assertEqual(self.client.session["cart"], {str(self.product.id): 5})
+        self.assertEqual(Cart.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 9)
+
+        self.client.post("/", {"email": self.user.email, "password": "Str0ngPassw0rd!"})
+        self.assertNotIn("cart", self.client.session)
+        self.assertEqual(cart.cart_items.get().quantity, 6)
+        self.assertEqual(Cart.objects.get(pk=cart.pk).total_bill, 600)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 4)
+
+    def test_visitors_are_told_about_products_dropped_at_login(self):
+        url = f"/products/{self.product.id}/"
+        self.assertContains(self.client.get(url), "Add to cart")
+        self.client.post(url, {"product": self.product.id, "quantity": 2})
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=0)
+        response = self.client.post(
+            "/", {"email": self.user.email, "password": "Str0ngPassw0rd!"}, follow=True
+        )
+        self.assertContains(response, "no longer available and were removed")
+
+    def test_session_cart_respects_stock(self):
+        url = f"/products/{self.product.id}/"
+        self.client.post(url, {"product": self.product.id, "quantity": 11})
+        self.assertNotIn("cart", self.client.session)
+
+    def test_products_sold_out_during_merge_are_reported(self):
+        other = Product.objects.create(name="Mouse", price=50, stock_quantity=1)
+        request = SimpleNamespace(
+            session={"cart": {str(self.product.id): 2, str(other.id): 1}}
+        )
+        apply_diff = Cart.apply_diff
+
+        def sold_out_once(cart, quantities, user=None, replace=False):
+            if other.id in quantities:
+                Product.objects.filter(pk=other.pk).update(stock_quantity=0)
+                raise OutOfStock(other.id, 1)
+            return apply_diff(cart, quantities, user, replace)
+
+        with mock.patch.object(Cart, "apply_diff", sold_out_once):
+            self.assertEqual(merge_session_cart(request, self.user), {other.id: 1})
+        self.assertEqual(request.session, {})
+        cart = Cart.objects.get(user=self.user, status=OPEN)
+        self.assertEqual(cart.cart_items.get().quantity, 2)
+
+
+class CheckoutTests(CartTestCase):
+    """
+    Checks checkouts are queued and finalized by the worker
+    """
+
+    def setUp(self):
+        super().setUp()
+        token = Token.objects.create(user=self.user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+
+    def test_checkout_is_queued_and_finalized(self):
+        products = [self.product] + [
+            Product.objects.create(name=f"Cable {index}", price=10, stock_quantity=5)
+            for index in range(20)
+        ]
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({product.id: 1 for product in products})
+        # token, open cart, items, then status, history, snapshot and job in
+        # a savepoint
+        with self.assertNumQueries(9):
+            response = self.client.patch("/carts/")
+        self.assertEqual(response.json()["job"]["status"], QUEUED)
+        self.assertEqual(Cart.objects.get(pk=cart.pk).status, PROCESSING)
+        self.assertIsNone(enqueue_checkout(cart))
+        Product.objects.filter(pk=self.product.pk).update(price=150)
+
+        call_command("process_checkouts", "--once", stdout=StringIO())
+        cart = Cart.objects.get(pk=cart.pk)
+        self.assertEqual((cart.status, cart.total_bill), (SUBMITTED, 350))
+        self.assertEqual(cart.checkout_job.status, DONE)
+        self.assertEqual(reconcile_bills(), [])
+        self.product.stats.refresh_from_db()
+        self.assertEqual(self.product.stats.units_sold, 1)
+
+    def test_failed_jobs_are_retried_later(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 1})
+        job = enqueue_checkout(cart)
+        token, job_ids = claim_jobs()
+        self.assertEqual(job_ids, [job.id])
+        self.assertEqual(claim_jobs()[1], [])
+        with mock.patch("carts.checkout.finalize_cart", side_effect=RuntimeError):
+            self.assertEqual(process_job(job.id, token), QUEUED)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (QUEUED, 1))
+        self.assertEqual(claim_jobs()[1], [])
+        CheckoutJob.objects.filter(pk=job.pk).update(run_after=job.created_on)
+        token, job_ids = claim_jobs()
+        self.assertEqual(process_job(job.id, token), DONE)
+        self.assertEqual(queue_metrics()["queued"], 0)
+
+    def test_jobs_whose_worker_keeps_dying_fail(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 1})
+        job = enqueue_checkout(cart)
+        for attempt in range(1, CHECKOUT_MAX_ATTEMPTS + 1):
+            self.assertEqual(claim_jobs()[1], [job.id])
+            # the worker dies without finishing the job
+            CheckoutJob.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+            self.assertEqual(CheckoutJob.objects.get(pk=job.pk).attempts, attempt)
+        self.assertEqual(claim_jobs()[1], [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (FAILED, ""))
+        # the cart is reopened with its units still reserved
+        self.assertEqual(Cart.objects.get(pk=cart.pk).status, OPEN)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 9)
+
+    def test_cart_form_emptied_at_checkout_is_not_queued(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 1})
+        self.client.force_login(self.user)
+        self.client.post(
+            "/carts/detail/",
+            {"product": [self.product.id], "quantity": [0], "is_checkout": "True"},
+        )
+        self.assertEqual(Cart.objects.get(pk=cart.pk).status, OPEN)
+        self.assertFalse(CheckoutJob.objects.exists())
+
+    def test_job_run_again_leaves_the_placed_order_alone(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 1})
+        job = enqueue_checkout(cart)
+        self.assertEqual(process_job(job.id, claim_jobs()[0]), DONE)
+        Product.objects.filter(pk=self.product.pk).update(price=500)
+        # the lease of the finished job expired and another worker runs it
+        CheckoutJob.objects.filter(pk=job.pk).update(status=RUNNING, locked_by="late")
+        self.assertEqual(process_job(job.id, "late"), DONE)
+        cart = Cart.objects.get(pk=cart.pk)
+        self.assertEqual((cart.status, cart.total_bill), (SUBMITTED, 100))
+        self.assertEqual(cart.cart_items.get().item_total, 100)
+
+    def test_failed_checkout_moves_lines_to_the_open_cart(self):
+        other = Product.objects.create(name="Mouse", price=10, stock_quantity=5)
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 2, other.id: 1})
+        job = enqueue_checkout(cart)
+        open_cart = Cart.objects.create(user=self.user)
+        open_cart.apply_diff({self.product.id: 1})
+        token = claim_jobs()[0]
+        error = CheckoutError("Payment refused")
+        with mock.patch("carts.checkout.finalize_cart", side_effect=error):
+            self.assertEqual(process_job(job.id, token), FAILED)
+        self.assertEqual(
+            dict(open_cart.cart_items.values_list("product", "quantity")),
+            {self.product.id: 1, other.id: 1},
+        )
+        self.assertEqual(Cart.objects.get(pk=open_cart.pk).total_bill, 110)
+        self.assertEqual(Cart.objects.get(pk=cart.pk).total_bill, 0)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 9)
+        self.assertEqual(Product.objects.get(pk=other.pk).stock_quantity, 4)
+        self.assertEqual(reconcile_bills(), [])
+
+
+class OrderStatusTests(CartTestCase):
+    """
+    Checks sales managers move orders in bulk along the allowed transitions
+    """
+
+    def test_bulk_transitions(self):
+        manager = User.objects.create_user(
+            "sales@example.com",
+            "Str0ngPassw0rd!",
+            name="Sales",
+            role=Role.objects.get(code=SALES_MANAGER),
+        )
+        token = Token.objects.create(user=manager)
+        carts = [
+            Cart.objects.create(user=self.user, status=SUBMITTED) for _ in range(5)
+        ]
+        open_cart = Cart.objects.create(user=self.user)
+        ids = [cart.id for cart in carts] + [open_cart.id]
+
+        response = self.client.post(
+            "/carts/status/",
+            {"cart_ids": ids, "status": SHIPPED},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Token {token.key}",
+        ).json()
+        self.assertEqual((response["moved"], response["skipped"]), (5, 1))
+        self.assertEqual(Cart.objects.get(pk=open_cart.pk).status, OPEN)
+        chunks = 3
+        # SAVEPOINT, SELECT, UPDATE, history INSERT, rollup upsert and
+        # RELEASE per chunk
+        with self.assertNumQueries(chunks * 6):
+            self.assertEqual(
+                Cart.objects.filter(id__in=ids).transition(DELIVERED, chunk_size=2), 5
+            )
+        self.assertEqual(
+            list(
+                CartStatusChange.objects.filter(cart=carts[0]).values_list(
+                    "from_status", "to_status", "changed_by"
+                )
+            ),
+            [(SUBMITTED, SHIPPED, manager.id), (SHIPPED, DELIVERED, None)],
+        )
+        with self.assertRaises(ValueError):
+            CartStatusChange.objects.first().delete()
+        with self.assertRaises(ValueError):
+            Cart.objects.all().transition(OPEN)
+
+    def test_orders_moved_meanwhile_are_left_alone(self):
+        carts = [
+            Cart.objects.create(user=self.user, status=SUBMITTED) for _ in range(3)
+        ]
+        update = models.QuerySet.update
+
+        def racing_update(queryset, **kwargs):
+            # another request delivers the first order after it was read
+            update(Cart.objects.filter(pk=carts[0].pk), status=DELIVERED)
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(CartQuerySet, "update", racing_update):
+            moved = Cart.objects.filter(id__in=[cart.id for cart in carts]).transition(
+                SHIPPED
+            )
+        self.assertEqual(moved, 2)
+        self.assertEqual(Cart.objects.get(pk=carts[0].pk).status, DELIVERED)
+        self.assertEqual(
+            sorted(
+                CartStatusChange.objects.values_list("cart", "from_status", "to_status")
+            ),
+            [(cart.id, SUBMITTED, SHIPPED) for cart in carts[1:]],
+        )
+
+    def test_customers_cannot_move_orders(self):
+        token = Token.objects.create(user=self.user)
+        cart = Cart.objects.create(user=self.user, status=SUBMITTED)
+        self.client.post(
+            "/carts/status/",
+            {"cart_ids": [cart.id], "status": DELIVERED},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Token {token.key}",
+        )
+        self.assertEqual(Cart.objects.get(pk=cart.pk).status, SUBMITTED)
+
+
+class SalesReportTests(CartTestCase):
+    """
+    Checks the daily rollups follow submitted carts and back the sales report
+    """
+
+    def test_rollups_and_report(self):
+        other = Product.objects.create(name="Mouse", price=50, stock_quantity=10)
+        for quantity in (1, 2):
+            cart = Cart.objects.create(user=self.user)
+            cart.apply_diff({self.product.id: quantity, other.id: 1})
+            cart.submit()
+        Cart.objects.filter(pk=cart.pk).transition(DELIVERED)
+        today = timezone.localdate()
+        expected = [(today, self.product.id, "Keyboard", 300, 3, 2)]
+        expected.append((today, other.id, "Mouse", 100, 2, 2))
+        rows = DailyProductSales.objects.order_by("-revenue").values_list(
+            "day", "product_id", "product_name", "revenue", "units", "orders"
+        )
+        self.assertEqual(list(rows), expected)
+        self.assertEqual(rebuild_rollups(chunk_size=1), 2)
+        self.assertEqual(list(rows), expected)
+
+        manager = User.objects.create_user(
+            "sales@example.com",
+            "Str0ngPassw0rd!",
+            name="Sales",
+            role=Role.objects.get(code=SALES_MANAGER),
+        )
+        token = Token.objects.create(user=manager)
+        params = {"start": today, "end": today, "product": other.id}
+        # token, role, totals, days, products and days of the product
+        with self.assertNumQueries(6):
+            report = self.client.get(
+                "/carts/reports/sales/",
+                params,
+                HTTP_AUTHORIZATION=f"Token {token.key}",
+            ).json()
+        self.assertEqual(
+            report["totals"],
+            {"revenue": "400.00", "units": 5, "orders": 2, "delivered": 1, "days": 1},
+        )
+        self.assertEqual(report["products"][0]["product_name"], "Keyboard")
+        self.assertEqual(report["product_days"][0]["revenue"], "100.00")
+
+    def test_rebuild_keeps_sales_of_deleted_products(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({self.product.id: 2})
+        cart.submit()
+        product_id = self.product.id
+        self.product.delete()
+        self.assertEqual(rebuild_rollups(), 1)
+        self.assertEqual(
+            list(DailySales.objects.values_list("revenue", "units", "orders")),
+            [(200, 2, 1)],
+        )
+        self.assertEqual(
+            list(DailyProductSales.objects.values_list("product_id", "product_name")),
+            [(product_id, "Keyboard")],
+        )
+
+
+class EmptyCartTests(CartTestCase):
+    """
+    Checks emptying a cart costs the same number of queries for any size
+    """
+
+    def test_empty_restores_stock_with_set_based_queries(self):
+        products = [self.product] + [
+            Product.objects.create(name=f"Cable {index}", price=10, stock_quantity=5)
+            for index in range(20)
+        ]
+        cart = Cart.objects.create(user=self.user)
+        cart.apply_diff({product.id: 5 for product in products})
+        submitted = Cart.objects.create(user=self.user, status=SUBMITTED)
+        CartItem.objects.create(cart=submitted, product=self.product, quantity=1)
+        with self.assertNumQueries(7):
+            self.assertEqual(Cart.objects.filter(user=self.user).empty(), 1)
+        self.assertFalse(cart.cart_items.exists())
+        self.assertEqual(Cart.objects.get(pk=cart.pk).total_bill, 0)
+        self.assertEqual(reconcile_bills(), [])
+        self.assertEqual(
+            sorted(
+                Product.objects.filter(
+                    pk__in=[product.id for product in products]
+                ).values_list("stock_quantity", flat=True)
+            ),
+            [5] * 20 + [9],
+        )
+
+
+class AbandonedCartTests(CartTestCase):
+    """
+    Checks abandoned carts give their units back in bounded batches
+    """
+
+    def test_sweep_releases_stock_of_idle_open_carts(self):
+        cables = [
+            Product.objects.create(name=f"Cable {index}", price=10, stock_quantity=5)
+            for index in range(3)
+        ]
+        abandoned = []
+        for index in range(3):
+            user = User.objects.create_user(
+                f"visitor{index}@example.com", "Str0ngPassw0rd!", name="Visitor"
+            )
+            cart = Cart.objects.create(user=user)
+            cart.apply_diff({self.product.id: 1, cables[index].id: 2})
+            abandoned.append(cart.pk)
+        recent = Cart.objects.create(user=self.user)
+        recent.apply_diff({self.product.id: 3})
+        submitted = Cart.objects.create(user=self.user, status=SUBMITTED)
+        CartItem.objects.create(cart=submitted, product=self.product, quantity=1)
+        Cart.objects.exclude(pk=recent.pk).update(
+            updated_on=timezone.now() - timedelta(days=4)
+        )
+        out = StringIO()
+        call_command("sweep_abandoned_carts", "--batch-size", "2", stdout=out)
+        self.assertIn("Emptied 3 carts, released 9 units of 6 items", out.getvalue())
+        self.assertFalse(CartItem.objects.filter(cart__in=abandoned).exists())
+        self.assertEqual(recent.cart_items.get().quantity, 3)
+        self.assertTrue(submitted.cart_items.exists())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 6)
+        self.assertEqual(
+            list(
+                Product.objects.filter(pk__in=[cable.id for cable in cables])
+                .values_list("stock_quantity", flat=True)
+                .distinct()
+            ),
+            [5],
+        )
+        self.assertEqual(reconcile_bills(), [])
+        self.assertEqual(list(sweep_abandoned_carts(timedelta(days=3))), [])
+
+    def test_sweep_stops_after_max_batches(self):
+        for index in range(3):
+            user = User.objects.create_user(
+                f"visitor{index}@example.com", "Str0ngPassw0rd!", name="Visitor"
+            )
+            Cart.objects.create(user=user).apply_diff({self.product.id: 1})
+        Cart.objects.update(updated_on=timezone.now() - timedelta(days=4))
+        batches = list(
+            sweep_abandoned_carts(timedelta(days=3), batch_size=1, max_batches=2)
+        )
+        self.assertEqual([batch["carts"] for batch in batches], [1, 1])
+        self.assertEqual(Cart.objects.abandoned(timedelta(days=3)).count(), 1)
+
+
+class IdempotencyTests(CartTestCase):
+    """
+    Checks cart changes sent again with the same key are made once
+    """
+
+    def setUp(self):
+        super().setUp()
+        token = Token.objects.create(user=self.user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+
+    def add_to_cart(self, key, quantity=2):
+        """
+        Adds the product to the cart with an idempotency key
+        Args:
+            key(str): Value containing idempotency key
+            quantity(int): Value containing units to add
+        Returns:
+            (Response): Value containing response of the view
+        """
+        return self.client.post(
+            "/carts/",
+            {"product": self.product.id, "quantity": quantity},
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_response_without_adding_again(self):
+        first = self.add_to_cart("add-1")
+        # token, the insert refused by the key constraint and the key read,
+        # with the savepoints around them
+        with self.assertNumQueries(8):
+            retry = self.add_to_cart("add-1")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        self.assertEqual(Product.objects.get().stock_quantity, 8)
+        self.add_to_cart("add-2")
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+
+    def test_retry_with_new_multipart_boundary_is_replayed(self):
+        first = self.add_to_cart("add-1")
+        retry = self.client.post(
+            "/carts/",
+            encode_multipart(
+                "OtherBoundary", {"product": self.product.id, "quantity": 2}
+            ),
+            content_type="multipart/form-data; boundary=OtherBoundary",
+            HTTP_IDEMPOTENCY_KEY="add-1",
+        )
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self.add_to_cart("add-1")
+        response = self.add_to_cart("add-1", quantity=3)
+        self.assertEqual(response.json()["status_code"], 422)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_expired_keys_run_again_and_are_purged(self):
+        self.add_to_cart("add-1")
+        IdempotencyKey.objects.update(expires_on=timezone.now())
+        self.add_to_cart("add-1")
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+        IdempotencyKey.objects.update(expires_on=timezone.now())
+        IdempotencyKey.objects.bulk_create(
+            IdempotencyKey(
+                user=self.user,
+                key=f"old-{index}",
+                expires_on=timezone.now() - timedelta(days=1),
+            )
+            for index in range(4)
+        )
+        with self.assertNumQueries(6):
+            self.assertEqual(purge_expired_keys(batch_size=2), 5)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class StockReservationTests(TransactionTestCase):
+    """
+    Hammers the stock of one product from many threads at once
+    """
+
+    serialized_rollback = True
+    threads = 8
+    attempts = 10
+    stock = 25
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name="Keyboard", price=100, stock_quantity=self.stock
+        )
+        self.users = [
+            User.objects.create_user(
+                f"customer{index}@example.com", "Str0ngPassw0rd!", name="Customer"
+            )
+            for index in range(self.threads)
+        ]
+
+    def hammer(self, buy):
+        """
+        Runs buy attempts times in every thread, all starting together
+        Args:
+            buy(callable): Value containing function taking the thread index
+        Returns:
+            (int): Value containing number of successful buys
+        """
+        barrier = threading.Barrier(self.threads)
+        successes = []
+
+        def worker(index):
+            barrier.wait()
+            try:
+                attempts = self.attempts
+                while attempts:
+                    try:
+                        buy(index)
+                        successes.append(index)
+                    except OutOfStock:
+                        pass
+                    except OperationalError as error:
+                        # the in memory SQLite test database reports lock
+                        # contention instead of waiting, the attempt rolled
+                        # back as a whole so it is simply tried again
+                        if "locked" not in str(error):
+                            raise
+                        time.sleep(0.001)
+                        continue
+                    attempts -= 1
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=worker, args=(index,))
+            for index in range(self.threads)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return len(successes)
+
+    def test_reservations_never_oversell(self):
+        def buy(_):
+            with transaction.atomic():
+                reserve_stock(self.product.id, 1)
+
+        self.assertEqual(self.hammer(buy), self.stock)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 0)
+
+    def test_cart_items_never_oversell(self):
+        carts = [Cart.objects.create(user=user) for user in self.users]
+
+        def buy(index):
+            item = carts[index].cart_items.filter(product=self.product).first()
+            if item is None:
+                CartItem.objects.create(
+                    cart=carts[index], product=self.product, quantity=1
+                )
+            else:
+                item.quantity += 1
+                item.save()
+
+        sold = self.hammer(buy)
+        self.product.refresh_from_db()
+        reserved = CartItem.objects.aggregate(total=Sum("quantity"))["total"]
+        self.assertEqual(sold, self.stock)
+        self.assertEqual(reserved, self.stock)
+        self.assertEqual(self.product.stock_quantity, 0)
+
+
+class CartConditionalGetTests(TestCase):
+    """
+    Checks cart reads answer 304 Not Modified until the cart changes
+    """
+
+    def test_cart_list(self):
+        user = User.objects.create_user(
+            "customer@example.com", "Str0ngPassw0rd!", name="Customer"
+        )
+        token = Token.objects.create(user=user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+        keyboard = Product.objects.create(name="Keyboard", price=100, stock_quantity=10)
+        mouse = Product.objects.create(name="Mouse", price=10, stock_quantity=10)
+        cart = Cart.objects.create(user=user, created_by=user)
+        CartItem.objects.create(cart=cart, product=keyboard, created_by=user)
+        etag = self.client.get("/carts/")["ETag"]
+        self.assertEqual(
+            self.client.get("/carts/", HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.client.post("/carts/", {"product": mouse.id, "quantity": 1})
+        response = self.client.get("/carts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["cart_details"][0]["total_bill"], "110.00")
+
+    def test_cart_list_follows_its_products(self):
+        user = User.objects.create_user(
+            "customer@example.com", "Str0ngPassw0rd!", name="Customer"
+        )
+        token = Token.objects.create(user=user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+        product = Product.objects.create(name="Keyboard", price=100, stock_quantity=10)
+        Cart.objects.create(user=user).apply_diff({product.id: 1})
+        response = self.client.get("/carts/")
+        price = response.json()["cart_details"][0]["items"][0]["product"]["price"]
+        # a bulk price change skips Product.save and the catalog version
+        Product.objects.filter(pk=product.pk).update(
+            price=120, updated_on=timezone.now()
+        )
+        response = self.client.get("/carts/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(
+            response.json()["cart_details"][0]["items"][0]["product"]["price"], price
+        )
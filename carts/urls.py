@@ -9,5 +9,8 @@ urlpatterns = [
     path("", views.CartsAPIView.as_view(), name="cart_api"),
     path("detail/", views.TemplateCartsAPIView.as_view(), name="cart"),
     path("orders/", views.TemplateViewCarts.as_view(), name="orders"),
+    path("orders/api/", views.OrdersAPIView.as_view(), name="orders_api"),
+    path("status/", views.CartStatusAPIView.as_view(), name="cart_status_api"),
+    path("reports/sales/", views.SalesReportAPIView.as_view(), name="sales_report_api"),
     path("<int:item_pk>/", views.CartsAPIView.as_view(), name="cart_item_api"),
 ]
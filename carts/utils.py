@@ -0,0 +1,175 @@
+"""
+Contains function that do specific tasks and can be reused
+"""
+import time
+
+from django.db import transaction
+from django.db.models import (
+    Count,
+    DecimalField,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    prefetch_related_objects,
+)
+from django.db.models.functions import Coalesce
+
+from products.cache import get_catalog_version
+from products.utils import aggregate_state, decode_cursor, encode_cursor
+
+from .constants import OPEN, ORDERS_PAGE_SIZE, RECONCILE_CHUNK_SIZE, SWEEP_BATCH_SIZE
+from .models import Cart, CartItem
+
+
+def cart_state(request, item_pk=None):
+    """
+    Returns validators of the carts of the requesting user. The carts are
+    served with a card of the product of every item, so the state also moves
+    when one of those products changes, and with the catalog version, which
+    moves when a product is deleted.
+    Args:
+        request(HttpRequest): Value containing request data
+        item_pk(int): Value containing primary key of a cart
+    Returns:
+        (tuple): Value containing etag and last modified datetime
+    """
+    carts = Cart.objects.filter(user=request.user)
+    if item_pk:
+        carts = carts.filter(pk=item_pk)
+    return aggregate_state(
+        carts,
+        request.user.id,
+        item_pk or "",
+        get_catalog_version(),
+        fields=("updated_on", "cart_items__product__updated_on"),
+    )
+
+
+def item_totals():
+    """
+    Returns an expression summing the item totals of the outer cart
+    Returns:
+        (Coalesce): Value containing sum of item totals, 0 for empty carts
+    """
+    total = (
+        CartItem.objects.filter(cart=OuterRef("pk"))
+        .order_by()
+        .values("cart")
+        .annotate(total=Sum("item_total"))
+        .values("total")
+    )
+    return Coalesce(
+        Subquery(total),
+        Value(0),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def reconcile_bills(fix=False, chunk_size=RECONCILE_CHUNK_SIZE):
+    """
+    Compares the stored bill of every cart with the sum of its item totals,
+    one query per chunk of carts, and optionally corrects the differences
+    Args:
+        fix(bool): Value telling to overwrite mismatched bills
+        chunk_size(int): Value containing number of carts checked at once
+    Returns:
+        (list): Value containing (cart id, stored bill, item totals) tuples
+    """
+    mismatched = []
+    cart_ids = Cart.objects.order_by("id").values_list("id", flat=True)
+    chunk = list(cart_ids[:chunk_size])
+    while chunk:
+        rows = list(
+            Cart.objects.filter(id__gte=chunk[0], id__lte=chunk[-1])
+            .annotate(actual=item_totals())
+            .exclude(total_bill=F("actual"))
+            .order_by("id")
+            .values_list("id", "total_bill", "actual")
+        )
+        if fix and rows:
+            Cart.objects.filter(id__in=[row[0] for row in rows]).update(
+                total_bill=item_totals()
+            )
+        mismatched.extend(rows)
+        chunk = list(cart_ids.filter(id__gt=chunk[-1])[:chunk_size])
+    return mismatched
+
+
+def sweep_abandoned_carts(idle_for, batch_size=SWEEP_BATCH_SIZE, max_batches=None):
+    """
+    Empties open carts that were not changed for a while and puts their units
+    back in stock, one batch of carts per transaction. Carts are locked while
+    they are emptied and carts locked by a request are left for the next run.
+    Args:
+        idle_for(timedelta): Value containing time after which a cart is abandoned
+        batch_size(int): Value containing number of carts emptied at once
+        max_batches(int): Value containing number of batches to run at most,
+            until no abandoned cart is left if not given
+    Yields:
+        (dict): Value containing batch number, carts emptied, items removed,
+            units put back in stock and seconds taken by the batch
+    """
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        started = time.monotonic()
+        with transaction.atomic():
+            cart_ids = list(
+                Cart.objects.abandoned(idle_for)
+                .select_for_update(skip_locked=True)
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not cart_ids:
+                return
+            totals = CartItem.objects.filter(cart__in=cart_ids).aggregate(
+                items=Count("id"), units=Coalesce(Sum("quantity"), 0)
+            )
+            emptied = Cart.objects.filter(pk__in=cart_ids).empty()
+        batches += 1
+        yield {
+            "batch": batches,
+            "carts": emptied,
+            **totals,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        if len(cart_ids) < batch_size:
+            return
+
+
+def paginate_orders(user, cursor=None, page_size=ORDERS_PAGE_SIZE):
+    """
+    Returns one page of the submitted carts of a user, newest first, using
+    keyset pagination on (created_on, id). The items of the page are loaded
+    with one more query that reads their snapshots without joining the
+    products, so every page costs the same.
+    Args:
+        user(User): Value containing owner of the orders
+        cursor(str): Value containing cursor of the previous page, if any
+        page_size(int): Value containing number of orders per page
+    Returns:
+        (tuple): Value containing list of carts and cursor of next page
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    queryset = (
+        Cart.objects.filter(user=user)
+        .exclude(status=OPEN)
+        .order_by("-created_on", "-id")
+    )
+    if cursor:
+        created_on, cart_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_on__lt=created_on) | Q(created_on=created_on, id__lt=cart_id)
+        )
+    carts = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(carts) > page_size:
+        carts = carts[:page_size]
+        next_cursor = encode_cursor(carts[-1])
+    prefetch_related_objects(
+        carts, Prefetch("cart_items", queryset=CartItem.objects.order_by("id"))
+    )
+    return carts, next_cursor
@@ -2,30 +2,53 @@
 Views for carts app
 """
 # pylint: disable= no-self-use, no-member
-from django.db.models import Q
+from django.db.models import Count, Max, Sum, prefetch_related_objects
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.decorators import method_decorator
 from rest_framework import status
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from products.models import Product
+from products.stock import OutOfStock
+from products.utils import conditional_on
 from users.contants import HOME_PAGE_URL
 
-from .constants import OPEN, SUBMITTED
-from .serializers import Cart, CartItem, CartItemSerializer, CartSerializer
+from .checkout import enqueue_checkout
+from .constants import OPEN, REPORT_TOP_PRODUCTS
+from .idempotency import idempotent
+from .managers import items_prefetch
+from .models import DailyProductSales, DailySales
+from .permissions import IsSalesManager
+from .serializers import (
+    Cart,
+    CartDetailSerializer,
+    CartDiffSerializer,
+    CartItem,
+    CartItemSerializer,
+    CartTransitionSerializer,
+    DailyProductSalesSerializer,
+    DailySalesSerializer,
+    OrderSerializer,
+    SalesReportSerializer,
+)
+from .utils import cart_state, paginate_orders
 
 
 class CartsAPIView(APIView):
     """
     Carts APIView allows a user to add to cart, update a cart item, remove a cart item,
-    view all or one cart item and clear all the cart items
+    view all or one cart item and clear all the cart items. Changes sent with an
+    Idempotency-Key header are made once and replayed on retries.
     """
 
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(idempotent)
     def post(self, request):
         """
         Adds a cart_item to cart
@@ -35,21 +58,32 @@ class CartsAPIView(APIView):
             (Response): Value containing information about operation status
         """
         user = request.user
-        cart = Cart.objects.get_or_create(user=user, status=OPEN, created_by=user)[0]
+        cart = Cart.objects.get_or_create(
+            user=user, status=OPEN, defaults={"created_by": user}
+        )[0]
         data = request.data.copy()
         data["cart"] = cart.id
         data["created_by"] = user.id
         serializer = CartItemSerializer(data=data)
         if serializer.is_valid():
-            serializer.save(created_by=user)
+            try:
+                serializer.save(created_by=user)
+            except OutOfStock as error:
+                return Response(
+                    {
+                        "message": "There was a problem adding to cart",
+                        "status_code": status.HTTP_400_BAD_REQUEST,
+                        "errors": {"non_field_errors": [str(error)]},
+                    }
+                )
+            cart = serializer.instance.cart
+            prefetch_related_objects([cart], items_prefetch())
             return Response(
                 {
                     "message": "Product added to cart successfuly",
-                    "Cart details": CartSerializer(
-                        Cart.objects.get(user=user, status=OPEN)
-                    ).data,
+                    "Cart details": CartDetailSerializer(cart).data,
                     "CartItems": CartItemSerializer(
-                        CartItem.objects.filter(cart=cart), many=True
+                        cart.cart_items.all(), many=True
                     ).data,
                     "status_code": status.HTTP_200_OK,
                 }
@@ -63,6 +97,7 @@ class CartsAPIView(APIView):
             }
         )
 
+    @method_decorator(conditional_on(cart_state))
     def get(self, request, item_pk=None):
         """
         Returns all the cart_items or one cart_item in the cart
@@ -73,13 +108,13 @@ class CartsAPIView(APIView):
             (Response): Value containing information about operation status
         """
         try:
-            carts = Cart.objects.filter(user=request.user)
+            carts = Cart.objects.filter(user=request.user).with_items()
             if item_pk:
-                cart = get_object_or_404(Cart, user=request.user, pk=item_pk)
+                cart = get_object_or_404(carts, pk=item_pk)
                 return Response(
                     {
                         "message": "Item retrieved successfully.",
-                        "cart_detail": CartSerializer(cart).data,
+                        "cart_detail": CartDetailSerializer(cart).data,
                         "items": CartItemSerializer(
                             cart.cart_items.all(), many=True
                         ).data,
@@ -89,7 +124,7 @@ class CartsAPIView(APIView):
             return Response(
                 {
                     "message": "Items retrieved successfully.",
-                    "cart_details": CartSerializer(carts, many=True).data,
+                    "cart_details": CartDetailSerializer(carts, many=True).data,
                     "status_code": status.HTTP_200_OK,
                 }
             )
@@ -101,9 +136,11 @@ class CartsAPIView(APIView):
                 }
             )
 
+    @method_decorator(idempotent)
     def patch(self, request):
         """
-        Submits a cart
+        Submits a cart. The cart is queued for checkout and finalized by the
+        process_checkouts worker.
         Args:
             request(HttpRequest): Value containing request data
         Returns:
@@ -119,18 +156,15 @@ class CartsAPIView(APIView):
         try:
 
             cart = get_object_or_404(Cart, user=request.user, status=OPEN)
-            if cart.cart_items:
-                serializer = CartSerializer(
-                    cart, data={"status": SUBMITTED}, partial=True
+            job = cart.cart_items.exists() and enqueue_checkout(cart)
+            if job:
+                return Response(
+                    {
+                        "message": "Order submitted successfully",
+                        "job": {"id": job.id, "status": job.status},
+                        "status_code": status.HTTP_200_OK,
+                    }
                 )
-                if serializer.is_valid():
-                    serializer.save()
-                    return Response(
-                        {
-                            "message": "Order submitted successfully",
-                            "status_code": status.HTTP_200_OK,
-                        }
-                    )
             return Response(
                 {"message": "Cart is empty", "status_code": status.HTTP_400_BAD_REQUEST}
             )
@@ -143,15 +177,18 @@ class CartsAPIView(APIView):
                 }
             )
 
-    def put(self, request, item_pk):
+    @method_decorator(idempotent)
+    def put(self, request, item_pk=None):
         """
-        Updates a cart_item in cart
+        Updates a cart_item in cart, or many items at once when no item is given
         Args:
             request(HttpRequest): Value containing request data
             item_pk(int): Value containing primary key of a cart_item
         Returns:
             (Response): Value containing information about operation status
         """
+        if item_pk is None:
+            return self.apply_diff(request)
         try:
             cart = get_object_or_404(Cart, user=request.user, status=OPEN)
             data = request.data.copy()
@@ -159,7 +196,16 @@ class CartsAPIView(APIView):
             cart_item = get_object_or_404(CartItem, pk=item_pk)
             cart_item_serializer = CartItemSerializer(cart_item, data=data)
             if cart_item_serializer.is_valid():
-                cart_item_serializer.save()
+                try:
+                    cart_item_serializer.save()
+                except OutOfStock as error:
+                    return Response(
+                        {
+                            "message": "There was a problem in updating the cart item.",
+                            "errors": {"non_field_errors": [str(error)]},
+                            "status_code": status.HTTP_400_BAD_REQUEST,
+                        }
+                    )
                 return Response(
                     {
                         "message": "Product updated successfully",
@@ -184,6 +230,54 @@ class CartsAPIView(APIView):
                 }
             )
 
+    def apply_diff(self, request):
+        """
+        Sets the quantities of many products of the open cart in one
+        transaction. Quantity 0 removes a product and replace removes every
+        product that is not listed.
+        Args:
+            request(HttpRequest): Value containing items and replace flag
+        Returns:
+            (Response): Value containing information about operation status
+        """
+        serializer = CartDiffSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    "message": "There was a problem in updating the cart.",
+                    "errors": serializer.errors,
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        user = request.user
+        cart = Cart.objects.get_or_create(
+            user=user, status=OPEN, defaults={"created_by": user}
+        )[0]
+        quantities = {
+            item["product"]: item["quantity"]
+            for item in serializer.validated_data["items"]
+        }
+        try:
+            cart.apply_diff(quantities, user, serializer.validated_data["replace"])
+        except (OutOfStock, Product.DoesNotExist) as error:
+            return Response(
+                {
+                    "message": "There was a problem in updating the cart.",
+                    "errors": {"non_field_errors": [str(error)]},
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        prefetch_related_objects([cart], items_prefetch())
+        return Response(
+            {
+                "message": "Cart updated successfully",
+                "Cart details": CartDetailSerializer(cart).data,
+                "CartItems": CartItemSerializer(cart.cart_items.all(), many=True).data,
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+    @method_decorator(idempotent)
     def delete(self, request, item_pk=None):
         """
         Delete a cart_item or all items from cart
@@ -206,8 +300,7 @@ class CartsAPIView(APIView):
                         "status_code": status.HTTP_200_OK,
                     }
                 )
-            for item in cart.cart_items.all():
-                item.delete()
+            cart.empty()
             return Response(
                 {
                     "message": "Cart emptied successfully",
@@ -266,26 +359,34 @@ class TemplateCartsAPIView(APIView):
             (render): Value containing template data to display
         """
         if request.user.is_authenticated:
-            context = {
-                "cart_items": get_object_or_404(
-                    Cart, user=request.user, status=OPEN
-                ).cart_items.all()
-            }
             cart = get_object_or_404(Cart, user=request.user, status=OPEN)
-            old_cart_items = cart.cart_items.all()
             product_ids = request.POST.getlist("product")
             product_quantities = request.POST.getlist("quantity")
-            for item in old_cart_items:
-                if str(item.product.id) in product_ids:
-                    item.quantity = int(
-                        product_quantities[product_ids.index(str(item.product.id))]
-                    )
-                    item.save()
-                else:
-                    item.delete()
-            if request.POST["is_checkout"] == "True" and len(product_ids) > 0:
-                cart.status = SUBMITTED
-                cart.save()
+            message = None
+            # the form only changes or removes the products already in the cart
+            in_cart = set(cart.cart_items.values_list("product", flat=True))
+            try:
+                quantities = dict(
+                    zip(map(int, product_ids), map(int, product_quantities))
+                )
+                cart.apply_diff(
+                    {
+                        product_id: quantity
+                        for product_id, quantity in quantities.items()
+                        if product_id in in_cart
+                    },
+                    request.user,
+                    replace=True,
+                )
+            except OutOfStock:
+                message = "Some products do not have enough stock left."
+            except (Product.DoesNotExist, ValueError):
+                message = "Please enter valid quantities."
+            if message:
+                context = {"cart_items": cart.cart_items.all(), "message": message}
+                return render(request, "cart_detail.html", context)
+            if request.POST["is_checkout"] == "True" and cart.cart_items.exists():
+                enqueue_checkout(cart)
                 return redirect(HOME_PAGE_URL)
             return redirect("/carts/detail")
         context = {"error_message": "You are not logged in. Please log in."}
@@ -301,16 +402,169 @@ class TemplateViewCarts(APIView):
 
     def get(self, request):
         """
-        Renders a page containing previous orders of the user
+        Renders a page of previous orders of the user, newest first
         Args:
             request(HttpRequest): Value containing request data
         Returns:
             (render): Value containing template data to display
         """
-
-        carts = Cart.objects.filter(~Q(status=OPEN), user=request.user)
-        if carts.exists():
-            context = {"carts": carts}
+        if not request.user.is_authenticated:
+            context = {"error_message": "You are not logged in. Please log in."}
+            return render(request, "orders.html", context)
+        try:
+            carts, next_cursor = paginate_orders(
+                request.user, request.query_params.get("cursor")
+            )
+        except ValueError:
+            context = {"error_message": "This page of orders does not exist"}
+            return render(request, "orders.html", context)
+        if carts:
+            context = {
+                "carts": carts,
+                "next_cursor": next_cursor,
+                "is_first_page": not request.query_params.get("cursor"),
+            }
             return render(request, "orders.html", context)
         context = {"error_message": "You do not have any previous orders"}
         return render(request, "orders.html", context)
+
+
+class OrdersAPIView(APIView):
+    """
+    Returns the order history of the user a page at a time
+    """
+
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Returns a page of previous orders after the given cursor, newest first
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (Response): Value containing orders and cursor of next page
+        """
+        try:
+            carts, next_cursor = paginate_orders(
+                request.user, request.query_params.get("cursor")
+            )
+        except ValueError:
+            return Response(
+                {
+                    "message": "Invalid cursor",
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        return Response(
+            {
+                "message": "Orders retrieved successfully.",
+                "orders": OrderSerializer(carts, many=True).data,
+                "next_cursor": next_cursor,
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+
+class CartStatusAPIView(APIView):
+    """
+    Allows sales managers to move many orders to a new status at once
+    """
+
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [IsSalesManager]
+
+    def post(self, request):
+        """
+        Moves the listed orders that are allowed to go to the given status
+        Args:
+            request(HttpRequest): Value containing cart_ids and status
+        Returns:
+            (Response): Value containing number of orders moved and skipped
+        """
+        serializer = CartTransitionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    "message": "There was a problem in updating the orders.",
+                    "errors": serializer.errors,
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        cart_ids = set(serializer.validated_data["cart_ids"])
+        moved = Cart.objects.filter(id__in=cart_ids).transition(
+            serializer.validated_data["status"], request.user
+        )
+        return Response(
+            {
+                "message": "Orders updated successfully",
+                "moved": moved,
+                "skipped": len(cart_ids) - moved,
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+
+class SalesReportAPIView(APIView):
+    """
+    Allows sales managers to read sales per day and per product
+    """
+
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [IsSalesManager]
+
+    def get(self, request):
+        """
+        Returns the sales of every day between start and end, the best selling
+        products of the range and, when product is given, its sales per day.
+        Everything is read from the daily rollups.
+        Args:
+            request(HttpRequest): Value containing start, end and product
+        Returns:
+            (Response): Value containing days, products and totals
+        """
+        serializer = SalesReportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    "message": "There was a problem in reading the report.",
+                    "errors": serializer.errors,
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        dates = (serializer.validated_data["start"], serializer.validated_data["end"])
+        days = DailySales.objects.filter(day__range=dates).order_by("day")
+        product_days = DailyProductSales.objects.filter(day__range=dates)
+        products = (
+            product_days.values("product_id")
+            .annotate(
+                product_name=Max("product_name"),
+                revenue=Sum("revenue"),
+                units=Sum("units"),
+                orders=Sum("orders"),
+            )
+            .order_by("-revenue", "product_id")[:REPORT_TOP_PRODUCTS]
+        )
+        totals = days.aggregate(
+            revenue=Sum("revenue"),
+            units=Sum("units"),
+            orders=Sum("orders"),
+            delivered=Sum("delivered"),
+            days=Count("id"),
+        )
+        totals["revenue"] = f"{totals['revenue'] or 0:.2f}"
+        response = {
+            "message": "Report retrieved successfully.",
+            "totals": totals,
+            "days": DailySalesSerializer(days, many=True).data,
+            "products": DailyProductSalesSerializer(products, many=True).data,
+            "status_code": status.HTTP_200_OK,
+        }
+        if "product" in serializer.validated_data:
+            response["product_days"] = DailyProductSalesSerializer(
+                product_days.filter(
+                    product_id=serializer.validated_data["product"]
+                ).order_by("day"),
+                many=True,
+            ).data
+        return Response(response)
@@ -3,6 +3,7 @@ Admin settings for product app
 """
 from django.contrib import admin
 
+from products.images import schedule_variants
 from products.models import Product
 
 
@@ -22,6 +23,8 @@ class ProductAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         obj.save(created_by=request.user)
+        if "image" in form.changed_data:
+            schedule_variants(obj)
 
 
 admin.site.register(Product, ProductAdmin)
@@ -0,0 +1,121 @@
+"""
+Versioned cache of rendered catalog fragments
+
+Every cached fragment key contains the current catalog version, so bumping the
+version invalidates all fragments at once without deleting any keys.
+"""
+import time
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from products.constants import (
+    CACHE_HITS_KEY,
+    CACHE_MISSES_KEY,
+    CATALOG_CACHE_TIMEOUT,
+    CATALOG_VERSION_KEY,
+    SALES_VERSION_KEY,
+)
+
+
+def get_catalog_version(key=CATALOG_VERSION_KEY):
+    """
+    Returns the current catalog version, initialising it when missing
+    Args:
+        key(str): Value containing cache key of the version
+    Returns:
+        (int): Value containing catalog version
+    """
+    version = cache.get(key)
+    if version is None:
+        # Seeding from the clock keeps versions increasing even when the key
+        # gets evicted, so stale fragments are never served again.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_catalog_version(key=CATALOG_VERSION_KEY):
+    """
+    Moves the catalog to a new version, invalidating every cached fragment
+    Args:
+        key(str): Value containing cache key of the version
+    Returns:
+        (int): Value containing new catalog version
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+        return get_catalog_version(key)
+
+
+def bump_sales_version():
+    """
+    Moves the sales figures to a new version. Only markup ordered by
+    popularity varies on it, so submitting a cart leaves the rest of the
+    cached catalog intact.
+    Returns:
+        (int): Value containing new sales version
+    """
+    return bump_catalog_version(SALES_VERSION_KEY)
+
+
+def _count(key):
+    """
+    Increments a shared counter
+    Args:
+        key(str): Value containing counter key
+    Returns:
+        None
+    """
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_versioned(name, vary_on, render):
+    """
+    Returns a cached value of the current catalog version, computing and
+    storing it on a miss
+    Args:
+        name(str): Value containing fragment or value name
+        vary_on(list): Value containing values the result depends on
+        render(callable): Value containing function computing the value
+    Returns:
+        (object): Value containing rendered fragment or computed value
+    """
+    key = make_template_fragment_key(f"{name}:{get_catalog_version()}", vary_on)
+    fragment = cache.get(key)
+    if fragment is None:
+        _count(CACHE_MISSES_KEY)
+        fragment = render()
+        cache.set(key, fragment, CATALOG_CACHE_TIMEOUT)
+    else:
+        _count(CACHE_HITS_KEY)
+    return fragment
+
+
+def get_cache_stats():
+    """
+    Returns the fragment cache hit and miss counters
+    Returns:
+        (dict): Value containing hits, misses and catalog version
+    """
+    stats = cache.get_many([CACHE_HITS_KEY, CACHE_MISSES_KEY])
+    return {
+        "hits": stats.get(CACHE_HITS_KEY, 0),
+        "misses": stats.get(CACHE_MISSES_KEY, 0),
+        "version": get_catalog_version(),
+    }
+
+
+def reset_cache_stats():
+    """
+    Sets the hit and miss counters back to zero
+    Returns:
+        None
+    """
+    cache.set_many({CACHE_HITS_KEY: 0, CACHE_MISSES_KEY: 0}, None)
@@ -4,3 +4,74 @@ Contains values which dont change during runtime
 # Product images path
 IMAGES_PATH = "product_images/"
 DEFAULT_PRODUCT_IMAGE = "product_image.png"
+
+# Number of products rendered per homepage page
+HOMEPAGE_PAGE_SIZE = 20
+# Separates the fields of a pagination cursor
+CURSOR_SEPARATOR = "|"
+
+# Full text search index over product names and descriptions
+SEARCH_TABLE = "products_product_fts"
+SEARCH_RESULTS_LIMIT = 50
+# bm25 weights of the name and description columns
+SEARCH_NAME_WEIGHT = 10.0
+SEARCH_DESCRIPTION_WEIGHT = 1.0
+SEARCH_INDEX_CHUNK_SIZE = 2000
+
+# Versioned fragment cache of rendered catalog markup
+CATALOG_VERSION_KEY = "catalog_version"
+CATALOG_CACHE_TIMEOUT = 60 * 10
+CACHE_HITS_KEY = "catalog_cache_hits"
+CACHE_MISSES_KEY = "catalog_cache_misses"
+
+# Responsive image variants built in the background after an upload
+IMAGE_VARIANTS_PATH = f"{IMAGES_PATH}variants/"
+IMAGE_VARIANT_WIDTHS = (320, 640, 1024)
+IMAGE_VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = 2
+
+# Bulk import and export of products
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+BULK_FIELDS = ["sku", "name", "description", "price", "stock_quantity"]
+CSV_FORMAT = "csv"
+JSONL_FORMAT = "jsonl"
+BULK_FORMATS = (CSV_FORMAT, JSONL_FORMAT)
+
+# Product API filtering, ordering and faceting
+PRODUCT_API_PAGE_SIZE = 20
+PRODUCT_API_MAX_PAGE_SIZE = 100
+PRODUCT_ORDERINGS = {
+    "price": ("price", "id"),
+    "-price": ("-price", "-id"),
+    "newest": ("-created_on", "-id"),
+    "popular": ("-units_sold", "-stats__product"),
+}
+DEFAULT_PRODUCT_ORDERING = "newest"
+FACET_PARAMETERS = ("min_price", "max_price", "in_stock", "name")
+# Lower bounds of the price facet buckets, the last bucket has no upper bound
+PRICE_FACET_BUCKETS = (0, 500, 1000, 5000, 10000, 50000)
+
+# Sales statistics behind the popularity ordering
+STATS_CHUNK_SIZE = 2000
+SALES_VERSION_KEY = "catalog_sales_version"
+POPULAR_ORDERING = "popular"
+# Descending keyset fields of the homepage orderings, the product id of the
+# stats row breaks ties so popularity pages are read from stats_popularity_idx
+HOMEPAGE_ORDERINGS = {
+    "newest": ("created_on", "id"),
+    POPULAR_ORDERING: ("units_sold", "stats__product"),
+}
+
+# Frequently bought together recommendations
+RECOMMENDATIONS_TOP_K = 6
+RECOMMENDATIONS_CART_CHUNK_SIZE = 500
+RECOMMENDATIONS_PRODUCT_CHUNK_SIZE = 500
+RECOMMENDATIONS_VERSION_KEY = "catalog_recommendations_version"
+
+# In memory autocomplete of product names
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+AUTOCOMPLETE_CHUNK_SIZE = 5000
+AUTOCOMPLETE_VERSION_CHECK_INTERVAL = 1
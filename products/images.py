@@ -0,0 +1,129 @@
+"""
+Builds resized variants of product images off the request path
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image
+
+from products.cache import bump_catalog_version
+from products.constants import (
+    DEFAULT_PRODUCT_IMAGE,
+    IMAGE_VARIANT_FORMATS,
+    IMAGE_VARIANT_QUALITY,
+    IMAGE_VARIANT_WIDTHS,
+    IMAGE_VARIANT_WORKERS,
+    IMAGE_VARIANTS_PATH,
+)
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_VARIANT_WORKERS, thread_name_prefix="product-images"
+)
+
+
+def resize_image(image, width, image_format):
+    """
+    Encodes a copy of the image scaled down to the given width
+    Args:
+        image(Image): Value containing the original image
+        width(int): Value containing width of the variant
+        image_format(str): Value containing Pillow format name
+    Returns:
+        (bytes): Value containing encoded variant
+    """
+    variant = image.copy()
+    variant.thumbnail((width, image.height), Image.LANCZOS)
+    if image_format == "JPEG" and variant.mode != "RGB":
+        variant = variant.convert("RGB")
+    buffer = BytesIO()
+    variant.save(buffer, image_format, quality=IMAGE_VARIANT_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def build_variants(image_name):
+    """
+    Writes every configured variant of an image to storage
+    Args:
+        image_name(str): Value containing storage name of the original image
+    Returns:
+        (dict): Value containing format -> list of [width, storage name]
+    """
+    with default_storage.open(image_name) as image_file:
+        image = Image.open(image_file)
+        image.load()
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    variants = {}
+    for extension, image_format in IMAGE_VARIANT_FORMATS.items():
+        variants[extension] = []
+        for width in IMAGE_VARIANT_WIDTHS:
+            if width >= image.width:
+                break
+            name = default_storage.save(
+                f"{IMAGE_VARIANTS_PATH}{stem}_{width}.{extension}",
+                ContentFile(resize_image(image, width, image_format)),
+            )
+            variants[extension].append([width, name])
+    return variants
+
+
+def delete_variants(variants):
+    """
+    Removes variant files from storage
+    Args:
+        variants(dict): Value containing format -> list of [width, storage name]
+    Returns:
+        None
+    """
+    for sources in (variants or {}).values():
+        for _, name in sources:
+            default_storage.delete(name)
+
+
+def process_product_image(product_id, image_name):
+    """
+    Builds the variants of a product image and stores them on the product if
+    its image has not been replaced meanwhile
+    Args:
+        product_id(int): Value containing primary key of the product
+        image_name(str): Value containing storage name of the original image
+    Returns:
+        None
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import, broad-except
+    from products.models import Product
+
+    try:
+        variants = build_variants(image_name)
+        updated = Product.objects.filter(id=product_id, image=image_name).update(
+            image_variants=variants
+        )
+        if updated:
+            bump_catalog_version()
+        else:
+            delete_variants(variants)
+    except Exception:
+        logger.exception("Could not build variants of %s", image_name)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(product):
+    """
+    Queues variant generation for a product once the current transaction commits
+    Args:
+        product(Product): Value containing product data
+    Returns:
+        None
+    """
+    if not product.image or product.image.name == DEFAULT_PRODUCT_IMAGE:
+        return
+    product_id, image_name = product.id, product.image.name
+    transaction.on_commit(
+        lambda: executor.submit(process_product_image, product_id, image_name)
+    )
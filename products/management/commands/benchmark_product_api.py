@@ -0,0 +1,113 @@
+"""
+Management command to benchmark the product listing API
+"""
+import math
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from products.cache import bump_catalog_version
+from products.models import Product
+from products.stats import ensure_stats
+from products.views import ProductViewSet
+
+SCENARIOS = {
+    "newest": {},
+    "in stock, newest": {"in_stock": "true"},
+    "price ascending": {"ordering": "price"},
+    "price descending, in stock": {"ordering": "-price", "in_stock": "true"},
+    "price range": {"min_price": "1000", "max_price": "2000", "ordering": "price"},
+    "name prefix": {"name": "product 12", "ordering": "newest"},
+    "best sellers, in stock": {"ordering": "popular", "in_stock": "true"},
+    "price range, in stock": {
+        "min_price": "100",
+        "max_price": "5000",
+        "in_stock": "true",
+        "ordering": "-price",
+    },
+}
+
+
+def percentile(timings, fraction):
+    """
+    Returns the nearest rank percentile of the timings
+    Args:
+        timings(list): Value containing measured durations
+        fraction(float): Value containing percentile between 0 and 1
+    Returns:
+        (float): Value containing the duration at that percentile
+    """
+    ordered = sorted(timings)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    """
+    Measures p50/p95 latency of ProductViewSet.list for every supported
+    filter and ordering against a catalog of the given size. Synthetic
+    products are created inside a transaction that is rolled back.
+    """
+
+    help = "Benchmarks filtered, ordered and faceted product listing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Invalidate cached facets before every request",
+        )
+
+    def seed(self, count):
+        """
+        Creates synthetic products until the catalog has the given size
+        Args:
+            count(int): Value containing wanted catalog size
+        Returns:
+            None
+        """
+        missing = count - Product.objects.count()
+        Product.objects.bulk_create(
+            (
+                Product(
+                    name=f"Product {index}",
+                    price=10 + (index * 7919) % 60000,
+                    stock_quantity=index % 10,
+                )
+                for index in range(missing)
+            ),
+            batch_size=1000,
+        )
+        ensure_stats(Product.objects.values_list("id", flat=True))
+
+    def handle(self, *args, **options):
+        """
+        Seeds the catalog, runs every scenario and prints its latencies
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        view = ProductViewSet.as_view({"get": "list"})
+        factory = APIRequestFactory()
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=["testserver"]):
+            self.seed(options["products"])
+            self.stdout.write(f"{Product.objects.count()} products")
+            for name, params in SCENARIOS.items():
+                timings = []
+                for _ in range(options["requests"]):
+                    if options["cold"]:
+                        bump_catalog_version()
+                    start = time.perf_counter()
+                    view(factory.get("/products/api/", params)).render()
+                    timings.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(
+                    f"{name:<28} p50={percentile(timings, 0.5):7.2f}ms "
+                    f"p95={percentile(timings, 0.95):7.2f}ms"
+                )
+            transaction.set_rollback(True)
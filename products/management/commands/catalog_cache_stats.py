@@ -0,0 +1,38 @@
+"""
+Management command to inspect the catalog fragment cache
+"""
+from django.core.management.base import BaseCommand
+
+from products.cache import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    """
+    Prints hit and miss counters of the catalog fragment cache
+    """
+
+    help = "Shows hit/miss counters of the catalog fragment cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters after printing"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Prints the counters and optionally resets them
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        stats = get_cache_stats()
+        lookups = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / lookups if lookups else 0
+        self.stdout.write(
+            f"version={stats['version']} hits={stats['hits']} "
+            f"misses={stats['misses']} hit_ratio={ratio:.2%}"
+        )
+        if options["reset"]:
+            reset_cache_stats()
@@ -0,0 +1,37 @@
+"""
+Management command to bulk export products
+"""
+from django.core.management.base import BaseCommand
+
+from products.bulk import export_products
+from products.constants import BULK_FORMATS, CSV_FORMAT, EXPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    """
+    Writes every product as csv or jsonl
+    """
+
+    help = "Exports products as csv or jsonl"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=BULK_FORMATS, default=CSV_FORMAT)
+        parser.add_argument("--output", help="Path of the file, stdout if omitted")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        """
+        Streams products into the output
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        lines = export_products(options["format"], options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as file:
+                file.writelines(lines)
+            return
+        for line in lines:
+            self.stdout.write(line, ending="")
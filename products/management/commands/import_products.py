@@ -0,0 +1,52 @@
+"""
+Management command to bulk import products
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from products.bulk import import_products, read_rows
+from products.constants import BULK_FORMATS, IMPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    """
+    Creates or updates products from a csv or jsonl file, matched by sku
+    """
+
+    help = "Imports products from a csv or jsonl file, upserting by sku"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of the csv or jsonl file")
+        parser.add_argument("--format", choices=BULK_FORMATS, help="File format")
+        parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument("--user", help="Email of the user creating the products")
+
+    def handle(self, *args, **options):
+        """
+        Imports the file and prints the report
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        file_format = options["format"] or options["path"].rsplit(".", 1)[-1].lower()
+        if file_format not in BULK_FORMATS:
+            raise CommandError("Please provide a csv or jsonl file")
+        user = None
+        if options["user"]:
+            user = get_user_model().objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError(f"User {options['user']} does not exist")
+        with open(options["path"], "rb") as file:
+            report = import_products(
+                read_rows(file, file_format), user, options["chunk_size"]
+            )
+        for error in report["errors"]:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report['created']}, updated {report['updated']}, "
+                f"rejected {len(report['errors'])} products"
+            )
+        )
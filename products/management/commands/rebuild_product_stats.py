@@ -0,0 +1,33 @@
+"""
+Management command to rebuild the product sales statistics
+"""
+from django.core.management.base import BaseCommand
+
+from products.cache import bump_sales_version
+from products.constants import STATS_CHUNK_SIZE
+from products.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    """
+    Recomputes units sold, revenue and order count of every product from the
+    items of submitted carts
+    """
+
+    help = "Rebuilds the sales statistics behind the popularity ordering"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=STATS_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the statistics and invalidates markup ordered by popularity
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        rebuilt = rebuild_stats(options["chunk_size"])
+        bump_sales_version()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats of {rebuilt} products"))
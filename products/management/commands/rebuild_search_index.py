@@ -0,0 +1,29 @@
+"""
+Management command to rebuild the product search index
+"""
+from django.core.management.base import BaseCommand
+
+from products.search import is_search_available, rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the FTS5 product search index from the products table
+    """
+
+    help = "Rebuilds the full text search index of products in bulk"
+
+    def handle(self, *args, **options):
+        """
+        Drops, recreates and refills the search index
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        if not is_search_available():
+            self.stderr.write("Full text search requires an SQLite database")
+            return
+        indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products"))
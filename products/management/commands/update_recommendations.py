@@ -0,0 +1,49 @@
+"""
+Management command to update the frequently bought together recommendations
+"""
+from django.core.management.base import BaseCommand
+
+from products.cache import bump_catalog_version
+from products.constants import (
+    RECOMMENDATIONS_CART_CHUNK_SIZE,
+    RECOMMENDATIONS_VERSION_KEY,
+)
+from products.recommendations import update_recommendations
+
+
+class Command(BaseCommand):
+    """
+    Counts carts submitted since the last run into the co-occurrence matrix
+    and refreshes the recommendations of the products they contain
+    """
+
+    help = "Updates frequently bought together recommendations incrementally"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Forget the matrix and count every submitted cart again",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=RECOMMENDATIONS_CART_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        """
+        Updates the matrix and invalidates product pages showing recommendations
+        Args:
+            args(list): list containing different arguments
+            options(dict): dictionary containing command options
+        Returns:
+            None
+        """
+        report = update_recommendations(options["full"], options["chunk_size"])
+        if report["products"]:
+            bump_catalog_version(RECOMMENDATIONS_VERSION_KEY)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Counted {report['carts']} carts, "
+                f"refreshed {report['products']} products"
+            )
+        )
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0002_product_image"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-created_on", "-id"], name="product_created_on_id_idx"
+            ),
+        ),
+    ]
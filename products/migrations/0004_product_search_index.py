@@ -0,0 +1,41 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:02
+
+from django.db import migrations
+
+from products.search import DROP_INDEX_SQL, is_search_available, rebuild_index
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Creates the FTS5 search index and fills it with existing products
+    Args:
+        apps(StateApps): Value containing historical models
+        schema_editor(BaseDatabaseSchemaEditor): Value containing db connection
+    Returns:
+        None
+    """
+    rebuild_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    """
+    Drops the FTS5 search index
+    Args:
+        apps(StateApps): Value containing historical models
+        schema_editor(BaseDatabaseSchemaEditor): Value containing db connection
+    Returns:
+        None
+    """
+    if is_search_available(schema_editor.connection):
+        schema_editor.execute(DROP_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0003_product_created_on_id_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0006_product_sku"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["updated_on"], name="product_updated_on_idx"),
+        ),
+    ]
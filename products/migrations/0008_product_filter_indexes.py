@@ -0,0 +1,41 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:00
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0007_product_updated_on_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["price", "id"], name="product_price_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("stock_quantity__gt", 0)),
+                fields=["price", "id"],
+                name="product_in_stock_price_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("stock_quantity__gt", 0)),
+                fields=["-created_on", "-id"],
+                name="product_in_stock_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="product_name_lower_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:05
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_stats(apps, schema_editor):
+    """
+    Creates a stats row for every product, filled from submitted carts
+    Args:
+        apps(StateApps): Value containing historical models
+        schema_editor(BaseDatabaseSchemaEditor): Value containing db connection
+    Returns:
+        None
+    """
+    product_model = apps.get_model("products", "Product")
+    stats_model = apps.get_model("products", "ProductStats")
+    cart_item_model = apps.get_model("carts", "CartItem")
+
+    sales = {
+        row["product"]: row
+        for row in cart_item_model.objects.exclude(cart__status="Open")
+        .values("product")
+        .annotate(
+            units_sold=Sum("quantity"),
+            revenue=Sum("item_total"),
+            order_count=Count("cart", distinct=True),
+        )
+        .order_by()
+    }
+    stats = []
+    for product_id in product_model.objects.values_list("id", flat=True).iterator():
+        row = sales.get(product_id, {})
+        stats.append(
+            stats_model(
+                product_id=product_id,
+                units_sold=row.get("units_sold") or 0,
+                revenue=row.get("revenue") or 0,
+                order_count=row.get("order_count") or 0,
+            )
+        )
+    stats_model.objects.bulk_create(stats, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carts", "0002_cart_lookup_indexes"),
+        ("products", "0008_product_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductStats",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="products.product",
+                    ),
+                ),
+                (
+                    "units_sold",
+                    models.PositiveIntegerField(default=0, verbose_name="Units sold"),
+                ),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0"),
+                        max_digits=14,
+                        verbose_name="Revenue",
+                    ),
+                ),
+                (
+                    "order_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Number of orders"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="productstats",
+            index=models.Index(
+                fields=["-units_sold", "-product"], name="stats_popularity_idx"
+            ),
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 3.2.7 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_productstats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecommendationRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_on", models.DateTimeField(auto_now_add=True)),
+                ("last_cart_id", models.PositiveIntegerField(default=0)),
+                ("pending_cart_ids", models.JSONField(blank=True, default=list)),
+                ("carts_processed", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="productstats",
+            name="bought_together",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.CreateModel(
+            name="ProductPair",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "occurrences",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Carts containing both"
+                    ),
+                ),
+                (
+                    "other",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="products.product",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="products.product",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="productpair",
+            index=models.Index(
+                fields=["product", "-occurrences"], name="pair_product_occurrences_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="productpair",
+            constraint=models.UniqueConstraint(
+                fields=("product", "other"), name="pair_unique_product_other"
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.7 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+
+def forget_checkpoints(apps, schema_editor):
+    """
+    Deletes the checkpoints keyed by cart id, so the next update counts every
+    finished cart again and stores a checkpoint in the status history
+    Args:
+        apps(StateApps): Value containing historical models
+        schema_editor(BaseDatabaseSchemaEditor): Value containing db connection
+    Returns:
+        None
+    """
+    apps.get_model("products", "RecommendationRun").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_recommendations"),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_checkpoints, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="recommendationrun",
+            name="last_cart_id",
+        ),
+        migrations.RemoveField(
+            model_name="recommendationrun",
+            name="pending_cart_ids",
+        ),
+        migrations.AddField(
+            model_name="recommendationrun",
+            name="last_change_id",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
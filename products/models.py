@@ -1,11 +1,21 @@
 """
 Models for the products app
 """
+from copy import deepcopy
+from decimal import Decimal
+
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import DatabaseError, connections, models, router, transaction
+from django.db.models.functions import Lower
+from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from products.cache import bump_catalog_version
 from products.constants import DEFAULT_PRODUCT_IMAGE
+from products.images import delete_variants
+from products.search import index_product, remove_product
+from products.stats import ensure_stats
 from products.utils import image_path
 from users.models import TimeStamp, User
 
@@ -13,15 +23,104 @@ from users.models import TimeStamp, User
 class AuditTimeStamp(TimeStamp):
     """
     TimeStamp model to check when the object was created and modified
+
+    Values of the fields are remembered when an instance is loaded or saved,
+    so saves only write the fields that changed and subclasses can read the
+    previous value of a field without querying the database again.
     """
 
     created_by = models.ForeignKey(
         User, on_delete=models.CASCADE, null=True, editable=False, related_name="+"
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_fields()
+        return instance
+
+    def snapshot_fields(self):
+        """
+        Remembers the current values of all loaded fields
+        Returns:
+            None
+        """
+        # pylint: disable=no-member
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            field.attname: self._tracked_value(field)
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+        }
+
+    def _tracked_value(self, field):
+        """
+        Returns a copy of a field value that later changes cannot mutate
+        Args:
+            field(Field): Value containing the model field
+        Returns:
+            (object): Value containing comparable field value
+        """
+        value = getattr(self, field.attname)
+        if isinstance(field, models.FileField):
+            return value.name or None
+        if isinstance(value, (dict, list)):
+            return deepcopy(value)
+        return value
+
+    def get_dirty_fields(self):
+        """
+        Returns the fields whose values differ from the remembered values.
+        Every field is dirty for an instance that was never loaded or saved,
+        or whose pk was cleared to save a copy.
+        Returns:
+            (dict): Value containing attname -> remembered value
+        """
+        # pylint: disable=no-member
+        loaded_values = getattr(self, "_loaded_values", None)
+        if self.pk is None:
+            loaded_values = None
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if loaded_values is None:
+                dirty[field.attname] = None
+            elif field.attname in loaded_values and loaded_values[
+                field.attname
+            ] != self._tracked_value(field):
+                dirty[field.attname] = loaded_values[field.attname]
+        return dirty
+
+    def get_old_value(self, field_name):
+        """
+        Returns the remembered value of a field
+        Args:
+            field_name(str): Value containing field attname
+        Returns:
+            (object): Value containing remembered value, None if not known
+        """
+        return (getattr(self, "_loaded_values", None) or {}).get(field_name)
+
+    def set_saved_values(self, **values):
+        """
+        Sets field values that were already written to the database, for
+        example by a queryset update, without marking them as dirty
+        Args:
+            values(dict): dictionary containing attname -> written value
+        Returns:
+            None
+        """
+        for name, value in values.items():
+            setattr(self, name, value)
+            if getattr(self, "_loaded_values", None) is not None:
+                self._loaded_values[name] = value
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        self.snapshot_fields()
+
     def save(self, *args, **kwargs):
         """
-        Populates the created_by fields
+        Populates the created_by fields and writes only the changed fields
         Args:
             args(list): list containing different arguments
             kwargs(dict): dictionary containing different key value arguments
@@ -33,7 +132,37 @@ class AuditTimeStamp(TimeStamp):
             if self.created_by is None and self.id is None:
                 self.created_by = kwargs["created_by"]
             del kwargs["created_by"]
-        super().save(*args, **kwargs)
+        # a loaded row is updated in place, a copy with its pk cleared is
+        # inserted in full
+        if (
+            not args
+            and getattr(self, "_loaded_values", None) is not None
+            and self.pk is not None
+            and not self._state.adding
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            try:
+                super().save(
+                    update_fields=list(self.get_dirty_fields()) + ["updated_on"],
+                    **kwargs,
+                )
+            except DatabaseError as error:
+                # Django raises a bare DatabaseError when the UPDATE matched no
+                # row, as the row was deleted since it was loaded. No statement
+                # failed, so the transaction goes on and all of the row is
+                # written again.
+                if type(error) is not DatabaseError:
+                    raise
+                using = kwargs.get("using") or router.db_for_write(
+                    type(self), instance=self
+                )
+                if connections[using].in_atomic_block:
+                    transaction.set_rollback(False, using=using)
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self.snapshot_fields()
 
     class Meta:
         """
@@ -43,6 +172,10 @@ class AuditTimeStamp(TimeStamp):
         abstract = True
 
 
+# Fields shown in cached catalog markup
+RENDERED_FIELDS = {"name", "description", "price", "image", "image_variants"}
+
+
 class Product(AuditTimeStamp):
     """
     Product model
@@ -62,6 +195,10 @@ class Product(AuditTimeStamp):
 
     image = models.ImageField(upload_to=image_path, null=True, blank=True)
     name = models.CharField(_("Product Name"), max_length=100)
+    sku = models.CharField(
+        _("Stock Keeping Unit"), max_length=64, unique=True, null=True, blank=True
+    )
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def get_price(self):
         """
@@ -69,36 +206,77 @@ class Product(AuditTimeStamp):
         Returns:
             (str): Value containing formatted price and symbol of currency
         """
-        formatted_price = []
-        price = list(str(self.price))
-        decimal = price[-3:]
-        price = price[0:-3]
-        price.reverse()
-        for index, value in enumerate(price):
-            formatted_price += [value]
-            if (index + 1) % 3 == 0 and index < len(price) - 1:
-                formatted_price += [","]
-        formatted_price.reverse()
-        formatted_price += decimal
-        return f"Rs. {''.join(formatted_price)}"
+        return f"Rs. {Decimal(self.price):,.2f}"
+
+    def get_absolute_url(self):
+        """
+        Returns the url of the product page
+        Returns:
+            (str): Value containing absolute path of the product page
+        """
+        return reverse("homepage", args=[self.id])
+
+    def get_srcset(self, extension):
+        """
+        Returns the srcset attribute value of the image variants of a format
+        Args:
+            extension(str): Value containing variant file extension
+        Returns:
+            (str): Value containing comma separated "url width" pairs
+        """
+        return ", ".join(
+            f"{default_storage.url(name)} {width}w"
+            for width, name in self.image_variants.get(extension, [])
+        )
+
+    @property
+    def webp_srcset(self):
+        """
+        Returns the srcset of WebP image variants
+        Returns:
+            (str): Value containing srcset, empty until variants are built
+        """
+        return self.get_srcset("webp")
+
+    @property
+    def jpeg_srcset(self):
+        """
+        Returns the srcset of JPEG image variants
+        Returns:
+            (str): Value containing srcset, empty until variants are built
+        """
+        return self.get_srcset("jpeg")
 
     def save(self, *args, **kwargs):
         # pylint: disable=no-member
-        if self.id is not None and self.image:
-            product = Product.objects.filter(id=self.id).first()
-            if (
-                product is not None
-                and product.image.name != DEFAULT_PRODUCT_IMAGE
-                and product.image.name != self.image.name
-            ):
-                product.image.delete(False)
+        dirty = self.get_dirty_fields()
+        adding = self._state.adding or self.id is None
+        old_image = self.get_old_value("image")
+        if self.id is not None and "image" in dirty and old_image is not None:
+            delete_variants(self.get_old_value("image_variants"))
+            self.image_variants = {}
+            if old_image != DEFAULT_PRODUCT_IMAGE:
+                default_storage.delete(old_image)
         super().save(*args, **kwargs)
+        if adding:
+            ensure_stats([self.id])
+        if dirty.keys() & {"name", "description"}:
+            index_product(self)
+        if dirty.keys() & RENDERED_FIELDS or (
+            "stock_quantity" in dirty
+            and 0 in (dirty["stock_quantity"], self.stock_quantity)
+        ):
+            bump_catalog_version()
 
     def delete(self, *args, **kwargs):
         # pylint: disable=no-member
         if self.image and self.image.name != DEFAULT_PRODUCT_IMAGE:
             self.image.delete(False)
+        delete_variants(self.image_variants)
+        product_id = self.id
         super().delete(*args, **kwargs)
+        remove_product(product_id)
+        bump_catalog_version()
 
     def __str__(self):
         """
@@ -107,3 +285,118 @@ class Product(AuditTimeStamp):
             (str): Value containing product name
         """
         return str(self.name)
+
+    class Meta:
+        """
+        Defines the metadata of the class
+        """
+
+        indexes = [
+            models.Index(
+                fields=["-created_on", "-id"], name="product_created_on_id_idx"
+            ),
+            models.Index(fields=["updated_on"], name="product_updated_on_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(
+                fields=["price", "id"],
+                condition=models.Q(stock_quantity__gt=0),
+                name="product_in_stock_price_idx",
+            ),
+            models.Index(
+                fields=["-created_on", "-id"],
+                condition=models.Q(stock_quantity__gt=0),
+                name="product_in_stock_created_idx",
+            ),
+            models.Index(Lower("name"), name="product_name_lower_idx"),
+        ]
+
+
+class ProductStats(models.Model):
+    """
+    Sales figures of a product, maintained incrementally when carts are submitted.
+    Every product has a row, so ordering by popularity is an inner join read
+    straight from stats_popularity_idx.
+    """
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    units_sold = models.PositiveIntegerField(_("Units sold"), default=0)
+    revenue = models.DecimalField(
+        _("Revenue"), max_digits=14, decimal_places=2, default=Decimal(0)
+    )
+    order_count = models.PositiveIntegerField(_("Number of orders"), default=0)
+    bought_together = models.JSONField(default=list, blank=True, editable=False)
+
+    def __str__(self):
+        """
+        String representation of ProductStats
+        Returns:
+            (str): Value containing product id and units sold
+        """
+        return f"Product {self.product_id}: {self.units_sold} sold"
+
+    class Meta:
+        """
+        Defines the metadata of the class
+        """
+
+        indexes = [
+            models.Index(
+                fields=["-units_sold", "-product"], name="stats_popularity_idx"
+            ),
+        ]
+
+
+class ProductPair(models.Model):
+    """
+    Cell of the sparse product by product co-occurrence matrix: how many
+    submitted carts contained both products
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    occurrences = models.PositiveIntegerField(_("Carts containing both"), default=0)
+
+    def __str__(self):
+        """
+        String representation of ProductPair
+        Returns:
+            (str): Value containing both product ids and occurrences
+        """
+        return f"{self.product_id} + {self.other_id}: {self.occurrences}"
+
+    class Meta:
+        """
+        Defines the metadata of the class
+        """
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "other"], name="pair_unique_product_other"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["product", "-occurrences"], name="pair_product_occurrences_idx"
+            ),
+        ]
+
+
+class RecommendationRun(models.Model):
+    """
+    Checkpoint of a co-occurrence matrix update. Carts submitted up to the
+    status change last_change_id were counted.
+    """
+
+    created_on = models.DateTimeField(auto_now_add=True)
+    last_change_id = models.PositiveIntegerField(default=0)
+    carts_processed = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """
+        String representation of RecommendationRun
+        Returns:
+            (str): Value containing checkpoint
+        """
+        return f"Submissions up to {self.last_change_id}"
@@ -0,0 +1,131 @@
+"""
+Contains pagination classes for products app
+"""
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+from products.constants import PRODUCT_API_MAX_PAGE_SIZE, PRODUCT_API_PAGE_SIZE
+from products.utils import decode_cursor, encode_cursor
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination following the ordering requested from the view. Cursors
+    hold both values of the (field, tiebreaker) ordering, so every position is
+    unique and pages of products sharing a price or units sold are found with
+    the index instead of an offset.
+    """
+
+    page_size = PRODUCT_API_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = PRODUCT_API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Returns the ordering chosen by the view
+        Args:
+            request(HttpRequest): Value containing request data
+            queryset(QuerySet): Value containing products to paginate
+            view(APIView): Value containing the view being paginated
+        Returns:
+            (tuple): Value containing field and tiebreaker to order by
+        """
+        return view.get_ordering()
+
+    def decode_cursor(self, request):
+        """
+        Reads the cursor of the request. Offsets are never needed as
+        positions are unique, so they are dropped.
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (Cursor): Value containing direction and position, if any
+        Raises:
+            NotFound: if the cursor is malformed
+        """
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        if cursor.position is not None:
+            try:
+                decode_cursor(cursor.position, self.ordering[0].lstrip("-"))
+            except ValueError as error:
+                raise NotFound(self.invalid_cursor_message) from error
+        return Cursor(offset=0, reverse=cursor.reverse, position=cursor.position)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Returns the page of products following or preceding the cursor
+        Args:
+            queryset(QuerySet): Value containing products to paginate
+            request(HttpRequest): Value containing request data
+            view(APIView): Value containing the view being paginated
+        Returns:
+            (list): Value containing products of the page
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        position = self.cursor.position if self.cursor else None
+
+        if reverse:
+            queryset = queryset.order_by(
+                *(
+                    field[1:] if field.startswith("-") else f"-{field}"
+                    for field in self.ordering
+                )
+            )
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position, reverse))
+
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        following = None
+        if len(results) > self.page_size:
+            following = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = position is not None, position
+            self.has_previous, self.previous_position = following is not None, following
+        else:
+            self.has_next, self.next_position = following is not None, following
+            self.has_previous, self.previous_position = position is not None, position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_position_filter(self, position, reverse):
+        """
+        Returns the condition selecting the products after a position, read
+        in the direction of the page
+        Args:
+            position(str): Value containing position stored in the cursor
+            reverse(bool): Value telling the page is read backwards
+        Returns:
+            (Q): Value containing filter on the field and the tiebreaker
+        """
+        field, tiebreaker = (name.lstrip("-") for name in self.ordering)
+        value, product_id = decode_cursor(position, field)
+        lookup = "lt" if reverse != self.ordering[0].startswith("-") else "gt"
+        return Q(**{f"{field}__{lookup}": value}) | Q(
+            **{field: value, f"{tiebreaker}__{lookup}": product_id}
+        )
+
+    def _get_position_from_instance(self, instance, ordering):
+        """
+        Returns the position of a product in the ordering
+        Args:
+            instance(Product): Value containing product data
+            ordering(tuple): Value containing field and tiebreaker
+        Returns:
+            (str): Value containing the field value and id of the product
+        """
+        return encode_cursor(instance, ordering[0].lstrip("-"))
@@ -0,0 +1,186 @@
+"""
+"Frequently bought together" recommendations built offline from order history
+
+Submitted carts are counted into a sparse product by product co-occurrence
+matrix stored as ProductPair rows. The counting is a single grouped self
+join of the cart items per batch of carts, executed by the database, and the
+result is added to the matrix with one upsert. The top neighbours of every
+touched product are then copied to ProductStats.bought_together, so a product
+page reads its recommendations with the product itself.
+"""
+from itertools import groupby, islice
+
+from django.db import connection, transaction
+
+from products.constants import (
+    RECOMMENDATIONS_CART_CHUNK_SIZE,
+    RECOMMENDATIONS_PRODUCT_CHUNK_SIZE,
+    RECOMMENDATIONS_TOP_K,
+)
+
+
+def _table(model):
+    """
+    Returns the quoted table name of a model
+    Args:
+        model(Model): Value containing model class
+    Returns:
+        (str): Value containing quoted table name
+    """
+    # pylint: disable=protected-access
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def count_pairs(cart_ids):
+    """
+    Adds every pair of distinct products sharing one of the carts to the
+    co-occurrence matrix
+    Args:
+        cart_ids(list): Value containing primary keys of submitted carts
+    Returns:
+        (list): Value containing primary keys of products whose row changed
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from carts.models import CartItem
+    from products.models import ProductPair
+
+    if not cart_ids:
+        return []
+    items, pairs = _table(CartItem), _table(ProductPair)
+    placeholders = ", ".join(["%s"] * len(cart_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {pairs} (product_id, other_id, occurrences) "
+            "SELECT item.product_id, other.product_id, COUNT(*) "
+            f"FROM {items} AS item JOIN {items} AS other "
+            "ON other.cart_id = item.cart_id AND other.product_id <> item.product_id "
+            f"WHERE item.cart_id IN ({placeholders}) "
+            "GROUP BY item.product_id, other.product_id "
+            "ON CONFLICT (product_id, other_id) "
+            f"DO UPDATE SET occurrences = {pairs}.occurrences + excluded.occurrences",
+            cart_ids,
+        )
+    return list(
+        CartItem.objects.filter(cart__in=cart_ids)
+        .values_list("product", flat=True)
+        .distinct()
+    )
+
+
+def refresh_top_products(product_ids, top_k=RECOMMENDATIONS_TOP_K):
+    """
+    Stores the top_k most frequent neighbours of the products in their stats
+    Args:
+        product_ids(iterable): Value containing primary keys of products
+        top_k(int): Value containing number of neighbours kept per product
+    Returns:
+        None
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from products.models import ProductPair, ProductStats
+    from products.stats import ensure_stats
+
+    product_ids = iter(product_ids)
+    chunk = list(islice(product_ids, RECOMMENDATIONS_PRODUCT_CHUNK_SIZE))
+    while chunk:
+        placeholders = ", ".join(["%s"] * len(chunk))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT product_id, other_id FROM ("
+                "SELECT product_id, other_id, ROW_NUMBER() OVER ("
+                "PARTITION BY product_id ORDER BY occurrences DESC, other_id"
+                f") AS position FROM {_table(ProductPair)} "
+                f"WHERE product_id IN ({placeholders})"
+                ") AS ranked WHERE position <= %s ORDER BY product_id, position",
+                chunk + [top_k],
+            )
+            neighbours = {
+                product_id: [other_id for _, other_id in rows]
+                for product_id, rows in groupby(cursor.fetchall(), lambda row: row[0])
+            }
+        with transaction.atomic():
+            ensure_stats(chunk)
+            for product_id in chunk:
+                ProductStats.objects.filter(product_id=product_id).update(
+                    bought_together=neighbours.get(product_id, [])
+                )
+        chunk = list(islice(product_ids, RECOMMENDATIONS_PRODUCT_CHUNK_SIZE))
+
+
+def update_recommendations(full=False, chunk_size=RECOMMENDATIONS_CART_CHUNK_SIZE):
+    """
+    Counts the carts submitted since the last run into the co-occurrence
+    matrix and refreshes the recommendations of the products they contain.
+    Carts are picked from the append only status history in the order they
+    were submitted, so a cart that was still open or being checked out when
+    a run passed is counted once it is submitted, without keeping a list of
+    such carts. The first run, and a full run, count every finished cart.
+    Args:
+        full(bool): Value telling to forget the matrix and count every cart
+        chunk_size(int): Value containing number of carts counted at once
+    Returns:
+        (dict): Value containing number of carts counted and products refreshed
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import, no-member
+    from carts.constants import SUBMITTED, UNFINISHED_STATUSES
+    from carts.models import Cart, CartStatusChange
+    from products.models import ProductPair, ProductStats, RecommendationRun
+
+    with transaction.atomic():
+        last_run = RecommendationRun.objects.order_by("-id").first()
+        submissions = CartStatusChange.objects.filter(to_status=SUBMITTED)
+        full = full or last_run is None
+        if full:
+            ProductPair.objects.all().delete()
+            ProductStats.objects.update(bought_together=[])
+            RecommendationRun.objects.all().delete()
+            # carts submitted before the status history existed have no row
+            # in it, so a full count reads the carts themselves
+            last_change_id = (
+                submissions.order_by("-id").values_list("id", flat=True).first() or 0
+            )
+            rows = Cart.objects.exclude(status__in=UNFINISHED_STATUSES).values_list(
+                "id", "id"
+            )
+            position = 0
+        else:
+            rows = submissions.values_list("id", "cart")
+            position = last_change_id = last_run.last_change_id
+        rows = rows.order_by("id")
+        touched, processed = set(), 0
+        chunk = list(rows.filter(id__gt=position)[:chunk_size])
+        while chunk:
+            touched.update(count_pairs([cart_id for _, cart_id in chunk]))
+            processed += len(chunk)
+            position = chunk[-1][0]
+            chunk = list(rows.filter(id__gt=position)[:chunk_size])
+        if not full:
+            last_change_id = position
+
+        refresh_top_products(sorted(touched))
+        RecommendationRun.objects.create(
+            last_change_id=last_change_id, carts_processed=processed
+        )
+    return {"carts": processed, "products": len(touched)}
+
+
+def get_recommendations(product):
+    """
+    Returns the in stock products frequently bought with a product, best
+    first, from the neighbours stored in its stats row
+    Args:
+        product(Product): Value containing product with stats selected
+    Returns:
+        (list): Value containing recommended products
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from products.models import Product, ProductStats
+
+    try:
+        product_ids = product.stats.bought_together
+    except ProductStats.DoesNotExist:
+        return []
+    if not product_ids:
+        return []
+    products = Product.objects.filter(stock_quantity__gt=0).in_bulk(product_ids)
+    return [products[pk] for pk in product_ids if pk in products]
@@ -0,0 +1,147 @@
+"""
+Full text search over products backed by an SQLite FTS5 index
+"""
+import re
+
+from django.db import connection
+
+from products.constants import (
+    SEARCH_DESCRIPTION_WEIGHT,
+    SEARCH_INDEX_CHUNK_SIZE,
+    SEARCH_NAME_WEIGHT,
+    SEARCH_RESULTS_LIMIT,
+    SEARCH_TABLE,
+)
+
+CREATE_INDEX_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    "USING fts5(name, description, tokenize='unicode61 remove_diacritics 2')"
+)
+DROP_INDEX_SQL = f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+UPSERT_SQL = f"INSERT OR REPLACE INTO {SEARCH_TABLE}(rowid, name, description) VALUES (%s, %s, %s)"
+DELETE_SQL = f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s"
+SEARCH_SQL = (
+    f"SELECT product.* FROM products_product AS product "
+    f"JOIN {SEARCH_TABLE} ON {SEARCH_TABLE}.rowid = product.id "
+    f"WHERE {SEARCH_TABLE} MATCH %s AND product.stock_quantity > 0 "
+    f"ORDER BY bm25({SEARCH_TABLE}, %s, %s) LIMIT %s"
+)
+
+
+def is_search_available(using=None):
+    """
+    Tells if the database supports the FTS5 search index
+    Args:
+        using(DatabaseWrapper): Value containing connection to check
+    Returns:
+        (bool): True if the database is SQLite otherwise False
+    """
+    return (using or connection).vendor == "sqlite"
+
+
+def build_match_expression(query):
+    """
+    Converts user input into an FTS5 query where every word is a prefix match
+    Args:
+        query(str): Value containing search text typed by the user
+    Returns:
+        (str): Value containing FTS5 match expression, empty if nothing to search
+    """
+    terms = re.findall(r"\w+", query or "")
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def index_product(product):
+    """
+    Adds or refreshes a product in the search index
+    Args:
+        product(Product): Value containing product data
+    Returns:
+        None
+    """
+    if is_search_available():
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_SQL, [product.id, product.name, product.description])
+
+
+def index_products(rows):
+    """
+    Adds or refreshes many products in the search index at once
+    Args:
+        rows(iterable): Value containing (id, name, description) tuples
+    Returns:
+        None
+    """
+    if is_search_available():
+        with connection.cursor() as cursor:
+            cursor.executemany(UPSERT_SQL, list(rows))
+
+
+def remove_product(product_id):
+    """
+    Removes a product from the search index
+    Args:
+        product_id(int): Value containing primary key of the product
+    Returns:
+        None
+    """
+    if is_search_available():
+        with connection.cursor() as cursor:
+            cursor.execute(DELETE_SQL, [product_id])
+
+
+def rebuild_index(using=None):
+    """
+    Recreates the search index from the products table in bulk
+    Args:
+        using(DatabaseWrapper): Value containing connection to rebuild on
+    Returns:
+        (int): Value containing number of indexed products
+    """
+    using = using or connection
+    if not is_search_available(using):
+        return 0
+    indexed = 0
+    with using.cursor() as cursor:
+        cursor.execute(DROP_INDEX_SQL)
+        cursor.execute(CREATE_INDEX_SQL)
+        cursor.execute("SELECT id, name, description FROM products_product")
+        rows = cursor.fetchmany(SEARCH_INDEX_CHUNK_SIZE)
+        with using.cursor() as writer:
+            while rows:
+                writer.executemany(UPSERT_SQL, rows)
+                indexed += len(rows)
+                rows = cursor.fetchmany(SEARCH_INDEX_CHUNK_SIZE)
+            writer.execute(
+                f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"
+            )
+    return indexed
+
+
+def search_products(query, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Returns in stock products matching the query ranked by bm25
+    Args:
+        query(str): Value containing search text typed by the user
+        limit(int): Value containing maximum number of results
+    Returns:
+        (list): Value containing matching products, best match first
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from products.models import Product
+
+    expression = build_match_expression(query)
+    if not expression:
+        return []
+    if not is_search_available():
+        return list(
+            Product.objects.filter(
+                name__istartswith=query.strip(), stock_quantity__gt=0
+            ).order_by("name")[:limit]
+        )
+    return list(
+        Product.objects.raw(
+            SEARCH_SQL,
+            [expression, SEARCH_NAME_WEIGHT, SEARCH_DESCRIPTION_WEIGHT, limit],
+        )
+    )
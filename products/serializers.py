@@ -1,8 +1,11 @@
 """
 Contains Serializers for products app
 """
+from django.conf import settings
 from rest_framework import serializers
 
+from products.constants import BULK_FIELDS, DEFAULT_PRODUCT_IMAGE
+from products.images import schedule_variants
 from products.models import Product
 
 
@@ -14,7 +17,15 @@ class ProductSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data["created_by"] = self.context["request"].user
         # pylint: disable=no-member
-        return Product.objects.create(**validated_data)
+        product = Product.objects.create(**validated_data)
+        schedule_variants(product)
+        return product
+
+    def update(self, instance, validated_data):
+        product = super().update(instance, validated_data)
+        if "image" in validated_data:
+            schedule_variants(product)
+        return product
 
     class Meta:
         """
@@ -23,3 +34,57 @@ class ProductSerializer(serializers.ModelSerializer):
 
         model = Product
         fields = "__all__"
+
+
+class ProductImportSerializer(ProductSerializer):
+    """
+    Validates one row of a bulk product import
+    """
+
+    class Meta:
+        """
+        Tells the models about which fields of the model to include in parsed response/request json.
+        """
+
+        model = Product
+        fields = BULK_FIELDS
+        # uniqueness of sku is resolved by upserting, not by rejecting the row
+        extra_kwargs = {
+            "sku": {
+                "required": True,
+                "allow_null": False,
+                "allow_blank": False,
+                "validators": [],
+            }
+        }
+
+
+class ProductCardSerializer(serializers.ModelSerializer):
+    """
+    Compact serializer containing only what a homepage product card displays
+    """
+
+    price = serializers.CharField(source="get_price")
+    image = serializers.SerializerMethodField()
+    webp_srcset = serializers.CharField()
+    jpeg_srcset = serializers.CharField()
+
+    def get_image(self, obj):
+        """
+        Returns the url of the product image or the default image
+        Args:
+            obj(Product): Value containing product data
+        Returns:
+            (str): Value containing image url
+        """
+        if obj.image:
+            return obj.image.url
+        return f"{settings.MEDIA_URL}{DEFAULT_PRODUCT_IMAGE}"
+
+    class Meta:
+        """
+        Tells the models about which fields of the model to include in parsed response/request json.
+        """
+
+        model = Product
+        fields = ["id", "name", "price", "image", "webp_srcset", "jpeg_srcset"]
@@ -0,0 +1,37 @@
+const AUTOCOMPLETE_DELAY = 150;
+var autocomplete_timer = null;
+
+function show_suggestions(list, products){
+    list.replaceChildren();
+    for (let product of products){
+        var option = document.createElement("option");
+        option.value = product.name;
+        list.appendChild(option);
+    }
+}
+
+function suggest(field){
+    var list = document.getElementById(field.getAttribute("list"));
+    var query = field.value.trim();
+    if (!query){
+        show_suggestions(list, []);
+        return;
+    }
+    fetch(field.dataset.url + "?q=" + encodeURIComponent(query))
+        .then(response => response.json())
+        .then(data => {
+            if (data.status_code == 200 && field.value.trim() == query){
+                show_suggestions(list, data.products);
+            }
+        })
+        .catch(() => {});
+}
+
+document.addEventListener("DOMContentLoaded", function(){
+    for (let field of document.querySelectorAll(".search-field[data-url]")){
+        field.addEventListener("input", function(){
+            clearTimeout(autocomplete_timer);
+            autocomplete_timer = setTimeout(() => suggest(field), AUTOCOMPLETE_DELAY);
+        });
+    }
+});
@@ -0,0 +1,79 @@
+const PRODUCTS_PER_ROW = 5;
+var loading = false;
+
+function product_box(product){
+    var box = document.createElement("li");
+    box.className = "product-box";
+    var link = document.createElement("a");
+    link.style.textDecorationLine = "none";
+    link.href = "/products/" + product.id + "/";
+    var picture = document.createElement("picture");
+    if (product.webp_srcset){
+        var source = document.createElement("source");
+        source.type = "image/webp";
+        source.srcset = product.webp_srcset;
+        source.sizes = "250px";
+        picture.appendChild(source);
+    }
+    var image = document.createElement("img");
+    image.className = "product_image";
+    image.src = product.image;
+    if (product.jpeg_srcset){
+        image.srcset = product.jpeg_srcset;
+        image.sizes = "250px";
+    }
+    image.loading = "lazy";
+    image.alt = product.name;
+    picture.appendChild(image);
+    var name = document.createElement("div");
+    name.className = "name";
+    name.textContent = product.name;
+    var price = document.createElement("div");
+    price.className = "price";
+    price.textContent = product.price;
+    link.append(picture, name, document.createElement("br"), price, document.createElement("br"));
+    box.appendChild(link);
+    return box;
+}
+
+function append_products(products){
+    var container = document.getElementsByClassName("products-container")[0];
+    var row = null;
+    for (let product of products){
+        if (row === null || row.children.length == PRODUCTS_PER_ROW){
+            row = document.createElement("ul");
+            row.className = "products-box";
+            container.appendChild(row);
+        }
+        row.appendChild(product_box(product));
+    }
+}
+
+function load_next_page(sentinel){
+    var cursor = sentinel.dataset.cursor;
+    if (loading || !cursor){
+        return;
+    }
+    loading = true;
+    var url = sentinel.dataset.url + "?cursor=" + encodeURIComponent(cursor);
+    if (sentinel.dataset.ordering){
+        url += "&ordering=" + encodeURIComponent(sentinel.dataset.ordering);
+    }
+    fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            if (data.status_code == 200){
+                append_products(data.products);
+                sentinel.dataset.cursor = data.next_cursor || "";
+            }
+            loading = false;
+        })
+        .catch(() => { loading = false; });
+}
+
+var sentinel = document.getElementById("next-page");
+new IntersectionObserver(function(entries){
+    if (entries[0].isIntersecting){
+        load_next_page(sentinel);
+    }
+}, {rootMargin: "400px"}).observe(sentinel);
@@ -0,0 +1,112 @@
+"""
+Sales figures of products, kept up to date as carts are submitted
+"""
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+
+from products.constants import STATS_CHUNK_SIZE
+
+
+def ensure_stats(product_ids):
+    """
+    Creates empty stats rows for the products that do not have one yet
+    Args:
+        product_ids(iterable): Value containing primary keys of products
+    Returns:
+        None
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from products.models import ProductStats
+
+    ProductStats.objects.bulk_create(
+        [ProductStats(product_id=product_id) for product_id in product_ids],
+        batch_size=STATS_CHUNK_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def record_sales(items):
+    """
+    Adds the lines of a submitted cart to the stats of their products. Every
+    product gets a single UPDATE of F() expressions, so concurrent checkouts
+    cannot lose each other's increments.
+    Args:
+        items(iterable): Value containing (product_id, quantity, item_total)
+    Returns:
+        None
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from products.models import ProductStats
+
+    items = list(items)
+    with transaction.atomic():
+        ensure_stats(product_id for product_id, _, _ in items)
+        for product_id, quantity, item_total in items:
+            ProductStats.objects.filter(product_id=product_id).update(
+                units_sold=F("units_sold") + quantity,
+                revenue=F("revenue") + (item_total or 0),
+                order_count=F("order_count") + 1,
+            )
+
+
+def rebuild_stats(chunk_size=STATS_CHUNK_SIZE):
+    """
+    Recomputes the stats of every product from the items of submitted carts
+    Args:
+        chunk_size(int): Value containing number of rows written at once
+    Returns:
+        (int): Value containing number of products that have sales
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import, no-member, protected-access
+    from carts.constants import UNFINISHED_STATUSES
+    from carts.models import CartItem
+    from products.models import Product, ProductStats
+
+    sales = (
+        CartItem.objects.exclude(cart__status__in=UNFINISHED_STATUSES)
+        .values("product")
+        .annotate(
+            units_sold=Sum("quantity"),
+            revenue=Sum("item_total"),
+            order_count=Count("cart", distinct=True),
+        )
+        .order_by()
+        .values_list("units_sold", "revenue", "order_count", "product")
+    )
+    meta = ProductStats._meta
+    sql = (
+        f"UPDATE {connection.ops.quote_name(meta.db_table)} "
+        "SET units_sold = %s, revenue = %s, order_count = %s "
+        f"WHERE {connection.ops.quote_name(meta.pk.column)} = %s"
+    )
+    rebuilt = 0
+    with transaction.atomic():
+        ProductStats.objects.update(units_sold=0, revenue=0, order_count=0)
+        product_ids = Product.objects.order_by("id").values_list("id", flat=True)
+        ids = list(product_ids[:chunk_size])
+        while ids:
+            ensure_stats(ids)
+            ids = list(product_ids.filter(id__gt=ids[-1])[:chunk_size])
+        rows = sales.iterator(chunk_size)
+        with connection.cursor() as cursor:
+            chunk = list(islice(rows, chunk_size))
+            while chunk:
+                cursor.executemany(
+                    sql,
+                    [
+                        (
+                            units_sold,
+                            meta.get_field("revenue").get_db_prep_save(
+                                revenue or 0, connection
+                            ),
+                            order_count,
+                            product_id,
+                        )
+                        for units_sold, revenue, order_count, product_id in chunk
+                    ],
+                )
+                rebuilt += len(chunk)
+                chunk = list(islice(rows, chunk_size))
+    return rebuilt
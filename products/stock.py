@@ -0,0 +1,129 @@
+"""
+Stock reservations moved with conditional UPDATEs instead of read-modify-write
+
+Every change is a single UPDATE whose WHERE clause checks the stock, so two
+requests can never both take the last units: the database applies one
+update after the other and the second one matches no row. A reservation that
+would take the stock to exactly zero, or a release that brings it back from
+zero, is told apart by a second conditional UPDATE so the catalog version is
+only bumped when a product runs out or comes back, without reading the row.
+"""
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from products.cache import bump_catalog_version
+
+
+class OutOfStock(Exception):
+    """
+    Raised when a product does not have enough stock for a reservation
+    """
+
+    def __init__(self, product_id, quantity):
+        super().__init__(_("Product cannot be added because it's out of stock"))
+        self.product_id = product_id
+        self.quantity = quantity
+
+
+def _move(product_id, delta, **conditions):
+    """
+    Adds delta to the stock of a product if it matches the conditions
+    Args:
+        product_id(int): Value containing primary key of the product
+        delta(int): Value containing units to add, negative to take
+        conditions(dict): dictionary containing lookups the row must match
+    Returns:
+        (bool): True if the row was updated otherwise False
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from products.models import Product
+
+    return bool(
+        Product.objects.filter(pk=product_id, **conditions).update(
+            stock_quantity=F("stock_quantity") + delta, updated_on=timezone.now()
+        )
+    )
+
+
+def reserve_stock(product_id, quantity):
+    """
+    Takes units of a product out of stock
+    Args:
+        product_id(int): Value containing primary key of the product
+        quantity(int): Value containing units to take
+    Returns:
+        None
+    Raises:
+        OutOfStock: if fewer than quantity units are left
+    """
+    if quantity <= 0:
+        return
+    if _move(product_id, -quantity, stock_quantity__gt=quantity):
+        return
+    if not _move(product_id, -quantity, stock_quantity=quantity):
+        raise OutOfStock(product_id, quantity)
+    transaction.on_commit(bump_catalog_version)
+
+
+def release_stock(product_id, quantity):
+    """
+    Puts units of a product back in stock
+    Args:
+        product_id(int): Value containing primary key of the product
+        quantity(int): Value containing units to put back
+    Returns:
+        None
+    """
+    if quantity <= 0:
+        return
+    if _move(product_id, quantity, stock_quantity__gt=0):
+        return
+    if _move(product_id, quantity, stock_quantity=0):
+        transaction.on_commit(bump_catalog_version)
+
+
+def move_stock(product_id, delta):
+    """
+    Reserves or releases units of a product depending on the sign of delta
+    Args:
+        product_id(int): Value containing primary key of the product
+        delta(int): Value containing units to reserve, negative to release
+    Returns:
+        None
+    Raises:
+        OutOfStock: if fewer than delta units are left
+    """
+    if delta > 0:
+        reserve_stock(product_id, delta)
+    else:
+        release_stock(product_id, -delta)
+
+
+def release_items(items):
+    """
+    Puts the units of many items back in stock with one grouped UPDATE that
+    adds the summed quantity of every product
+    Args:
+        items(QuerySet): Value containing items with product and quantity fields
+    Returns:
+        (int): Value containing number of products updated
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from products.models import Product
+
+    units = (
+        items.filter(product=OuterRef("pk"))
+        .order_by()
+        .values("product")
+        .annotate(units=Sum("quantity"))
+        .values("units")
+    )
+    products = Product.objects.filter(pk__in=items.values("product"))
+    if products.filter(stock_quantity=0).exists():
+        transaction.on_commit(bump_catalog_version)
+    return products.update(
+        stock_quantity=F("stock_quantity") + Subquery(units),
+        updated_on=timezone.now(),
+    )
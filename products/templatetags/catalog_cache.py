@@ -0,0 +1,51 @@
+"""
+Template tags caching catalog markup under the catalog version
+"""
+from django import template
+
+from products.cache import get_versioned
+
+register = template.Library()
+
+
+class CatalogCacheNode(template.Node):
+    """
+    Renders its contents once per catalog version and vary_on values
+    """
+
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return get_versioned(
+            self.fragment_name, vary_on, lambda: self.nodelist.render(context)
+        )
+
+
+@register.tag("catalogcache")
+def do_catalog_cache(parser, token):
+    """
+    Caches a template fragment until the catalog changes
+    Usage:
+        {% catalogcache fragment_name [var1] [var2] ... %}
+        ...
+        {% endcatalogcache %}
+    Args:
+        parser(Parser): Value containing template parser
+        token(Token): Value containing tag contents
+    Returns:
+        (CatalogCacheNode): Value containing node to render
+    """
+    nodelist = parser.parse(("endcatalogcache",))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires at least one argument."
+        )
+    return CatalogCacheNode(
+        nodelist, bits[1], [parser.compile_filter(bit) for bit in bits[2:]]
+    )
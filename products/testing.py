@@ -0,0 +1,18 @@
+"""
+Helpers shared by the test cases of the apps
+"""
+from django.db import connection
+
+
+def query_plan(queryset):
+    """
+    Returns the SQLite query plan of a queryset
+    Args:
+        queryset(QuerySet): Value containing query to explain
+    Returns:
+        (list): Value containing one detail string per plan step
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
@@ -1,3 +1,620 @@
 """
 Contaings test cases for models
 """
+import json
+from io import BytesIO, StringIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from carts.models import Cart, CartItem
+from products.autocomplete import prefix_index
+from products.bulk import import_products
+from products.cache import (
+    bump_catalog_version,
+    get_cache_stats,
+    get_catalog_version,
+    get_versioned,
+)
+from products.constants import IMAGE_VARIANTS_PATH
+from products.images import process_product_image
+from products.models import Product, ProductStats
+from products.recommendations import get_recommendations, update_recommendations
+from products.search import search_products
+from products.testing import query_plan
+from products.utils import (
+    decode_cursor,
+    encode_cursor,
+    filter_products,
+    with_popularity,
+)
+from users.contants import CONTENT_MANAGER
+from users.models import Role, User
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked on SQLite")
+class HotQueryPlanTests(TestCase):
+    """
+    Makes sure the in stock catalog is read through its partial index
+    """
+
+    def test_homepage_page(self):
+        plan = query_plan(
+            Product.objects.filter(stock_quantity__gt=0).order_by("-created_on", "-id")[
+                :21
+            ]
+        )
+        self.assertTrue(
+            all("USING INDEX product_in_stock_created_idx" in step for step in plan),
+            plan,
+        )
+        self.assertFalse(any("TEMP B-TREE" in step for step in plan), plan)
+
+    def test_popular_page(self):
+        plan = query_plan(
+            with_popularity(Product.objects.filter(stock_quantity__gt=0)).order_by(
+                "-units_sold", "-stats__product"
+            )[:21]
+        )
+        self.assertIn("stats_popularity_idx", plan[0])
+        self.assertFalse(any("TEMP B-TREE" in step for step in plan), plan)
+
+    def test_name_prefix(self):
+        plan = query_plan(filter_products(Product.objects.all(), {"name": "Écr"}))
+        self.assertTrue(
+            all("USING INDEX product_name_lower_idx" in step for step in plan), plan
+        )
+
+
+class AutocompleteTests(TestCase):
+    """
+    Makes sure autocomplete is answered from memory once the index is loaded
+    """
+
+    def test_lookup_without_queries(self):
+        Product.objects.create(name="Wireless Mouse", price=10, stock_quantity=1)
+        Product.objects.create(name="Wired Mouse", price=10, stock_quantity=0)
+        prefix_index.version = None
+        prefix_index.lookup("w")
+        with self.assertNumQueries(0):
+            response = self.client.get("/products/api/autocomplete/", {"q": "wi"})
+        self.assertEqual(
+            [product["name"] for product in response.json()["products"]],
+            ["Wireless Mouse"],
+        )
+
+
+class BulkImportTests(TestCase):
+    """
+    Checks products are imported and exported by sku without failing on bad rows
+    """
+
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            "content@example.com",
+            "Str0ngPassw0rd!",
+            name="Content",
+            role=Role.objects.get(code=CONTENT_MANAGER),
+        )
+        token = Token.objects.create(user=self.manager)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Token {token.key}"
+        Product.objects.create(
+            sku="S1", name="Mouse", description="Optical", price=10, stock_quantity=5
+        )
+
+    def upload(self, name, content):
+        """
+        Posts a file to the import endpoint
+        Args:
+            name(str): Value containing file name
+            content(str): Value containing file content
+        Returns:
+            (dict): Value containing import report
+        """
+        file = SimpleUploadedFile(name, content.encode())
+        response = self.client.post("/products/api/import/", {"file": file})
+        return response.json()["report"]
+
+    def test_csv_without_description_keeps_existing_description(self):
+        report = self.upload(
+            "products.csv",
+            "sku,name,price,stock_quantity\nS1,Mouse,12,5\nS2,Pad,3,1\n",
+        )
+        self.assertEqual(report, {"created": 1, "updated": 1, "errors": []})
+        mouse = Product.objects.get(sku="S1")
+        self.assertEqual((mouse.description, mouse.price), ("Optical", 12))
+        self.assertEqual(Product.objects.get(sku="S2").description, "")
+
+    def test_bad_lines_and_duplicate_skus_are_reported(self):
+        report = self.upload(
+            "products.jsonl",
+            "5\n"
+            "{not json\n"
+            '{"sku": "S2", "name": "Pad", "price": "3", "stock_quantity": 1}\n'
+            '{"sku": "S2", "name": "Pad", "price": "4", "stock_quantity": 1}\n'
+            '{"sku": "S3", "price": "4", "stock_quantity": 1}\n',
+        )
+        self.assertEqual((report["created"], report["updated"]), (1, 0))
+        self.assertEqual([error["row"] for error in report["errors"]], [1, 2, 4, 5])
+        self.assertIn("sku", report["errors"][2]["errors"])
+        self.assertIn("name", report["errors"][3]["errors"])
+        self.assertEqual(Product.objects.get(sku="S2").price, 3)
+
+    def test_database_errors_are_reported_per_chunk(self):
+        with mock.patch(
+            "products.bulk.update_rows", side_effect=IntegrityError("refused")
+        ):
+            report = import_products(
+                [
+                    {"sku": "S1", "name": "Mouse", "price": "11", "stock_quantity": 5},
+                    {"sku": "S2", "name": "Pad", "price": "3", "stock_quantity": 1},
+                ]
+            )
+        self.assertEqual((report["created"], report["updated"]), (0, 0))
+        self.assertEqual([error["row"] for error in report["errors"]], [1, 2])
+        self.assertFalse(Product.objects.filter(sku="S2").exists())
+
+    def test_command_imports_and_export_streams_products(self):
+        with NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write("sku,name,price,stock_quantity\nS2,Pad,3,1\n")
+            file.flush()
+            out = StringIO()
+            call_command("import_products", file.name, stdout=out)
+        self.assertIn("Created 1, updated 0, rejected 0 products", out.getvalue())
+        response = self.client.get("/products/api/export/", {"file_format": "jsonl"})
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([row["sku"] for row in rows], ["S1", "S2"])
+        self.assertEqual(rows[0]["description"], "Optical")
+
+
+class HomepagePaginationTests(TestCase):
+    """
+    Checks homepage pages follow each other without gaps or repeats
+    """
+
+    def test_cursor_round_trip(self):
+        product = Product.objects.create(name="Mouse", price=10, stock_quantity=1)
+        self.assertEqual(
+            decode_cursor(encode_cursor(product)), (product.created_on, product.id)
+        )
+        for cursor in ("", "not base64!", encode_cursor(product)[:-4] + "AAAA"):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_pages_cover_in_stock_products_once(self):
+        products = [
+            Product.objects.create(name=f"Cable {index}", price=10, stock_quantity=1)
+            for index in range(5)
+        ]
+        Product.objects.create(name="Sold out", price=10, stock_quantity=0)
+        # equal timestamps are ordered by id
+        Product.objects.filter(pk__in=[product.id for product in products[1:4]]).update(
+            created_on=products[1].created_on
+        )
+        names, cursor = [], None
+        for _ in range(3):
+            with mock.patch("products.utils.HOMEPAGE_PAGE_SIZE", 2):
+                response = self.client.get(
+                    "/products/api/page/", {"cursor": cursor} if cursor else {}
+                ).json()
+            names += [product["name"] for product in response["products"]]
+            cursor = response["next_cursor"]
+        self.assertIsNone(cursor)
+        self.assertEqual(names, [f"Cable {index}" for index in (4, 3, 2, 1, 0)])
+
+    def test_invalid_cursor_is_refused(self):
+        response = self.client.get("/products/api/page/", {"cursor": "broken"})
+        self.assertEqual(response.json()["status_code"], 400)
+
+
+@skipUnless(connection.vendor == "sqlite", "The search index uses SQLite FTS5")
+class SearchTests(TestCase):
+    """
+    Checks search ranks matches and follows product changes
+    """
+
+    def search(self, query):
+        """
+        Returns the names of the products found by the search API
+        Args:
+            query(str): Value containing search text
+        Returns:
+            (list): Value containing names of the results, best match first
+        """
+        response = self.client.get("/products/api/search/", {"q": query})
+        return [product["name"] for product in response.json()["products"]]
+
+    def test_names_rank_above_descriptions(self):
+        Product.objects.create(
+            name="Cable",
+            description="Works with any keyboard",
+            price=5,
+            stock_quantity=1,
+        )
+        Product.objects.create(name="Keyboard", price=50, stock_quantity=1)
+        Product.objects.create(name="Keyboard cover", price=5, stock_quantity=0)
+        self.assertEqual(self.search("keyb"), ["Keyboard", "Cable"])
+        self.assertEqual(search_products("!!!"), [])
+
+    def test_results_link_to_their_product_pages(self):
+        product = Product.objects.create(name="Mouse", price=10, stock_quantity=1)
+        response = self.client.get("/products/search/", {"q": "mouse"})
+        self.assertContains(response, f'href="/products/{product.id}/"')
+
+    def test_index_follows_saves_and_deletes(self):
+        product = Product.objects.create(name="Mouse", price=10, stock_quantity=1)
+        self.assertEqual(self.search("mouse"), ["Mouse"])
+        product.name = "Trackball"
+        product.save()
+        self.assertEqual(self.search("mouse"), [])
+        self.assertEqual(self.search("track"), ["Trackball"])
+        product.delete()
+        self.assertEqual(self.search("track"), [])
+
+
+class CatalogCacheTests(TestCase):
+    """
+    Checks cached catalog markup is replaced when the catalog version moves
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fragments_are_kept_until_the_version_moves(self):
+        render = mock.Mock(side_effect=["first", "second"])
+        self.assertEqual(get_versioned("grid", [1], render), "first")
+        self.assertEqual(get_versioned("grid", [1], render), "first")
+        bump_catalog_version()
+        self.assertEqual(get_versioned("grid", [1], render), "second")
+        self.assertEqual(get_cache_stats()["hits"], 1)
+
+    def test_product_changes_bump_the_version(self):
+        product = Product.objects.create(name="Mouse", price=10, stock_quantity=5)
+        version = get_catalog_version()
+        product.stock_quantity = 4
+        product.save()
+        self.assertEqual(get_catalog_version(), version)
+        product.stock_quantity = 0
+        product.save()
+        self.assertGreater(get_catalog_version(), version)
+        version = get_catalog_version()
+        product.name = "Trackball"
+        product.save()
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_template_tag_caches_its_contents(self):
+        template = Template(
+            "{% load catalog_cache %}{% catalogcache grid page %}{{ name }}"
+            "{% endcatalogcache %}"
+        )
+        self.assertEqual(template.render(Context({"name": "a", "page": 1})), "a")
+        self.assertEqual(template.render(Context({"name": "b", "page": 1})), "a")
+        self.assertEqual(template.render(Context({"name": "b", "page": 2})), "b")
+        bump_catalog_version()
+        self.assertEqual(template.render(Context({"name": "c", "page": 1})), "c")
+
+
+class ImageVariantTests(TestCase):
+    """
+    Checks resized variants are built for uploaded images and cleaned up
+    """
+
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def create_product(self, width):
+        """
+        Creates a product with a stored image of the given width
+        Args:
+            width(int): Value containing width of the image
+        Returns:
+            (Product): Value containing created product
+        """
+        buffer = BytesIO()
+        Image.new("RGB", (width, width // 2), "red").save(buffer, "PNG")
+        return Product.objects.create(
+            name="Mouse",
+            price=10,
+            stock_quantity=1,
+            image=ContentFile(buffer.getvalue(), "mouse.png"),
+        )
+
+    def test_variants_are_built_below_the_original_width(self):
+        product = self.create_product(800)
+        process_product_image(product.id, product.image.name)
+        product.refresh_from_db()
+        self.assertEqual(
+            {
+                extension: [width for width, _ in sources]
+                for extension, sources in product.image_variants.items()
+            },
+            {"webp": [320, 640], "jpeg": [320, 640]},
+        )
+        name = product.image_variants["webp"][0][1]
+        self.assertTrue(default_storage.exists(name))
+        self.assertIn(" 320w, ", product.webp_srcset)
+        with Image.open(default_storage.path(name)) as variant:
+            self.assertEqual(variant.size, (320, 160))
+
+        product.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_variants_of_a_replaced_image_are_dropped(self):
+        product = self.create_product(400)
+        old_name = product.image.name
+        Product.objects.filter(pk=product.pk).update(image="other.png")
+        process_product_image(product.id, old_name)
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, {})
+        self.assertEqual(
+            default_storage.listdir(IMAGE_VARIANTS_PATH.rstrip("/"))[1], []
+        )
+
+
+class DirtyFieldTests(TestCase):
+    """
+    Checks saves only write the fields that changed since the last load
+    """
+
+    def save_and_capture(self, product):
+        """
+        Saves a product and returns the SQL of its UPDATE
+        Args:
+            product(Product): Value containing product to save
+        Returns:
+            (str): Value containing UPDATE statement
+        """
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        return next(
+            query["sql"] for query in queries if query["sql"].startswith("UPDATE")
+        )
+
+    def test_only_changed_fields_are_written(self):
+        Product.objects.create(name="Mouse", price=10, stock_quantity=5)
+        product = Product.objects.get()
+        self.assertEqual(product.get_dirty_fields(), {})
+        product.price = 12
+        self.assertEqual(product.get_dirty_fields(), {"price": 10})
+        sql = self.save_and_capture(product)
+        self.assertIn('"price"', sql)
+        self.assertNotIn('"name"', sql)
+        self.assertNotIn('"stock_quantity"', sql)
+        self.assertEqual(product.get_dirty_fields(), {})
+        self.assertEqual(product.get_old_value("price"), 12)
+
+    def test_mutated_json_fields_are_dirty(self):
+        product = Product.objects.create(name="Mouse", price=10, stock_quantity=5)
+        product.image_variants["webp"] = []
+        self.assertEqual(list(product.get_dirty_fields()), ["image_variants"])
+        self.assertIn('"image_variants"', self.save_and_capture(product))
+        self.assertEqual(Product.objects.get().image_variants, {"webp": []})
+
+    def test_copies_and_deleted_rows_are_written_in_full(self):
+        product = Product.objects.create(name="Mouse", price=10, stock_quantity=5)
+        product.pk = None
+        product.save()
+        self.assertEqual(Product.objects.filter(name="Mouse").count(), 2)
+        self.assertTrue(ProductStats.objects.filter(product=product).exists())
+        self.assertEqual(len(search_products("mouse")), 2)
+        Product.objects.filter(pk=product.pk).delete()
+        product.price = 12
+        product.save()
+        self.assertEqual(
+            Product.objects.values_list("name", "price", "stock_quantity").get(
+                pk=product.pk
+            ),
+            ("Mouse", 12, 5),
+        )
+
+
+class ConditionalGetTests(TestCase):
+    """
+    Checks product reads answer 304 Not Modified until the product changes
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name="Mouse", price=10, stock_quantity=5)
+
+    def assertRevalidates(self, url, change):
+        # pylint: disable=invalid-name
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_product_detail(self):
+        def rename():
+            self.product.name = "Trackball"
+            self.product.save()
+
+        self.assertRevalidates(f"/products/api/{self.product.id}/", rename)
+
+    def test_product_list(self):
+        self.assertRevalidates("/products/api/", self.product.delete)
+
+
+class ProductListTests(TestCase):
+    """
+    Checks the product API filters, orders, facets and pages products
+    """
+
+    def setUp(self):
+        cache.clear()
+        for name, price, stock in (
+            ("Mouse", 400, 5),
+            ("Mouse pad", 100, 0),
+            ("Monitor", 20000, 2),
+            ("Keyboard", 700, 1),
+        ):
+            Product.objects.create(name=name, price=price, stock_quantity=stock)
+
+    def names(self, params):
+        """
+        Returns the names of the listed products
+        Args:
+            params(dict): Value containing query parameters
+        Returns:
+            (list): Value containing names of the products of the page
+        """
+        response = self.client.get("/products/api/", params).json()
+        return [product["name"] for product in response["results"]]
+
+    def test_filters_and_orderings(self):
+        self.assertEqual(
+            self.names({"name": "mo", "ordering": "price"}),
+            ["Mouse pad", "Mouse", "Monitor"],
+        )
+        self.assertEqual(
+            self.names({"in_stock": "true", "max_price": "1000", "ordering": "-price"}),
+            ["Keyboard", "Mouse"],
+        )
+        Product.objects.create(name="Écran", price=300, stock_quantity=1)
+        self.assertEqual(self.names({"name": "ÉCR"}), ["Écran"])
+        response = self.client.get("/products/api/", {"min_price": "cheap"}).json()
+        self.assertEqual(response["status_code"], 400)
+        response = self.client.get("/products/api/", {"ordering": "name"}).json()
+        self.assertEqual(response["status_code"], 400)
+
+    def test_facets_follow_the_filters(self):
+        facets = self.client.get("/products/api/", {"name": "mo"}).json()["facets"]
+        self.assertEqual(facets["stock"], {"in_stock": 2, "out_of_stock": 1})
+        self.assertEqual(facets["price"]["0-500"], 2)
+        self.assertEqual(facets["price"]["10000-50000"], 1)
+
+    def test_cursor_pages(self):
+        names, url = [], "/products/api/?ordering=price&page_size=3"
+        while url:
+            response = self.client.get(url).json()
+            names += [product["name"] for product in response["results"]]
+            url = response["next"]
+        self.assertEqual(names, ["Mouse pad", "Mouse", "Keyboard", "Monitor"])
+
+    def test_cursor_pages_through_ties_without_offsets(self):
+        for index in range(5):
+            Product.objects.create(name=f"Cable {index}", price=100, stock_quantity=1)
+        ProductStats.objects.update(units_sold=3)
+        for ordering in ("price", "-price", "popular"):
+            names, url = [], f"/products/api/?ordering={ordering}&page_size=2"
+            with CaptureQueriesContext(connection) as queries:
+                while url:
+                    response = self.client.get(url).json()
+                    names += [product["name"] for product in response["results"]]
+                    url = response["next"]
+            self.assertEqual(len(names), 9)
+            self.assertEqual(len(set(names)), 9)
+            self.assertFalse(
+                [query for query in queries if "OFFSET" in query["sql"]], ordering
+            )
+            previous = self.client.get(response["previous"]).json()
+            self.assertEqual(
+                [product["name"] for product in previous["results"]], names[-3:-1]
+            )
+
+
+class RecommendationTests(TestCase):
+    """
+    Checks products bought together are counted incrementally from orders
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "customer@example.com", "Str0ngPassw0rd!", name="Customer"
+        )
+        self.mouse, self.pad, self.cable, self.screen = [
+            Product.objects.create(name=name, price=10, stock_quantity=10)
+            for name in ("Mouse", "Pad", "Cable", "Screen")
+        ]
+
+    def order(self, *products, submit=True):
+        """
+        Puts products in a cart of the user and submits it
+        Args:
+            products(list): Value containing products of the cart
+            submit(bool): Value telling to submit the cart
+        Returns:
+            (Cart): Value containing the cart
+        """
+        cart = Cart.objects.create(user=self.user)
+        for product in products:
+            CartItem.objects.create(cart=cart, product=product)
+        if submit:
+            cart.submit()
+        return cart
+
+    def bought_together(self, product):
+        """
+        Returns the ids of the products stored as bought with a product
+        Args:
+            product(Product): Value containing product
+        Returns:
+            (list): Value containing product ids, best first
+        """
+        return ProductStats.objects.get(product=product).bought_together
+
+    def test_pairs_are_counted_incrementally(self):
+        self.order(self.mouse, self.pad)
+        self.order(self.mouse, self.pad, self.cable)
+        open_cart = self.order(self.mouse, self.screen, submit=False)
+        self.assertEqual(update_recommendations(), {"carts": 2, "products": 3})
+        self.assertEqual(self.bought_together(self.mouse), [self.pad.id, self.cable.id])
+        self.assertEqual(self.bought_together(self.screen), [])
+
+        open_cart.submit()
+        self.order(self.mouse, self.screen)
+        self.assertEqual(update_recommendations(), {"carts": 2, "products": 2})
+        self.assertEqual(
+            self.bought_together(self.mouse),
+            [self.pad.id, self.screen.id, self.cable.id],
+        )
+        self.assertEqual(update_recommendations(full=True), {"carts": 4, "products": 4})
+        self.assertEqual(self.bought_together(self.pad), [self.mouse.id, self.cable.id])
+
+    def test_open_carts_do_not_slow_down_later_runs(self):
+        self.order(self.mouse, self.pad)
+        self.order(self.mouse, self.screen, submit=False)
+        update_recommendations()
+        with CaptureQueriesContext(connection) as first:
+            update_recommendations()
+        for index in range(5):
+            user = User.objects.create_user(
+                f"visitor{index}@example.com", "Str0ngPassw0rd!", name="Visitor"
+            )
+            Cart.objects.create(user=user).apply_diff({self.cable.id: 1})
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(update_recommendations(), {"carts": 0, "products": 0})
+        # same statements of the same length, so no growing list of carts
+        self.assertEqual(
+            [len(query["sql"]) for query in second],
+            [len(query["sql"]) for query in first],
+        )
+
+    def test_sold_out_products_are_not_recommended(self):
+        self.order(self.mouse, self.pad, self.cable)
+        update_recommendations()
+        Product.objects.filter(pk=self.pad.pk).update(stock_quantity=0)
+        mouse = Product.objects.select_related("stats").get(pk=self.mouse.pk)
+        self.assertEqual(get_recommendations(mouse), [self.cable])
@@ -12,6 +12,16 @@ router.register(r"", views.ProductViewSet)
 urlpatterns = [
     path("", views.ProductHomePageView.as_view(), name="homepage"),
     path("<int:product_pk>/", views.ProductView.as_view(), name="homepage"),
+    path("search/", views.ProductSearchView.as_view(), name="product_search"),
     path("add/", views.AddProductView.as_view(), name="add_product"),
+    path("api/page/", views.ProductPageAPIView.as_view(), name="product_page_api"),
+    path(
+        "api/search/", views.ProductSearchAPIView.as_view(), name="product_search_api"
+    ),
+    path(
+        "api/autocomplete/",
+        views.ProductAutocompleteAPIView.as_view(),
+        name="product_autocomplete_api",
+    ),
     path("api/", include(router.urls), name="product_api"),
 ]
@@ -1,7 +1,27 @@
 """
 Contains function that do specific tasks and can be reused
 """
-from products.constants import IMAGES_PATH
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, F, Max, Q, Value
+from django.db.models.functions import Concat, Lower
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition
+
+from products.cache import get_catalog_version
+from products.constants import (
+    CURSOR_SEPARATOR,
+    DEFAULT_PRODUCT_ORDERING,
+    HOMEPAGE_ORDERINGS,
+    HOMEPAGE_PAGE_SIZE,
+    IMAGES_PATH,
+    POPULAR_ORDERING,
+    PRICE_FACET_BUCKETS,
+    RECOMMENDATIONS_VERSION_KEY,
+    SALES_VERSION_KEY,
+)
 
 
 def image_path(instance, filename):
@@ -14,3 +34,263 @@ def image_path(instance, filename):
         (str): Value containing location to store file
     """
     return f"{IMAGES_PATH}{instance.name}_{filename}"
+
+
+def with_popularity(queryset):
+    """
+    Annotates products with their units sold. The inner join on the stats
+    table lets popularity orderings read stats_popularity_idx in order.
+    Args:
+        queryset(QuerySet): Value containing products
+    Returns:
+        (QuerySet): Value containing products annotated with units_sold
+    """
+    return queryset.filter(stats__isnull=False).annotate(
+        units_sold=F("stats__units_sold")
+    )
+
+
+def encode_cursor(product, field="created_on"):
+    """
+    Builds an opaque cursor pointing at a row's position in a listing
+    Args:
+        product(Model): Value containing the last product or cart of a page
+        field(str): Value containing field the page is ordered by
+    Returns:
+        (str): Value containing url safe cursor
+    """
+    position = getattr(product, field)
+    if hasattr(position, "isoformat"):
+        position = position.isoformat()
+    value = f"{position}{CURSOR_SEPARATOR}{product.id}"
+    return urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor, field="created_on"):
+    """
+    Reads the position stored in a cursor
+    Args:
+        cursor(str): Value containing a cursor built by encode_cursor
+        field(str): Value containing field the page is ordered by
+    Returns:
+        (tuple): Value containing value of the field and id of the row
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    try:
+        position, product_id = (
+            urlsafe_b64decode(cursor.encode()).decode().split(CURSOR_SEPARATOR)
+        )
+        position = CURSOR_PARSERS[field](position)
+        product_id = int(product_id)
+    except (DecodeError, UnicodeDecodeError, TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if position is None:
+        raise ValueError("Invalid cursor")
+    return position, product_id
+
+
+def paginate_products(
+    queryset, cursor=None, page_size=None, ordering=DEFAULT_PRODUCT_ORDERING
+):
+    """
+    Returns one page of products, newest or best selling first, using keyset
+    pagination on (field, id) so the cost of a page does not grow with the
+    catalog
+    Args:
+        queryset(QuerySet): Value containing products to paginate
+        cursor(str): Value containing cursor of the previous page, if any
+        page_size(int): Value containing number of products per page
+        ordering(str): Value containing key of HOMEPAGE_ORDERINGS
+    Returns:
+        (tuple): Value containing list of products and cursor of next page
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    page_size = page_size or HOMEPAGE_PAGE_SIZE
+    field, tiebreaker = HOMEPAGE_ORDERINGS[ordering]
+    if ordering == POPULAR_ORDERING:
+        queryset = with_popularity(queryset)
+    queryset = queryset.order_by(f"-{field}", f"-{tiebreaker}")
+    if cursor:
+        position, product_id = decode_cursor(cursor, field)
+        queryset = queryset.filter(
+            Q(**{f"{field}__lt": position})
+            | Q(**{field: position, f"{tiebreaker}__lt": product_id})
+        )
+    products = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(products) > page_size:
+        products = products[:page_size]
+        next_cursor = encode_cursor(products[-1], field)
+    return products, next_cursor
+
+
+def conditional_on(state_func):
+    """
+    Builds a view decorator answering conditional GET requests with 304 Not
+    Modified. state_func is evaluated once per request, so a single small
+    query produces both the ETag and the Last-Modified validators.
+    Args:
+        state_func(callable): Value containing function taking the view
+            arguments and returning (etag, last_modified) or (None, None)
+    Returns:
+        (callable): Value containing view decorator
+    """
+
+    def get_state(request, *args, **kwargs):
+        # pylint: disable=protected-access
+        if not hasattr(request, "_conditional_state"):
+            request._conditional_state = state_func(request, *args, **kwargs)
+        return request._conditional_state
+
+    return condition(
+        etag_func=lambda *args, **kwargs: get_state(*args, **kwargs)[0],
+        last_modified_func=lambda *args, **kwargs: get_state(*args, **kwargs)[1],
+    )
+
+
+def aggregate_state(queryset, *parts, fields=("updated_on",)):
+    """
+    Returns validators describing a whole queryset by its latest modification
+    time. A lone MAX over an indexed column is answered from the index, so the
+    cost does not grow with the number of rows.
+    Args:
+        queryset(QuerySet): Value containing rows the response is built from
+        parts(list): Value containing extra values the response depends on,
+            for example a version that moves when rows are deleted
+        fields(tuple): Value containing modification times the response
+            depends on, including those of related rows it nests
+    Returns:
+        (tuple): Value containing etag and last modified datetime
+    """
+    times = queryset.aggregate(*(Max(field) for field in fields)).values()
+    last_modified = max((value for value in times if value), default=None)
+    timestamp = last_modified.timestamp() if last_modified else 0
+    etag = "-".join(str(part) for part in (timestamp, *parts))
+    return etag, last_modified
+
+
+def product_state(request, *args, **kwargs):
+    """
+    Returns validators of the product catalog or of a single product
+    Args:
+        request(HttpRequest): Value containing request data
+        args(list): list containing view arguments
+        kwargs(dict): dictionary containing view key value arguments
+    Returns:
+        (tuple): Value containing etag and last modified datetime
+    """
+    # pylint: disable=import-outside-toplevel, cyclic-import
+    from products.models import Product
+
+    product_pk = kwargs.get("pk") or kwargs.get("product_pk")
+    if product_pk is None:
+        # deleting a product bumps the catalog version and submitting a cart
+        # bumps the sales version
+        return aggregate_state(
+            Product.objects.all(),
+            get_catalog_version(),
+            get_catalog_version(SALES_VERSION_KEY),
+        )
+    last_modified = (
+        Product.objects.filter(pk=product_pk)
+        .values_list("updated_on", flat=True)
+        .first()
+    )
+    if last_modified is None:
+        return None, None
+    # rendered pages also depend on who is looking at them and on the
+    # frequently bought together recommendations
+    user_id = request.user.id if request.user.is_authenticated else 0
+    recommendations = get_catalog_version(RECOMMENDATIONS_VERSION_KEY)
+    return (
+        f"{product_pk}-{last_modified.timestamp()}-{user_id}-{recommendations}",
+        last_modified,
+    )
+
+
+def parse_price(value):
+    """
+    Converts a price query parameter to a Decimal
+    Args:
+        value(str): Value containing price typed by the client
+    Returns:
+        (Decimal): Value containing parsed price
+    Raises:
+        ValueError: if the value is not a finite number
+    """
+    try:
+        price = Decimal(value)
+    except InvalidOperation as error:
+        raise ValueError("Price must be a number") from error
+    if not price.is_finite():
+        raise ValueError("Price must be a number")
+    return price
+
+
+# Converts the position stored in a cursor back to the type of its field
+CURSOR_PARSERS = {
+    "created_on": parse_datetime,
+    "units_sold": int,
+    "price": parse_price,
+}
+
+
+def filter_products(queryset, params):
+    """
+    Applies the product API filters found in the query parameters
+    Args:
+        queryset(QuerySet): Value containing products to filter
+        params(QueryDict): Value containing query parameters
+    Returns:
+        (QuerySet): Value containing filtered products
+    Raises:
+        ValueError: if a filter value is malformed
+    """
+    if params.get("min_price"):
+        queryset = queryset.filter(price__gte=parse_price(params["min_price"]))
+    if params.get("max_price"):
+        queryset = queryset.filter(price__lte=parse_price(params["max_price"]))
+    if params.get("in_stock", "").lower() in ("1", "true"):
+        queryset = queryset.filter(stock_quantity__gt=0)
+    prefix = params.get("name", "").strip()
+    if prefix:
+        # a range over the lowered name uses the index, a LIKE would not. The
+        # prefix is lowered by the database too, as LOWER folds only ASCII
+        # letters on SQLite while str.lower folds every letter.
+        prefix = Lower(Value(prefix))
+        queryset = queryset.annotate(name_lower=Lower("name")).filter(
+            name_lower__gte=prefix,
+            name_lower__lt=Concat(prefix, Value(chr(0x10FFFF))),
+        )
+    return queryset
+
+
+def product_facets(queryset):
+    """
+    Counts products per price bucket and per stock status in one query
+    Args:
+        queryset(QuerySet): Value containing filtered products
+    Returns:
+        (dict): Value containing price bucket and stock status counts
+    """
+    bounds = list(PRICE_FACET_BUCKETS) + [None]
+    buckets = {}
+    for lower, upper in zip(bounds, bounds[1:]):
+        price_range = Q(price__gte=lower)
+        if upper is not None:
+            price_range &= Q(price__lt=upper)
+        buckets[f"{lower}-{upper or ''}"] = Count("id", filter=price_range)
+    counts = queryset.order_by().aggregate(
+        in_stock=Count("id", filter=Q(stock_quantity__gt=0)),
+        out_of_stock=Count("id", filter=Q(stock_quantity=0)),
+        **buckets,
+    )
+    return {
+        "price": {bucket: counts[bucket] for bucket in buckets},
+        "stock": {
+            "in_stock": counts["in_stock"],
+            "out_of_stock": counts["out_of_stock"],
+        },
+    }
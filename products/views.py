@@ -2,19 +2,49 @@
 Contains Views for products app
 """
 # pylint: disable=no-self-use, no-member
-from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.utils.decorators import method_decorator
 from rest_framework import status, viewsets
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from carts.session import add_to_session_cart
 from carts.views import CartsAPIView
 
+from .autocomplete import prefix_index
+from .bulk import export_products, import_products, read_rows
+from .cache import get_catalog_version, get_versioned
+from .constants import (
+    AUTOCOMPLETE_LIMIT,
+    AUTOCOMPLETE_MAX_LIMIT,
+    BULK_FORMATS,
+    CSV_FORMAT,
+    DEFAULT_PRODUCT_ORDERING,
+    FACET_PARAMETERS,
+    HOMEPAGE_ORDERINGS,
+    POPULAR_ORDERING,
+    PRODUCT_ORDERINGS,
+    SALES_VERSION_KEY,
+)
 from .models import Product
+from .pagination import ProductCursorPagination
 from .permissions import IsContentManager
-from .serializers import ProductSerializer
+from .recommendations import get_recommendations
+from .search import search_products
+from .serializers import ProductCardSerializer, ProductSerializer
+from .stock import OutOfStock
+from .utils import (
+    conditional_on,
+    filter_products,
+    paginate_products,
+    product_facets,
+    product_state,
+    with_popularity,
+)
 
 
 class ProductHomePageView(APIView):
@@ -35,13 +65,163 @@ class ProductHomePageView(APIView):
         is_content_manager = False
         if IsContentManager().has_permission(request, None):
             is_content_manager = True
+        ordering = request.query_params.get("ordering")
+        if ordering not in HOMEPAGE_ORDERINGS:
+            ordering = DEFAULT_PRODUCT_ORDERING
+        products, next_cursor = paginate_products(
+            Product.objects.filter(stock_quantity__gt=0), ordering=ordering
+        )
         context = {
-            "products": Product.objects.filter(~Q(stock_quantity=0)).all(),
+            "products": products,
+            "next_cursor": next_cursor,
+            "ordering": ordering,
+            "sales_version": get_catalog_version(SALES_VERSION_KEY)
+            if ordering == POPULAR_ORDERING
+            else None,
             "can_manage_content": is_content_manager,
         }
         return render(request, "homepage.html", context)
 
 
+class ProductPageAPIView(APIView):
+    """
+    Returns the next page of homepage products for infinite scrolling
+    """
+
+    authentication_classes = [SessionAuthentication]
+
+    def get(self, request):
+        """
+        Returns a page of in stock products after the given cursor
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (Response): Value containing products and cursor of next page
+        """
+        ordering = request.query_params.get("ordering", DEFAULT_PRODUCT_ORDERING)
+        if ordering not in HOMEPAGE_ORDERINGS:
+            return Response(
+                {
+                    "message": f"Ordering must be one of {', '.join(HOMEPAGE_ORDERINGS)}",
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        try:
+            products, next_cursor = paginate_products(
+                Product.objects.filter(stock_quantity__gt=0),
+                request.query_params.get("cursor"),
+                ordering=ordering,
+            )
+        except ValueError:
+            return Response(
+                {
+                    "message": "Invalid cursor",
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        return Response(
+            {
+                "message": "Products retrieved successfully.",
+                "products": ProductCardSerializer(products, many=True).data,
+                "next_cursor": next_cursor,
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+
+class ProductSearchView(APIView):
+    """
+    Renders products matching the search box query
+    """
+
+    authentication_classes = [SessionAuthentication]
+
+    def get(self, request):
+        """
+        Renders the homepage template with search results
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (render): Value containing template data to display
+        """
+        query = request.query_params.get("q", "")
+        context = {
+            "products": search_products(query),
+            "query": query,
+            "can_manage_content": IsContentManager().has_permission(request, None),
+        }
+        return render(request, "homepage.html", context)
+
+
+class ProductSearchAPIView(APIView):
+    """
+    Returns products matching a full text query
+    """
+
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+
+    def get(self, request):
+        """
+        Searches product names and descriptions, best match first
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (Response): Value containing matching products
+        """
+        query = request.query_params.get("q", "")
+        return Response(
+            {
+                "message": "Products retrieved successfully.",
+                "products": ProductCardSerializer(
+                    search_products(query), many=True
+                ).data,
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+
+class ProductAutocompleteAPIView(APIView):
+    """
+    Suggests in stock product names starting with the typed text
+    """
+
+    # suggestions are public, skipping authentication keeps the request
+    # away from the session and token tables
+    authentication_classes = []
+
+    def get(self, request):
+        """
+        Returns products whose name starts with the q parameter, answered
+        from the in memory prefix index
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (Response): Value containing suggested product ids and names
+        """
+        try:
+            limit = min(
+                int(request.query_params.get("limit", AUTOCOMPLETE_LIMIT)),
+                AUTOCOMPLETE_MAX_LIMIT,
+            )
+        except ValueError:
+            return Response(
+                {
+                    "message": "Limit must be a number",
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        suggestions = prefix_index.lookup(request.query_params.get("q", ""), limit)
+        return Response(
+            {
+                "message": "Suggestions retrieved successfully.",
+                "products": [
+                    {"id": product_id, "name": name} for product_id, name in suggestions
+                ],
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+
 class ProductView(APIView):
     """
     Render details of a product
@@ -49,6 +229,7 @@ class ProductView(APIView):
 
     authentication_classes = [SessionAuthentication]
 
+    @method_decorator(conditional_on(product_state))
     def get(self, request, product_pk):
         """
         Displays a product
@@ -58,19 +239,40 @@ class ProductView(APIView):
         Returns:
             (render):
         """
-        context = {"product": get_object_or_404(Product, pk=product_pk)}
+        product = get_object_or_404(
+            Product.objects.select_related("stats"), pk=product_pk
+        )
+        context = {
+            "product": product,
+            "bought_together": get_recommendations(product),
+        }
         return render(request, "product_page.html", context)
 
     def post(self, request, product_pk):
         """
-        Adds a product to cart
-        request(HttpRequest): Value containing request data
+        Adds a product to the cart of the user, or to the session cart of a
+        visitor who is not logged in
+        Args:
+            request(HttpRequest): Value containing request data
             product_pk(int): Value containing primary key of product to view
         Returns:
             (render): Value containing template data to display
         """
-        response = CartsAPIView().post(request)
-        if response.status_code == status.HTTP_200_OK:
+        if request.user.is_authenticated:
+            added = CartsAPIView().post(request).data["status_code"] == (
+                status.HTTP_200_OK
+            )
+        else:
+            try:
+                add_to_session_cart(
+                    request.session,
+                    product_pk,
+                    int(request.data.get("quantity", 1)),
+                )
+                added = True
+            except (ValueError, OutOfStock):
+                added = False
+        if added:
             context = {
                 "product": get_object_or_404(Product, pk=product_pk),
                 "added_to_cart": "Product added to cart.",
@@ -137,13 +339,78 @@ class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     queryset = Product.objects.all()
     authentication_classes = [TokenAuthentication]
+    pagination_class = ProductCursorPagination
+
+    def get_queryset(self):
+        """
+        Returns the products to list, annotated with their units sold when
+        ordered by popularity
+        Returns:
+            (QuerySet): Value containing products
+        """
+        queryset = super().get_queryset()
+        if self.request.query_params.get("ordering") == POPULAR_ORDERING:
+            queryset = with_popularity(queryset)
+        return queryset
+
+    def get_ordering(self):
+        """
+        Returns the fields to order products by, from the ordering parameter
+        Returns:
+            (tuple): Value containing fields to order by
+        """
+        ordering = self.request.query_params.get("ordering", DEFAULT_PRODUCT_ORDERING)
+        return PRODUCT_ORDERINGS[ordering]
+
+    @method_decorator(conditional_on(product_state))
+    def list(self, request, *args, **kwargs):
+        """
+        Returns a page of products filtered, ordered and faceted by the
+        min_price, max_price, in_stock, name and ordering parameters
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (Response): Value containing products, cursors and facets
+        """
+        if request.query_params.get("ordering", DEFAULT_PRODUCT_ORDERING) not in (
+            PRODUCT_ORDERINGS
+        ):
+            return Response(
+                {
+                    "message": f"Ordering must be one of {', '.join(PRODUCT_ORDERINGS)}",
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        try:
+            queryset = filter_products(self.get_queryset(), request.query_params)
+        except ValueError as error:
+            return Response(
+                {"message": str(error), "status_code": status.HTTP_400_BAD_REQUEST}
+            )
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+        filters = sorted(
+            (key, value)
+            for key, value in request.query_params.items()
+            if key in FACET_PARAMETERS
+        )
+        response.data["facets"] = get_versioned(
+            "product_facets", filters, lambda: product_facets(queryset)
+        )
+        return response
+
+    @method_decorator(conditional_on(product_state))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
         """
         permission_classes = []
-        actions = ["create", "update", "destroy"]
+        actions = ["create", "update", "destroy", "bulk_import", "export"]
         if self.action in actions:
             permission_classes = [IsAuthenticated, IsContentManager]
 
@@ -171,3 +438,60 @@ class ProductViewSet(viewsets.ModelViewSet):
                 "status_code": status.HTTP_400_BAD_REQUEST,
             }
         )
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def bulk_import(self, request):
+        """
+        Creates or updates products from an uploaded csv or jsonl file
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (Response): Value containing import report
+        """
+        file = request.FILES.get("file")
+        file_format = request.data.get("file_format") or (
+            file.name.rsplit(".", 1)[-1].lower() if file else None
+        )
+        if file is None or file_format not in BULK_FORMATS:
+            return Response(
+                {
+                    "message": "Please upload a csv or jsonl file",
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        report = import_products(read_rows(file, file_format), request.user)
+        return Response(
+            {
+                "message": "Products imported",
+                "report": report,
+                "status_code": status.HTTP_200_OK,
+            }
+        )
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Streams every product as csv or jsonl
+        Args:
+            request(HttpRequest): Value containing request data
+        Returns:
+            (StreamingHttpResponse): Value containing streamed products
+        """
+        file_format = request.query_params.get("file_format", CSV_FORMAT)
+        if file_format not in BULK_FORMATS:
+            return Response(
+                {
+                    "message": "Format must be csv or jsonl",
+                    "status_code": status.HTTP_400_BAD_REQUEST,
+                }
+            )
+        response = StreamingHttpResponse(
+            export_products(file_format),
+            content_type="text/csv"
+            if file_format == CSV_FORMAT
+            else "application/x-ndjson",
+        )
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="products.{file_format}"'
+        return response
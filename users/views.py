@@ -1,6 +1,7 @@
 """
 This module contains
 """
+from django.contrib import messages
 from django.contrib.auth import authenticate, get_user_model, login, logout
 
 # pylint: disable= no-self-use, no-member
@@ -14,6 +15,8 @@ from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from carts.session import merge_session_cart
+
 from .contants import HOME_PAGE_URL
 from .permissions import IsAdmin
 from .serializers import UserSerializer
@@ -112,6 +115,12 @@ class TemplateUserLogin(APIView):
             )
             if user:
                 login(request, user)
+                if merge_session_cart(request, user):
+                    messages.warning(
+                        request,
+                        "Some products of your cart are no longer available "
+                        "and were removed.",
+                    )
                 return redirect(HOME_PAGE_URL)
             context["error_message"] = "Invalid Credentials"
             return render(request, "login_register.html", context)
@@ -182,6 +191,7 @@ class UserAuthenticationAPIView(APIView):
             password = request.POST["password"]
             user = get_object_or_404(User, email=email)
             if check_password(password, user.password):
+                dropped = merge_session_cart(request, user)
                 token = Token.objects.get_or_create(user=user)
                 response = {
                     "message": "Logged in successfully.",
@@ -190,6 +200,11 @@ class UserAuthenticationAPIView(APIView):
                     "email": user.email,
                     "name": user.name,
                 }
+                if dropped:
+                    response["dropped_cart_items"] = [
+                        {"product": product_id, "quantity": quantity}
+                        for product_id, quantity in dropped.items()
+                    ]
             else:
                 response = {
                     "message": "Wrong email or password.",